@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Any, Optional
+
+from event_broker import EventBroker, event_broker, format_sse
+from realtime_analytics import RealTimeAnalytics, realtime_analytics
+
+logger = logging.getLogger(__name__)
+
+
+class AdminFeed:
+    """Live admin dashboard feed: fraud verdicts and stock alerts as they happen, plus summary deltas.
+
+    Every admin connection subscribes to the same topic, so each event is
+    serialized once however many dashboards are open. Summary counters are
+    not recomputed per event: events only mark them dirty, and one ticker
+    per worker recomputes them at most once per interval and publishes just
+    the fields that changed.
+    """
+
+    TOPIC = 'admin'
+
+    def __init__(self, broker: EventBroker, analytics: RealTimeAnalytics, interval: Optional[float] = None):
+        self.broker = broker
+        self.analytics = analytics
+        self.interval = interval or float(os.getenv('ADMIN_STREAM_SUMMARY_SECONDS', '1'))
+        self._dirty = True
+        self._pending = 0
+        self._last_summary: Dict[str, Any] = {}
+        self._task = None
+        self.stats = {'events': 0, 'deltas': 0, 'coalesced': 0}
+        analytics.add_listener(self.on_analytics_event)
+
+    def on_analytics_event(self, event_type: str, data: Dict[str, Any]):
+        """Analytics listener: forward the event and mark the summary stale"""
+        self._dirty = True
+        self._pending += 1
+        if self.broker.has_subscribers(self.TOPIC):
+            self.broker.publish(self.TOPIC, event_type, data)
+            self.stats['events'] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Flat dashboard counters from the in-memory analytics"""
+        fraud = self.analytics.get_fraud_summary()
+        stock = self.analytics.get_stock_alerts_summary(limit=0)
+        return {
+            'total_suspicious_transactions': fraud['total_suspicious_transactions'],
+            'recent_suspicious_transactions': fraud['recent_suspicious_transactions'],
+            'blocked_last_hour': fraud['verdicts_last_hour']['BLOCK'],
+            'review_last_hour': fraud['verdicts_last_hour']['REVIEW'],
+            'active_customers_monitored': fraud['active_customers_monitored'],
+            'active_ips_monitored': fraud['active_ips_monitored'],
+            'critical_alerts': stock['critical_alerts'],
+            'warning_alerts': stock['warning_alerts'],
+            'products_monitored': stock['products_monitored'],
+        }
+
+    def publish_delta(self):
+        """Recompute the summary once and publish the fields that changed since the last one"""
+        summary = self.summary()
+        changed = {key: value for key, value in summary.items() if self._last_summary.get(key) != value}
+        self._last_summary = summary
+        self._dirty = False
+        if self._pending > 1:
+            self.stats['coalesced'] += self._pending - 1
+        self._pending = 0
+        if changed:
+            self.broker.publish(self.TOPIC, 'summary_delta', changed)
+            self.stats['deltas'] += 1
+
+    def snapshot(self) -> str:
+        """Full summary for a newly connected admin; deltas that follow apply on top of it"""
+        if self._dirty:
+            self.publish_delta()
+        return format_sse('summary', self._last_summary)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._dirty and self.broker.has_subscribers(self.TOPIC):
+                try:
+                    self.publish_delta()
+                except Exception as e:
+                    logger.warning("⚠️ Admin feed summary failed: %s", e)
+
+    def start(self):
+        """Start the summary ticker (call from the app startup event)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'interval_seconds': self.interval}
+
+
+# Global admin feed instance
+admin_feed = AdminFeed(event_broker, realtime_analytics)
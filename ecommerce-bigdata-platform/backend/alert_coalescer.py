@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+SEND = 'send'
+DIGESTED = 'digested'
+SUPPRESSED = 'suppressed'
+
+logger = logging.getLogger(__name__)
+
+
+class AlertCoalescer:
+    """Dedupes repeated alerts and rolls bursts of distinct alerts into periodic digests.
+
+    Per alert kind (stock, fraud): the first alert after a quiet period is
+    sent immediately and opens a window; further alerts inside the window
+    are held and delivered as one digest when it closes, and the window
+    stays open while the burst continues. An alert whose key (product and
+    severity, or transaction) already fired within the window is dropped as
+    a duplicate. Remembered keys and held alerts are both capped, so memory
+    stays bounded however large the burst.
+    """
+
+    def __init__(self, send_digest: Callable[[str, List[Dict[str, Any]], int], None],
+                 window: Optional[float] = None, max_keys: Optional[int] = None,
+                 max_digest_items: Optional[int] = None):
+        self.send_digest = send_digest
+        self.window = window if window is not None else float(os.getenv('ALERT_COALESCE_WINDOW_SECONDS', '60'))
+        self.max_keys = max_keys or int(os.getenv('ALERT_COALESCE_MAX_KEYS', '10000'))
+        self.max_digest_items = max_digest_items or int(os.getenv('ALERT_DIGEST_MAX_ITEMS', '100'))
+        self._seen: 'OrderedDict[Hashable, float]' = OrderedDict()  # (kind, key) -> time it last fired
+        self._open_until: Dict[str, float] = {}
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._overflow: Dict[str, int] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self.stats = {'sent': 0, 'suppressed': 0, 'digested': 0, 'digests_sent': 0, 'digest_overflow': 0}
+
+    def offer(self, kind: str, key: Hashable, alert: Dict[str, Any]) -> str:
+        """Decide what to do with an alert: SEND it now, or it was DIGESTED or SUPPRESSED"""
+        if self.window <= 0:
+            self.stats['sent'] += 1
+            return SEND
+        now = time.monotonic()
+        self._expire(now)
+
+        seen_key = (kind, key)
+        if seen_key in self._seen:
+            self.stats['suppressed'] += 1
+            return SUPPRESSED
+        self._seen[seen_key] = now
+        while len(self._seen) > self.max_keys:
+            self._seen.popitem(last=False)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None  # No loop to flush digests from (scripts); only dedupe
+        if loop is None or now >= self._open_until.get(kind, 0):
+            self._open_until[kind] = now + self.window
+            self.stats['sent'] += 1
+            return SEND
+
+        pending = self._pending.setdefault(kind, [])
+        if len(pending) < self.max_digest_items:
+            pending.append(alert)
+        else:
+            self._overflow[kind] = self._overflow.get(kind, 0) + 1
+            self.stats['digest_overflow'] += 1
+        self.stats['digested'] += 1
+        if kind not in self._timers:
+            self._timers[kind] = loop.call_later(self._open_until[kind] - now, self.flush, kind)
+        return DIGESTED
+
+    def _expire(self, now: float):
+        # Keys are kept in first-alert order, so expired ones are at the front
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.window:
+                break
+            self._seen.popitem(last=False)
+
+    def flush(self, kind: str):
+        """Send the digest held for `kind`, if any"""
+        timer = self._timers.pop(kind, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(kind, None)
+        overflow = self._overflow.pop(kind, 0)
+        if not items:
+            return
+        # The burst is still going: keep collecting into the next digest
+        self._open_until[kind] = time.monotonic() + self.window
+        self.stats['digests_sent'] += 1
+        try:
+            self.send_digest(kind, items, overflow)
+        except Exception as e:
+            logger.error("❌ Failed to send %s alert digest: %s", kind, e)
+
+    def flush_all(self):
+        for kind in list(self._pending):
+            self.flush(kind)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'tracked_keys': len(self._seen),
+            'held': sum(len(items) for items in self._pending.values()),
+            'window_seconds': self.window,
+        }
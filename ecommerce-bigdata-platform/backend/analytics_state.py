@@ -0,0 +1,149 @@
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from bisect import insort
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple
+
+# Transaction windows kept for fraud detection
+WINDOW_KINDS = ('customer', 'ip', 'device')
+
+
+class InMemoryStateBackend:
+    """Per-process transaction windows (only correct with a single worker)"""
+
+    # Calls never wait on I/O, so they can run on the event loop
+    blocking = False
+
+    def __init__(self):
+        # Each key's records are kept sorted by timestamp
+        self._windows = {kind: defaultdict(list) for kind in WINDOW_KINDS}
+        # (timestamp, kind, key) per record, oldest first, so prune only visits expired records
+        self._expiry: List[Tuple[float, str, str]] = []
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def transaction(self):
+        """Make a fetch/append sequence atomic"""
+        with self._lock:
+            yield
+
+    def fetch(self, kind: str, key: str, since: float) -> List[Tuple[float, Dict[str, Any]]]:
+        """Get (timestamp, record) pairs for a key newer than `since`"""
+        return [entry for entry in self._windows[kind].get(key, ()) if entry[0] > since]
+
+    def append(self, kind: str, key: str, ts: float, record: Dict[str, Any]):
+        """Add a transaction record to a key's window"""
+        window = self._windows[kind][key]
+        if window and ts < window[-1][0]:
+            # Out-of-order timestamp (e.g. a replayed or delayed event)
+            insort(window, (ts, record), key=lambda entry: entry[0])
+        else:
+            window.append((ts, record))
+        heapq.heappush(self._expiry, (ts, kind, key))
+
+    def prune(self, cutoff: float):
+        """Drop records older than `cutoff`"""
+        with self._lock:
+            expired = set()
+            while self._expiry and self._expiry[0][0] <= cutoff:
+                _, kind, key = heapq.heappop(self._expiry)
+                expired.add((kind, key))
+            for kind, key in expired:
+                window = self._windows[kind].get(key)
+                if not window:
+                    continue
+                drop = 0
+                while drop < len(window) and window[drop][0] <= cutoff:
+                    drop += 1
+                if drop == len(window):
+                    del self._windows[kind][key]
+                else:
+                    del window[:drop]
+
+    def count_keys(self, kind: str) -> int:
+        """Number of distinct keys currently tracked"""
+        return len(self._windows[kind])
+
+
+class SQLiteStateBackend:
+    """Transaction windows in a local SQLite file shared by all workers on the host"""
+
+    # Calls can wait up to busy_timeout on other workers' locks: keep them off the event loop
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        # isolation_level=None lets us issue BEGIN IMMEDIATE ourselves
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS transactions ('
+            ' kind TEXT NOT NULL, key TEXT NOT NULL, ts REAL NOT NULL, record TEXT NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_key ON transactions (kind, key, ts)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_ts ON transactions (ts)')
+        # Distinct keys per kind, recounted on each prune rather than on every read
+        self._key_counts: Dict[str, int] = {}
+        self._refresh_key_counts()
+
+    @contextmanager
+    def transaction(self):
+        """Take the database write lock so read-then-append is atomic across workers"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            else:
+                self._conn.execute('COMMIT')
+
+    def fetch(self, kind: str, key: str, since: float) -> List[Tuple[float, Dict[str, Any]]]:
+        """Get (timestamp, record) pairs for a key newer than `since`"""
+        rows = self._conn.execute(
+            'SELECT ts, record FROM transactions WHERE kind = ? AND key = ? AND ts > ? ORDER BY ts',
+            (kind, key, since)
+        ).fetchall()
+        return [(ts, json.loads(record)) for ts, record in rows]
+
+    def append(self, kind: str, key: str, ts: float, record: Dict[str, Any]):
+        """Add a transaction record to a key's window"""
+        self._conn.execute(
+            'INSERT INTO transactions (kind, key, ts, record) VALUES (?, ?, ?, ?)',
+            (kind, key, ts, json.dumps(record, default=str))
+        )
+
+    def prune(self, cutoff: float):
+        """Drop records older than `cutoff` and recount the tracked keys"""
+        with self._lock:
+            self._conn.execute('DELETE FROM transactions WHERE ts <= ?', (cutoff,))
+            self._refresh_key_counts()
+
+    def _refresh_key_counts(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT kind, COUNT(DISTINCT key) FROM transactions GROUP BY kind'
+            ).fetchall()
+        self._key_counts = dict(rows)
+
+    def count_keys(self, kind: str) -> int:
+        """Number of distinct keys tracked as of the last prune"""
+        return self._key_counts.get(kind, 0)
+
+
+def get_state_backend():
+    """Build the state backend selected by ANALYTICS_STATE_BACKEND"""
+    backend = os.getenv('ANALYTICS_STATE_BACKEND', 'memory').lower()
+    if backend == 'sqlite':
+        return SQLiteStateBackend(os.getenv('ANALYTICS_STATE_PATH', '/tmp/ecommerce-analytics-state.db'))
+    if backend != 'memory':
+        raise ValueError(f"Unknown ANALYTICS_STATE_BACKEND: {backend}")
+    return InMemoryStateBackend()
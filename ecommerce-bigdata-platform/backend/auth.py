@@ -1,27 +1,40 @@
 from datetime import datetime, timedelta
 from typing import Optional, Union
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 import os
-from dotenv import load_dotenv, find_dotenv
+import logging
 
-dotenv_path = find_dotenv()
-print('dotenv_path', dotenv_path)
-load_dotenv()
+from settings import load_env
+
+logger = logging.getLogger(__name__)
+
+load_env()
 
 # Security configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Stream tokens travel in the URL (EventSource cannot send headers) and so end
+# up in access and proxy logs; they only open streams and expire quickly
+STREAM_TOKEN_SCOPE = "stream"
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.getenv("STREAM_TOKEN_EXPIRE_SECONDS", "60"))
+
+# Password hashing; passlib and python-jose are imported on first use so that
+# importing this module (models, scripts, tests) stays cheap
+_pwd_context = None
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 # Security scheme
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Pydantic models
 class Token(BaseModel):
@@ -34,6 +47,11 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     email: Optional[str] = None
     role: Optional[str] = None
+    scope: Optional[str] = None
+
+class StreamToken(BaseModel):
+    stream_token: str
+    expires_in: int
 
 class UserCreate(BaseModel):
     email: str
@@ -56,13 +74,14 @@ class User(BaseModel):
 
 # Password utilities
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 # JWT utilities
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -73,17 +92,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str) -> TokenData:
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         role: str = payload.get("role")
+        scope: Optional[str] = payload.get("scope")
         if email is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        token_data = TokenData(email=email, role=role)
+        token_data = TokenData(email=email, role=role, scope=scope)
         return token_data
     except JWTError:
         raise HTTPException(
@@ -94,8 +115,25 @@ def verify_token(token: str) -> TokenData:
 
 # Dependency to get current user
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
+    return await get_user_for_token(credentials.credentials)
+
+def create_stream_token(user: User) -> StreamToken:
+    """Short-lived token for ?token= on streaming endpoints; not accepted anywhere else"""
+    token = create_access_token(
+        {"sub": user.email, "role": user.role, "scope": STREAM_TOKEN_SCOPE},
+        expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    )
+    return StreamToken(stream_token=token, expires_in=STREAM_TOKEN_EXPIRE_SECONDS)
+
+async def get_user_for_token(token: str, scope: Optional[str] = None) -> User:
     token_data = verify_token(token)
+    if token_data.scope != scope:
+        # Access tokens can't be used in URLs, and stream tokens only open streams
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
     # Get user from database
     from database import users_collection
@@ -116,6 +154,26 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+# Dependency for streaming endpoints: EventSource cannot send headers, so ?token= is
+# accepted too, but only with a stream token from POST /auth/stream-token
+async def get_current_stream_user(
+    token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    if credentials is not None:
+        user = await get_user_for_token(credentials.credentials)
+    elif token:
+        user = await get_user_for_token(token, scope=STREAM_TOKEN_SCOPE)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return user
+
 # Dependency to check admin role
 async def get_current_admin_user(current_user: User = Depends(get_current_active_user)):
     if current_user.role not in ["admin", "super_admin"]:
@@ -125,6 +183,15 @@ async def get_current_admin_user(current_user: User = Depends(get_current_active
         )
     return current_user
 
+# Dependency to check admin role on streaming endpoints
+async def get_current_admin_stream_user(current_user: User = Depends(get_current_stream_user)):
+    if current_user.role not in ["admin", "super_admin"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    return current_user
+
 # Dependency to check super admin role
 async def get_current_super_admin_user(current_user: User = Depends(get_current_active_user)):
     if current_user.role != "super_admin":
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from database import orders_collection
+
+logger = logging.getLogger(__name__)
+
+
+class CustomerProfileCache:
+    """Lifetime order history per customer, aggregated from orders and kept in a TTL cache"""
+
+    def __init__(self, collection, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else \
+            float(os.getenv('CUSTOMER_PROFILE_TTL_SECONDS', '300'))
+        self.max_entries = max_entries or int(os.getenv('CUSTOMER_PROFILE_CACHE_SIZE', '50000'))
+        self._cache: 'OrderedDict[str, tuple]' = OrderedDict()  # customer_id -> (expires_at, profile)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'loads': 0, 'coalesced': 0, 'errors': 0}
+
+    async def get(self, customer_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Get a customer's profile, loading it at most once per TTL however many callers ask"""
+        if not customer_id:
+            return None
+
+        entry = self._cache.get(customer_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._cache.move_to_end(customer_id)
+            self.stats['hits'] += 1
+            return entry[1]
+        self.stats['misses'] += 1
+
+        # Single flight: concurrent misses for the same customer share one query
+        future = self._inflight.get(customer_id)
+        if future is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[customer_id] = future
+        try:
+            profile = await self._load(customer_id)
+            if profile is not None:
+                self._store(customer_id, profile)
+            future.set_result(profile)
+            return profile
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[customer_id]
+
+    async def _load(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        self.stats['loads'] += 1
+        pipeline = [
+            {"$match": {"customer_id": customer_id}},
+            {"$group": {
+                "_id": "$customer_id",
+                "order_count": {"$sum": 1},
+                "total_spend": {"$sum": {"$ifNull": ["$total_amount", 0]}},
+                "first_seen": {"$min": "$created_at"},
+                "last_seen": {"$max": "$created_at"},
+            }},
+        ]
+        try:
+            results = await self.collection.aggregate(pipeline).to_list(length=1)
+        except Exception as e:
+            # Fraud checks keep working on in-memory history if Mongo is unavailable
+            self.stats['errors'] += 1
+            logger.warning("⚠️ Failed to load customer profile for %s: %s", customer_id, e)
+            return None
+
+        if not results:
+            return {'customer_id': customer_id, 'order_count': 0, 'total_spend': 0.0,
+                    'first_seen': None, 'last_seen': None}
+        result = results[0]
+        return {
+            'customer_id': customer_id,
+            'order_count': result['order_count'],
+            'total_spend': float(result['total_spend']),
+            'first_seen': result['first_seen'].isoformat() if result.get('first_seen') else None,
+            'last_seen': result['last_seen'].isoformat() if result.get('last_seen') else None,
+        }
+
+    def _store(self, customer_id: str, profile: Dict[str, Any]):
+        self._cache[customer_id] = (time.monotonic() + self.ttl_seconds, profile)
+        self._cache.move_to_end(customer_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, customer_id: Optional[str]):
+        """Drop a cached profile, e.g. after the customer places an order"""
+        if customer_id:
+            self._cache.pop(customer_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'cached_profiles': len(self._cache), 'inflight': len(self._inflight)}
+
+
+# Global customer profile cache
+customer_profiles = CustomerProfileCache(orders_collection)
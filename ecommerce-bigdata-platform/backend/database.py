@@ -1,160 +1,321 @@
-import motor.motor_asyncio
-from pymongo import MongoClient
 import os
-from dotenv import load_dotenv
+import asyncio
+import hashlib
+import json
+import time
 import logging
 from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict
+from pymongo import IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-load_dotenv()
+from mongo_monitoring import CommandMetrics, PoolMetrics, RouteDBMetrics
+from settings import load_env
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+load_env()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "ecommerce_bigdata")
 
-# Create async client
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URL)
-db = client[DATABASE_NAME]
+DEFAULT_LOW_STOCK_THRESHOLD = 10
 
-# Collections
-users_collection = db.users
-products_collection = db.products
-orders_collection = db.orders
-events_collection = db.events
-carts_collection = db.carts
-categories_collection = db.categories
-reviews_collection = db.reviews
-wishlist_collection = db.wishlist
-feedback_collection = db.feedback
-
-async def create_indexes():
-    """Create database indexes for optimal performance"""
-    
-    # Users collection indexes
-    await users_collection.create_index("email", unique=True)
-    await users_collection.create_index("role")
-    await users_collection.create_index("is_active")
-    
-    # Products collection indexes
-    await products_collection.create_index("category")
-    await products_collection.create_index("brand")
-    await products_collection.create_index("is_active")
-    await products_collection.create_index("sku", unique=True, sparse=True)
-    await products_collection.create_index("tags")
-    await products_collection.create_index([("name", "text"), ("description", "text")])
-    
-    # Orders collection indexes
-    await orders_collection.create_index("customer_id")
-    await orders_collection.create_index("status")
-    await orders_collection.create_index("payment_status")
-    await orders_collection.create_index("created_at")
-    await orders_collection.create_index("channel")
-    
-    # Events collection indexes
-    await events_collection.create_index("customer_id")
-    await events_collection.create_index("event_type")
-    await events_collection.create_index("timestamp")
-    await events_collection.create_index("session_id")
-    
-    # Carts collection indexes
-    await carts_collection.create_index("customer_id", unique=True)
-    await carts_collection.create_index("updated_at")
-    
-    # Categories collection indexes
-    await categories_collection.create_index("parent_id")
-    await categories_collection.create_index("is_active")
-    await categories_collection.create_index("name")
-    
-    # Reviews collection indexes
-    await reviews_collection.create_index("product_id")
-    await reviews_collection.create_index("customer_id")
-    await reviews_collection.create_index("rating")
-    await reviews_collection.create_index("created_at")
-    
-    # Wishlist collection indexes
-    await wishlist_collection.create_index([("customer_id", 1), ("product_id", 1)], unique=True)
-    await wishlist_collection.create_index("customer_id")
-    
-    # Feedback collection indexes
-    await feedback_collection.create_index("user_id")
-    await feedback_collection.create_index("product_id")
-    await feedback_collection.create_index("feedback_type")
-    await feedback_collection.create_index("created_at")
-    await feedback_collection.create_index("processed")
-    await feedback_collection.create_index([("text", "text")])  # Text search index
-
-async def init_database():
-    """Initialize database with default data"""
-    
-    # Create indexes
-    await create_indexes()
-    
-    # Create default super admin if not exists
-    from auth import get_password_hash
+# stock_margin = stock_quantity - low_stock_threshold is stored on each product so
+# "at or below threshold" is an indexed range query (stock_margin <= 0). Applied as
+# an update pipeline after stock or threshold changes; also clears the alert claim
+# once a product is back above its threshold.
+STOCK_MARGIN_PIPELINE = [
+    {"$set": {
+        "stock_margin": {"$subtract": [
+            {"$ifNull": ["$stock_quantity", 0]},
+            {"$ifNull": ["$low_stock_threshold", DEFAULT_LOW_STOCK_THRESHOLD]}
+        ]}
+    }},
+    {"$set": {
+        "low_stock_alerted_severity": {"$cond": [
+            {"$gt": ["$stock_margin", 0]}, None, "$low_stock_alerted_severity"
+        ]}
+    }}
+]
+
+# Single MongoDB client for the process, tuned from the environment
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+pool_metrics = PoolMetrics(MONGODB_MAX_POOL_SIZE)
+command_metrics = CommandMetrics()
+route_db_metrics = RouteDBMetrics()
+_client = None
+
+def create_mongo_client(url: str = MONGODB_URL, **overrides) -> 'AsyncIOMotorClient':
+    """Build a Motor client with explicit pool, compression and read preference settings"""
+    options = {
+        "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+        "maxIdleTimeMS": int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000")),
+        "readPreference": os.getenv("MONGODB_READ_PREFERENCE", "primary"),
+        "appname": os.getenv("MONGODB_APP_NAME", "ecommerce-backend"),
+        "event_listeners": [pool_metrics, command_metrics],
+    }
+    compressors = os.getenv("MONGODB_COMPRESSORS", "")
+    if compressors:
+        options["compressors"] = compressors
+    options.update(overrides)
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(url, **options)
+
+def get_client() -> 'AsyncIOMotorClient':
+    """The process-wide client; created on first use if connect_database() was not called"""
+    global _client
+    if _client is None:
+        _client = create_mongo_client()
+    return _client
+
+def get_database():
+    return get_client()[DATABASE_NAME]
+
+def connect_database():
+    """Create the client (call from the app startup event, before the first request)"""
+    client = get_client()
+    logger.info("✅ MongoDB client ready (db=%s, maxPoolSize=%d)", DATABASE_NAME, MONGODB_MAX_POOL_SIZE)
+    return client
+
+def close_database():
+    """Close the client and its pool (call from the app shutdown event)"""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+class CollectionProxy:
+    """Module-level handle to a collection that resolves through the current client.
+
+    Lets other modules keep `from database import orders_collection` while the
+    client itself is created (and can be recreated) at app startup.
+    """
     
-    super_admin = await users_collection.find_one({"email": "admin@ecommerce.com"})
-    if not super_admin:
-        admin_data = {
-            "email": "admin@ecommerce.com",
-            "name": "Super Admin",
-            "password_hash": get_password_hash("admin123"),
-            "role": "super_admin",
-            "is_active": True,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-        await users_collection.insert_one(admin_data)
-        print("✅ Super admin created: admin@ecommerce.com / admin123")
+    __slots__ = ("name", "_client", "_collection")
     
-    # Create default categories
-    default_categories = [
-        {"name": "Electronics", "description": "Electronic devices and gadgets"},
-        {"name": "Clothing", "description": "Fashion and apparel"},
-        {"name": "Books", "description": "Books and publications"},
-        {"name": "Home & Garden", "description": "Home improvement and garden supplies"},
-        {"name": "Sports", "description": "Sports equipment and accessories"}
-    ]
+    def __init__(self, name: str):
+        self.name = name
+        self._client = None
+        self._collection = None
     
-    for category in default_categories:
-        existing = await categories_collection.find_one({"name": category["name"]})
-        if not existing:
-            category["is_active"] = True
-            category["created_at"] = datetime.utcnow()
-            await categories_collection.insert_one(category)
+    def __getattr__(self, attr):
+        # Reuse the Motor collection until the client is replaced (close/reconnect)
+        client = get_client()
+        if client is not self._client:
+            self._collection = client[DATABASE_NAME][self.name]
+            self._client = client
+        return getattr(self._collection, attr)
     
-    print("✅ Database initialized successfully")
+    def __repr__(self):
+        return f"CollectionProxy({DATABASE_NAME}.{self.name})"
 
-# Initialize MongoDB connection with error handling
-try:
-    client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URL)
-    database = client.ecommerce_db
-    
-    # Collections
-    products_collection = database.get_collection("products")
-    customers_collection = database.get_collection("customers") 
-    orders_collection = database.get_collection("orders")
-    events_collection = database.get_collection("events")
-    
-    logger.info("✅ MongoDB connected successfully")
+# Collections
+users_collection = CollectionProxy("users")
+products_collection = CollectionProxy("products")
+orders_collection = CollectionProxy("orders")
+events_collection = CollectionProxy("events")
+carts_collection = CollectionProxy("carts")
+categories_collection = CollectionProxy("categories")
+reviews_collection = CollectionProxy("reviews")
+wishlist_collection = CollectionProxy("wishlist")
+feedback_collection = CollectionProxy("feedback")
+order_status_history_collection = CollectionProxy("order_status_history")
+
+# Index specs per collection: (keys, options). Names follow PyMongo's default
+# "<field>_<direction>" scheme so they can be matched against list_indexes.
+INDEX_SPECS = {
+    "users": [
+        ([("email", 1)], {"unique": True}),
+        ([("role", 1)], {}),
+        ([("is_active", 1)], {}),
+    ],
+    "products": [
+        ([("category", 1)], {}),
+        ([("brand", 1)], {}),
+        ([("is_active", 1)], {}),
+        ([("sku", 1)], {"unique": True, "sparse": True}),
+        ([("tags", 1)], {}),
+        ([("name", "text"), ("description", "text")], {}),
+        ([("is_active", 1), ("stock_margin", 1)], {}),  # Low-stock scan
+    ],
+    "orders": [
+        ([("customer_id", 1), ("created_at", -1)], {}),  # A customer's orders, newest first
+        ([("status", 1)], {}),
+        ([("payment_status", 1)], {}),
+        ([("created_at", 1)], {}),
+        ([("channel", 1)], {}),
+    ],
+    "events": [
+        ([("customer_id", 1)], {}),
+        ([("event_type", 1)], {}),
+        ([("timestamp", 1)], {}),
+        ([("session_id", 1)], {}),
+    ],
+    "carts": [
+        ([("customer_id", 1)], {"unique": True}),
+        ([("updated_at", 1)], {}),
+    ],
+    "categories": [
+        ([("parent_id", 1)], {}),
+        ([("is_active", 1)], {}),
+        ([("name", 1)], {"unique": True}),  # Makes the default-category upsert idempotent
+    ],
+    "reviews": [
+        ([("product_id", 1)], {}),
+        ([("customer_id", 1)], {}),
+        ([("rating", 1)], {}),
+        ([("created_at", 1)], {}),
+    ],
+    "wishlist": [
+        ([("customer_id", 1), ("product_id", 1)], {"unique": True}),
+        ([("customer_id", 1)], {}),
+    ],
+    "feedback": [
+        ([("user_id", 1)], {}),
+        ([("product_id", 1), ("created_at", -1)], {}),  # A product's feedback, newest first
+        ([("feedback_type", 1)], {}),
+        ([("created_at", 1)], {}),
+        ([("processed", 1)], {}),
+        ([("text", "text")], {}),  # Text search index
+    ],
+    # Append-only status history
+    "order_status_history": [
+        ([("order_id", 1), ("timestamp", 1)], {}),
+    ],
+}
+
+# Recorded in schema_meta after a successful setup; workers that find a
+# matching hash skip index checks entirely
+INDEX_SPECS_HASH = hashlib.sha1(json.dumps(INDEX_SPECS, sort_keys=True).encode()).hexdigest()
+
+DEFAULT_CATEGORIES = [
+    {"name": "Electronics", "description": "Electronic devices and gadgets"},
+    {"name": "Clothing", "description": "Fashion and apparel"},
+    {"name": "Books", "description": "Books and publications"},
+    {"name": "Home & Garden", "description": "Home improvement and garden supplies"},
+    {"name": "Sports", "description": "Sports equipment and accessories"}
+]
+
+SUPER_ADMIN_EMAIL = "admin@ecommerce.com"
+
+def index_name(keys) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+async def _ensure_collection_indexes(name: str, specs) -> int:
+    collection = get_database()[name]
+    existing = {}
+    async for index in collection.list_indexes():
+        existing[index["name"]] = index
+        existing[tuple(index["key"].items())] = index  # Same keys under a custom name
+    missing = []
+    for keys, options in specs:
+        index = existing.get(index_name(keys)) or existing.get(tuple(keys))
+        if index is not None and bool(index.get("unique")) != bool(options.get("unique")):
+            # An index whose uniqueness changed has to be rebuilt
+            await collection.drop_index(index["name"])
+            index = None
+        if index is None:
+            missing.append(IndexModel(keys, name=index_name(keys), **options))
+    if missing:
+        # One createIndexes command per collection
+        await collection.create_indexes(missing)
+    return len(missing)
+
+async def create_indexes() -> int:
+    """Create any missing indexes, all collections concurrently; returns how many were built"""
+    created = await asyncio.gather(*(
+        _ensure_collection_indexes(name, specs) for name, specs in INDEX_SPECS.items()
+    ))
+    return sum(created)
+
+async def _dedupe_categories():
+    # Concurrent first boots before categories.name was unique could seed a
+    # default category twice; keep the oldest so the unique index can build
+    duplicates = categories_collection.aggregate([
+        {"$group": {"_id": "$name", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    async for group in duplicates:
+        extra = sorted(group["ids"])[1:]
+        await categories_collection.delete_many({"_id": {"$in": extra}})
+        logger.warning("⚠️ Removed %d duplicate '%s' categories", len(extra), group["_id"])
+
+async def setup_schema(force: bool = False) -> Dict[str, Any]:
+    """Indexes and data migrations; skipped when this spec version is already recorded"""
+    meta = get_database()["schema_meta"]
+    if not force:
+        recorded = await meta.find_one({"_id": "indexes"}, {"spec_hash": 1})
+        if recorded and recorded.get("spec_hash") == INDEX_SPECS_HASH:
+            return {"skipped": True, "indexes_created": 0}
     
-except Exception as e:
-    logger.warning(f"⚠️ MongoDB connection failed: {e}")
-    logger.info("📝 Running in demo mode without MongoDB persistence")
+    await _dedupe_categories()
+    created = await create_indexes()
+    # Backfill stock_margin on products created before it existed
+    await products_collection.update_many({"stock_margin": {"$exists": False}}, STOCK_MARGIN_PIPELINE)
+    await meta.update_one(
+        {"_id": "indexes"},
+        {"$set": {"spec_hash": INDEX_SPECS_HASH, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return {"skipped": False, "indexes_created": created}
+
+async def seed_defaults():
+    """Default categories in one bulk upsert, and the super admin if missing"""
+    now = datetime.utcnow()
+    try:
+        await categories_collection.bulk_write([
+            UpdateOne(
+                {"name": category["name"]},
+                {"$setOnInsert": {**category, "is_active": True, "created_at": now}},
+                upsert=True
+            )
+            for category in DEFAULT_CATEGORIES
+        ], ordered=False)
+    except BulkWriteError as e:
+        # Another worker upserted the same categories first (unique categories.name)
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
     
-    # Create mock collections for demo mode
-    class MockCollection:
-        async def insert_one(self, data):
-            logger.info(f"📝 Mock insert: {data}")
-            return type('MockResult', (), {'inserted_id': 'mock_id'})()
-        
-        async def find(self):
-            # Return empty list for demo
-            return []
+    # Only pay for the bcrypt hash when the admin is actually missing
+    if await users_collection.find_one({"email": SUPER_ADMIN_EMAIL}, {"_id": 1}):
+        return
+    from auth import get_password_hash
     
-    products_collection = MockCollection()
-    customers_collection = MockCollection()
-    orders_collection = MockCollection()
-    events_collection = MockCollection()
+    try:
+        result = await users_collection.update_one(
+            {"email": SUPER_ADMIN_EMAIL},
+            {"$setOnInsert": {
+                "email": SUPER_ADMIN_EMAIL,
+                "name": "Super Admin",
+                "password_hash": get_password_hash("admin123"),
+                "role": "super_admin",
+                "is_active": True,
+                "created_at": now,
+                "updated_at": now
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return  # Another worker created it first
+    if result.upserted_id:
+        logger.info("✅ Super admin created: %s / admin123", SUPER_ADMIN_EMAIL)
 
+async def init_database(force: bool = False):
+    """Initialize database schema and default data"""
+    started = time.perf_counter()
+    # Seed only once the unique indexes exist: concurrent first boots then
+    # collide on users.email instead of inserting duplicate admins
+    schema = await setup_schema(force)
+    await seed_defaults()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if schema["skipped"]:
+        logger.info("✅ Database ready in %.0fms (schema up to date)", elapsed_ms)
+    else:
+        logger.info("✅ Database initialized in %.0fms (%d indexes created)", elapsed_ms, schema["indexes_created"])
+    return {**schema, "elapsed_ms": round(elapsed_ms, 1)}
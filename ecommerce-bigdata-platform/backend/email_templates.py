@@ -0,0 +1,347 @@
+import base64
+import html
+import secrets
+import textwrap
+from email.header import Header
+from email.utils import formatdate, make_msgid, parseaddr
+from string import Formatter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+
+class RenderedEmail(NamedTuple):
+    subject: str
+    text: str
+    html: str
+
+
+class RawEmail(NamedTuple):
+    """A fully serialized message, ready for SMTP sendmail"""
+    from_addr: str
+    to_addrs: Sequence[str]
+    data: bytes
+    subject: str
+
+
+# multipart/alternative layout, compiled once; parts are filled per message
+MIME_LAYOUT = (
+    'Content-Type: multipart/alternative; boundary="{boundary}"\r\n'
+    'MIME-Version: 1.0\r\n'
+    'Subject: {subject}\r\n'
+    'From: {from_addr}\r\n'
+    'To: {to_addr}\r\n'
+    'Date: {date}\r\n'
+    'Message-ID: {message_id}\r\n'
+    '\r\n'
+    '{parts}'
+    '--{boundary}--\r\n'
+)
+MIME_PART = (
+    '--{boundary}\r\n'
+    'Content-Type: text/{subtype}; charset="{charset}"\r\n'
+    'MIME-Version: 1.0\r\n'
+    'Content-Transfer-Encoding: {encoding}\r\n'
+    '\r\n'
+    '{payload}\r\n'
+)
+_BOUNDARY = '=' * 15 + secrets.token_hex(16) + '=='
+
+
+def _encode_header(value: str) -> str:
+    # Never let a value start a new header line
+    value = value.replace('\r', ' ').replace('\n', ' ')
+    if value.isascii():
+        return value
+    # Fold with CRLF like every other line: smtplib sends bytes as-is
+    return Header(value, 'utf-8').encode(linesep='\r\n')
+
+
+def _mime_part(subtype: str, text: str, boundary: str) -> str:
+    lines = text.splitlines()
+    if text.isascii() and all(len(line) <= 998 for line in lines):
+        return MIME_PART.format(boundary=boundary, subtype=subtype, charset='us-ascii',
+                                encoding='7bit', payload='\r\n'.join(lines))
+    payload = base64.encodebytes(text.encode('utf-8')).decode('ascii').replace('\n', '\r\n').rstrip()
+    return MIME_PART.format(boundary=boundary, subtype=subtype, charset='utf-8',
+                            encoding='base64', payload=payload)
+
+
+def build_mime(from_addr: str, to_addr: str, subject: str, text: str,
+               html_body: Optional[str] = None) -> RawEmail:
+    """Serialize a text (+ HTML) email directly to wire format, without building a Message tree"""
+    boundary = _BOUNDARY
+    while boundary in text or (html_body and boundary in html_body):
+        boundary = '=' * 15 + secrets.token_hex(16) + '=='
+    parts = _mime_part('plain', text, boundary)
+    if html_body:
+        parts += _mime_part('html', html_body, boundary)
+    # Domain from the sender, so make_msgid doesn't resolve the host's FQDN per message
+    domain = parseaddr(from_addr)[1].rpartition('@')[2] or 'localhost'
+    data = MIME_LAYOUT.format(boundary=boundary, subject=_encode_header(subject),
+                              from_addr=_encode_header(from_addr), to_addr=_encode_header(to_addr),
+                              date=formatdate(localtime=True), message_id=make_msgid(domain=domain),
+                              parts=parts)
+    return RawEmail(from_addr, [to_addr], data.encode('ascii'), subject)
+
+
+def _escape_fields(context: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    escaped = {}
+    for field in fields:
+        value = context[field]
+        escaped[field] = html.escape(value) if isinstance(value, str) else value
+    return escaped
+
+
+class EmailTemplate:
+    """Subject, plain-text and HTML bodies compiled once and rendered with str.format_map.
+
+    Compiling dedents the sources, checks the placeholders and binds the
+    format_map methods, so a render is three C-level formats plus HTML
+    escaping of just the string fields the HTML body uses.
+    """
+
+    __slots__ = ('name', 'fields', '_html_fields', '_subject', '_text', '_html')
+
+    def __init__(self, name: str, subject: str, text: str, html_body: str):
+        self.name = name
+        text = textwrap.dedent(text).strip() + "\n"
+        html_body = textwrap.dedent(html_body).strip() + "\n"
+        self._html_fields = self._parse_fields(html_body)
+        self.fields = self._parse_fields(subject) | self._parse_fields(text) | self._html_fields
+        self._subject = subject.format_map
+        self._text = text.format_map
+        self._html = html_body.format_map
+
+    @staticmethod
+    def _parse_fields(source: str) -> frozenset:
+        # Raises ValueError at startup on a malformed template
+        return frozenset(field for _, field, _, _ in Formatter().parse(source) if field)
+
+    def render(self, context: Dict[str, Any]) -> RenderedEmail:
+        escaped = _escape_fields(context, self._html_fields)
+        return RenderedEmail(self._subject(context), self._text(context), self._html(escaped))
+
+    def render_many(self, contexts: Iterable[Dict[str, Any]]) -> List[RenderedEmail]:
+        """Render one email per context (e.g. per recipient)"""
+        render = self.render
+        return [render(context) for context in contexts]
+
+
+DIGEST_HTML = """\
+<html>
+<body>
+    <h2 style="color: red;">{subject}</h2>
+    <table>
+        {header}
+        {rows}
+    </table>
+</body>
+</html>
+"""
+
+
+class DigestTemplate:
+    """One email summarizing many alerts: a plain-text line and an HTML table row per alert.
+
+    Line and row templates are compiled like EmailTemplate's, and each
+    alert's string fields are HTML-escaped before they go into its row.
+    """
+
+    __slots__ = ('name', 'columns', '_html_fields', '_subject', '_line', '_header', '_row')
+
+    def __init__(self, name: str, subject: str, line: str, columns: Sequence[str], row: str):
+        self.name = name
+        self.columns = len(columns)
+        self._html_fields = EmailTemplate._parse_fields(row)
+        EmailTemplate._parse_fields(subject)  # Validated at startup like the row
+        EmailTemplate._parse_fields(line)
+        self._subject = subject.format_map
+        self._line = line.format_map
+        self._header = '<tr>' + ''.join(f'<th>{html.escape(column)}</th>' for column in columns) + '</tr>'
+        self._row = row.format_map
+
+    def render(self, alerts: Sequence[Dict[str, Any]], overflow: int = 0) -> RenderedEmail:
+        subject = self._subject({'total': len(alerts) + overflow})
+        lines = [self._line(alert) for alert in alerts]
+        rows = [self._row(_escape_fields(alert, self._html_fields)) for alert in alerts]
+        if overflow:
+            lines.append(f"...and {overflow} more")
+            rows.append(f'<tr><td colspan="{self.columns}">...and {overflow} more</td></tr>')
+        text = "\n".join([subject, ""] + lines) + "\n"
+        html_body = DIGEST_HTML.format(subject=html.escape(subject), header=self._header, rows="".join(rows))
+        return RenderedEmail(subject, text, html_body)
+
+
+DIGEST_SOURCES = {
+    'stock_alert_digest': (
+        "🚨 Low Stock Digest: {total} products below threshold",
+        "{product_name} ({product_id}): {current_stock} left, threshold {threshold}",
+        ("Product", "Product ID", "Current Stock", "Threshold"),
+        "<tr><td>{product_name}</td><td>{product_id}</td><td>{current_stock}</td><td>{threshold}</td></tr>",
+    ),
+    'fraud_alert_digest': (
+        "🚨 Fraud Digest: {total} flagged transactions",
+        "#{transaction_id} customer {customer_id}: ${amount:.2f}, risk {risk_score:.2f} ({reason})",
+        ("Transaction ID", "Customer ID", "Amount", "Risk Score", "Reason"),
+        "<tr><td>{transaction_id}</td><td>{customer_id}</td><td>${amount:.2f}</td>"
+        "<td>{risk_score:.2f}</td><td>{reason}</td></tr>",
+    ),
+}
+
+TEMPLATE_SOURCES = {
+    'order_status_change': (
+        "Order #{order_id} Status Update: {new_status_title}",
+        """
+        Your order status has been updated!
+
+        Order ID: {order_id}
+        Previous Status: {old_status_title}
+        New Status: {new_status_title}
+        Total Amount: ${total_amount:.2f}
+
+        Track your order at: http://localhost:3000/orders/{order_id}
+
+        Thank you for shopping with us!
+        """,
+        """
+        <html>
+        <body>
+            <h2>Order Status Update</h2>
+            <p>Your order status has been updated!</p>
+            <table>
+                <tr><td><strong>Order ID:</strong></td><td>{order_id}</td></tr>
+                <tr><td><strong>Previous Status:</strong></td><td>{old_status_title}</td></tr>
+                <tr><td><strong>New Status:</strong></td><td>{new_status_title}</td></tr>
+                <tr><td><strong>Total Amount:</strong></td><td>${total_amount:.2f}</td></tr>
+            </table>
+            <p><a href="http://localhost:3000/orders/{order_id}">Track your order</a></p>
+            <p>Thank you for shopping with us!</p>
+        </body>
+        </html>
+        """,
+    ),
+    'stock_alert': (
+        "🚨 Low Stock Alert: {product_name}",
+        """
+        LOW STOCK ALERT!
+
+        Product: {product_name}
+        Product ID: {product_id}
+        Current Stock: {current_stock}
+        Threshold: {threshold}
+
+        Please restock this item immediately!
+        """,
+        """
+        <html>
+        <body>
+            <h2 style="color: red;">🚨 Low Stock Alert</h2>
+            <table>
+                <tr><td><strong>Product:</strong></td><td>{product_name}</td></tr>
+                <tr><td><strong>Product ID:</strong></td><td>{product_id}</td></tr>
+                <tr><td><strong>Current Stock:</strong></td><td style="color: red;">{current_stock}</td></tr>
+                <tr><td><strong>Threshold:</strong></td><td>{threshold}</td></tr>
+            </table>
+            <p><strong>Please restock this item immediately!</strong></p>
+        </body>
+        </html>
+        """,
+    ),
+    'fraud_alert': (
+        "🚨 Fraud Alert: Transaction #{transaction_id}",
+        """
+        FRAUD ALERT!
+
+        Transaction ID: {transaction_id}
+        Customer ID: {customer_id}
+        Amount: ${amount:.2f}
+        Risk Score: {risk_score:.2f}
+        Reason: {reason}
+
+        Please review this transaction immediately!
+        """,
+        """
+        <html>
+        <body>
+            <h2 style="color: red;">🚨 Fraud Alert</h2>
+            <table>
+                <tr><td><strong>Transaction ID:</strong></td><td>{transaction_id}</td></tr>
+                <tr><td><strong>Customer ID:</strong></td><td>{customer_id}</td></tr>
+                <tr><td><strong>Amount:</strong></td><td>${amount:.2f}</td></tr>
+                <tr><td><strong>Risk Score:</strong></td><td style="color: red;">{risk_score:.2f}</td></tr>
+                <tr><td><strong>Reason:</strong></td><td>{reason}</td></tr>
+            </table>
+            <p><strong>Please review this transaction immediately!</strong></p>
+        </body>
+        </html>
+        """,
+    ),
+    'payment_success': (
+        "✅ Payment Confirmed - Order #{order_id}",
+        """
+        Payment Confirmed!
+
+        Order ID: {order_id}
+        Amount: ${amount:.2f}
+
+        Your order is being processed. You'll receive updates as your order progresses.
+
+        Thank you for your purchase!
+        """,
+        """
+        <html>
+        <body>
+            <h2 style="color: green;">✅ Payment Confirmed</h2>
+            <table>
+                <tr><td><strong>Order ID:</strong></td><td>{order_id}</td></tr>
+                <tr><td><strong>Amount:</strong></td><td>${amount:.2f}</td></tr>
+            </table>
+            <p>Your order is being processed. You'll receive updates as your order progresses.</p>
+            <p>Thank you for your purchase!</p>
+        </body>
+        </html>
+        """,
+    ),
+    'payment_failure': (
+        "❌ Payment Failed - Order #{order_id}",
+        """
+        Payment Failed
+
+        Order ID: {order_id}
+        Amount: ${amount:.2f}
+        Reason: {reason}
+
+        Please try again or contact support if the problem persists.
+        """,
+        """
+        <html>
+        <body>
+            <h2 style="color: red;">❌ Payment Failed</h2>
+            <table>
+                <tr><td><strong>Order ID:</strong></td><td>{order_id}</td></tr>
+                <tr><td><strong>Amount:</strong></td><td>${amount:.2f}</td></tr>
+                <tr><td><strong>Reason:</strong></td><td>{reason}</td></tr>
+            </table>
+            <p>Please try again or contact support if the problem persists.</p>
+        </body>
+        </html>
+        """,
+    ),
+}
+
+# Compiled once at import (app startup)
+TEMPLATES: Dict[str, EmailTemplate] = {
+    name: EmailTemplate(name, *source) for name, source in TEMPLATE_SOURCES.items()
+}
+
+
+DIGEST_TEMPLATES: Dict[str, DigestTemplate] = {
+    name: DigestTemplate(name, *source) for name, source in DIGEST_SOURCES.items()
+}
+
+
+def get_template(name: str) -> EmailTemplate:
+    return TEMPLATES[name]
+
+
+def get_digest_template(name: str) -> DigestTemplate:
+    return DIGEST_TEMPLATES[name]
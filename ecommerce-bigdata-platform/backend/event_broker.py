@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+from typing import Dict, Any, Optional, Set, AsyncIterator
+
+
+class Subscription:
+    """One connected client: a bounded queue of events for the topics it follows"""
+
+    __slots__ = ('queue', 'topics', 'dropped')
+
+    def __init__(self, topics, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.topics = tuple(topics)
+        self.dropped = 0
+
+
+class EventBroker:
+    """In-process pub/sub fan-out for streaming endpoints.
+
+    Publishing never blocks: each subscriber has a small bounded queue and a
+    slow client loses its oldest undelivered events instead of holding up
+    the publisher or growing memory. Idle subscribers cost one queue each.
+    """
+
+    def __init__(self, queue_size: Optional[int] = None):
+        self.queue_size = queue_size or int(os.getenv('STREAM_QUEUE_SIZE', '16'))
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self.stats = {'published': 0, 'delivered': 0, 'dropped': 0}
+
+    def subscribe(self, *topics: str) -> Subscription:
+        subscription = Subscription(topics, self.queue_size)
+        for topic in topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def has_subscribers(self, topic: str) -> bool:
+        return topic in self._topics
+
+    def publish(self, topic: str, event_type: str, data: Dict[str, Any]):
+        """Fan an event out to every subscriber of `topic`"""
+        subscribers = self._topics.get(topic)
+        self.stats['published'] += 1
+        if not subscribers:
+            return
+        # Serialize once for all subscribers
+        message = format_sse(event_type, data)
+        for subscription in subscribers:
+            queue = subscription.queue
+            if queue.full():
+                queue.get_nowait()
+                subscription.dropped += 1
+                self.stats['dropped'] += 1
+            queue.put_nowait(message)
+            self.stats['delivered'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        subscriptions = set()
+        for subscribers in self._topics.values():
+            subscriptions.update(subscribers)
+        return {**self.stats, 'topics': len(self._topics), 'subscribers': len(subscriptions)}
+
+
+def format_sse(event_type: str, data: Dict[str, Any]) -> str:
+    """Encode one Server-Sent Events message"""
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def sse_stream(broker: EventBroker, topics, initial: Optional[str] = None,
+                     heartbeat: Optional[float] = None) -> AsyncIterator[str]:
+    """Yield SSE messages for `topics` until the client disconnects"""
+    heartbeat = heartbeat or float(os.getenv('STREAM_HEARTBEAT_SECONDS', '15'))
+    # Subscribe inside the generator so the finally block always pairs with it
+    subscription = broker.subscribe(*topics)
+    try:
+        if initial:
+            yield initial
+        while True:
+            try:
+                yield await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing idle connections
+                yield ": keep-alive\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+# Global event broker instance
+event_broker = EventBroker()
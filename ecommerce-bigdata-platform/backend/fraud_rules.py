@@ -0,0 +1,436 @@
+import json
+import logging
+import operator
+import os
+import threading
+import time
+from string import Formatter
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fraud_rules.json')
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+class FraudContext:
+    """Everything a signal may read while one transaction is evaluated"""
+
+    __slots__ = ('state', 'sketches', 'profile', 'customer_id', 'amount', 'ip_address', 'device_id',
+                 'ts', 'window_start', 'retention_start')
+
+    def __init__(self, state, customer_id, amount, ip_address, device_id,
+                 ts: float, window_start: float, retention_start: float, sketches=None,
+                 profile: Optional[Dict[str, Any]] = None):
+        self.state = state
+        self.sketches = sketches
+        self.profile = profile
+        self.customer_id = customer_id
+        self.amount = amount
+        self.ip_address = ip_address
+        self.device_id = device_id
+        self.ts = ts
+        self.window_start = window_start
+        self.retention_start = retention_start
+
+
+# Signal registry: name -> (dependency names, fn(ctx, *dependency values)).
+# A signal evaluates to None when it does not apply (e.g. no customer_id),
+# and any condition on a None signal is false.
+SIGNALS: Dict[str, Tuple[Tuple[str, ...], Callable]] = {}
+
+
+def register_signal(name: str, deps: Tuple[str, ...] = ()):
+    """Decorator adding a signal that fraud rules can reference"""
+    def decorator(fn):
+        SIGNALS[name] = (tuple(deps), fn)
+        return fn
+    return decorator
+
+
+def _recent(entries, since):
+    if entries is None:
+        return None
+    return [txn for ts, txn in entries if ts > since]
+
+
+@register_signal('amount')
+def _amount(ctx):
+    return ctx.amount
+
+
+@register_signal('customer_window')
+def _customer_window(ctx):
+    if not ctx.customer_id:
+        return None
+    return ctx.state.fetch('customer', ctx.customer_id, ctx.retention_start)
+
+
+@register_signal('customer_window_1h', ('customer_window',))
+def _customer_window_1h(ctx, window):
+    return _recent(window, ctx.window_start)
+
+
+@register_signal('customer_txn_count_24h', ('customer_window',))
+def _customer_txn_count_24h(ctx, window):
+    return None if window is None else len(window)
+
+
+@register_signal('customer_known_orders', ('customer_window',))
+def _customer_known_orders(ctx, window):
+    # Recent in-memory transactions plus lifetime orders from the customer profile,
+    # so long-time customers do not look new after a restart
+    if window is None:
+        return None
+    lifetime = ctx.profile.get('order_count', 0) if ctx.profile else 0
+    return len(window) + lifetime
+
+
+@register_signal('customer_lifetime_spend')
+def _customer_lifetime_spend(ctx):
+    if not ctx.customer_id or not ctx.profile:
+        return None
+    return ctx.profile.get('total_spend', 0.0)
+
+
+@register_signal('customer_txn_count_1h', ('customer_window_1h',))
+def _customer_txn_count_1h(ctx, recent):
+    return None if recent is None else len(recent)
+
+
+@register_signal('customer_amount_1h', ('customer_window_1h',))
+def _customer_amount_1h(ctx, recent):
+    if recent is None:
+        return None
+    return sum(txn.get('amount', 0) for txn in recent) + ctx.amount
+
+
+@register_signal('ip_txn_count_1h')
+def _ip_txn_count_1h(ctx):
+    if not ctx.ip_address:
+        return None
+    return len(ctx.state.fetch('ip', ctx.ip_address, max(ctx.window_start, ctx.retention_start)))
+
+
+@register_signal('device_window_1h')
+def _device_window_1h(ctx):
+    if not ctx.device_id:
+        return None
+    return [txn for _, txn in ctx.state.fetch('device', ctx.device_id, max(ctx.window_start, ctx.retention_start))]
+
+
+@register_signal('device_txn_count_1h', ('device_window_1h',))
+def _device_txn_count_1h(ctx, window):
+    return None if window is None else len(window)
+
+
+# Distinct counts read the shared state windows (exact, the same on every
+# worker); they are what scoring rules should use
+
+@register_signal('customer_distinct_ips_1h', ('customer_window_1h',))
+def _customer_distinct_ips_1h(ctx, recent):
+    if recent is None or not ctx.ip_address:
+        return None
+    # Include the current IP so the count reflects this transaction
+    return len({txn.get('ip_address') for txn in recent if txn.get('ip_address')} | {ctx.ip_address})
+
+
+@register_signal('device_distinct_customers_1h', ('device_window_1h',))
+def _device_distinct_customers_1h(ctx, recent):
+    if recent is None or not ctx.customer_id:
+        return None
+    return len({txn.get('customer_id') for txn in recent if txn.get('customer_id')} | {ctx.customer_id})
+
+
+# Approximate signals backed by FraudSketches (fixed memory, but per process:
+# with several workers each sees only its own traffic, so use them only in
+# advisory rules with weight 0)
+
+@register_signal('ip_txn_count_1h_approx')
+def _ip_txn_count_1h_approx(ctx):
+    if not ctx.ip_address or ctx.sketches is None:
+        return None
+    return ctx.sketches.ip_counts.estimate(ctx.ip_address, ctx.ts)
+
+
+@register_signal('device_txn_count_1h_approx')
+def _device_txn_count_1h_approx(ctx):
+    if not ctx.device_id or ctx.sketches is None:
+        return None
+    return ctx.sketches.device_counts.estimate(ctx.device_id, ctx.ts)
+
+
+@register_signal('customer_distinct_ips_1h_approx')
+def _customer_distinct_ips_1h_approx(ctx):
+    if not ctx.customer_id or not ctx.ip_address or ctx.sketches is None:
+        return None
+    return ctx.sketches.customer_ips.count(ctx.customer_id, ctx.ts, ctx.ip_address)
+
+
+@register_signal('device_distinct_customers_1h_approx')
+def _device_distinct_customers_1h_approx(ctx):
+    if not ctx.device_id or not ctx.customer_id or ctx.sketches is None:
+        return None
+    return ctx.sketches.device_customers.count(ctx.device_id, ctx.ts, ctx.customer_id)
+
+
+class RuleMetrics:
+    """Evaluation counters and timings for one rule or signal"""
+
+    __slots__ = ('evaluations', 'fired', 'total_ns', 'max_ns')
+
+    def __init__(self):
+        self.evaluations = 0
+        self.fired = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, elapsed_ns: int, fired: bool = False):
+        self.evaluations += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        if fired:
+            self.fired += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'evaluations': self.evaluations,
+            'fired': self.fired,
+            'avg_us': round(self.total_ns / self.evaluations / 1000, 3) if self.evaluations else 0.0,
+            'max_us': round(self.max_ns / 1000, 3),
+            'total_ms': round(self.total_ns / 1e6, 3),
+        }
+
+
+class CompiledRule:
+    """A rule with thresholds resolved and operators bound"""
+
+    __slots__ = ('name', 'conditions', 'weight', 'message', 'signals')
+
+    def __init__(self, name: str, conditions: List[Tuple[str, Callable, Any]], weight: float, message: str):
+        self.name = name
+        self.conditions = conditions
+        self.weight = weight
+        self.message = message
+        self.signals = sorted({signal for signal, _, _ in conditions})
+
+
+class FraudRulePlan:
+    """Flat evaluation plan: signal steps in dependency order, then rules"""
+
+    def __init__(self, steps: List[Tuple[str, Callable, Tuple[str, ...]]], rules: List[CompiledRule],
+                 thresholds: Dict[str, Any], decision: Dict[str, float]):
+        self.steps = steps
+        self.rules = rules
+        self.thresholds = thresholds
+        self.decision = decision
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _message_fields(name: str, message: str) -> List[str]:
+    try:
+        return [field for _, field, _, _ in Formatter().parse(message) if field is not None]
+    except ValueError as e:
+        raise ValueError(f"Rule {name}: bad message format: {e}")
+
+
+def compile_rules(config: Dict[str, Any]) -> FraudRulePlan:
+    """Compile a rule config into a FraudRulePlan, raising ValueError on bad input"""
+    if not isinstance(config, dict):
+        raise ValueError("Fraud rule config must be an object")
+    thresholds = dict(config.get('thresholds', {}))
+    decision = {'fraudulent_above': 0.7, 'block_above': 0.8, 'review_above': 0.5}
+    decision.update(config.get('decision', {}))
+    for key, value in list(thresholds.items()) + list(decision.items()):
+        if not _is_number(value):
+            raise ValueError(f"Threshold/decision '{key}' must be a number")
+
+    rules = []
+    needed = []
+    for rule in config.get('rules', []):
+        name = rule.get('name') if isinstance(rule, dict) else None
+        if not name:
+            raise ValueError("Fraud rule without a name")
+        when = rule.get('when', [])
+        if not isinstance(when, list):
+            raise ValueError(f"Rule {name}: 'when' must be a list of [signal, op, value]")
+        conditions = []
+        for condition in when:
+            if not isinstance(condition, list) or len(condition) != 3:
+                raise ValueError(f"Rule {name}: condition must be [signal, op, value]")
+            signal, op, value = condition
+            if signal not in SIGNALS:
+                raise ValueError(f"Rule {name}: unknown signal '{signal}'")
+            if op not in OPERATORS:
+                raise ValueError(f"Rule {name}: unknown operator '{op}'")
+            if isinstance(value, str):
+                if value not in thresholds:
+                    raise ValueError(f"Rule {name}: unknown threshold '{value}'")
+                value = thresholds[value]
+            elif not _is_number(value):
+                raise ValueError(f"Rule {name}: condition value must be a number or threshold name")
+            conditions.append((signal, OPERATORS[op], value))
+            needed.append(signal)
+        if not conditions:
+            raise ValueError(f"Rule {name}: no conditions")
+        weight = rule.get('weight', 0.0)
+        if not _is_number(weight):
+            raise ValueError(f"Rule {name}: weight must be a number")
+        message = rule.get('message', name)
+        if not isinstance(message, str):
+            raise ValueError(f"Rule {name}: message must be a string")
+        # Placeholders name signals; they are computed even if no condition uses them
+        for placeholder in _message_fields(name, message):
+            if placeholder not in SIGNALS:
+                raise ValueError(f"Rule {name}: message uses unknown signal '{{{placeholder}}}'")
+            needed.append(placeholder)
+        rules.append(CompiledRule(name, conditions, float(weight), message))
+
+    # Resolve the dependency closure once so shared windows are computed a single time
+    steps = []
+    visited = set()
+
+    def visit(signal, path=()):
+        if signal in visited:
+            return
+        if signal in path:
+            raise ValueError(f"Signal dependency cycle: {' -> '.join(path + (signal,))}")
+        if signal not in SIGNALS:
+            raise ValueError(f"Unknown signal dependency '{signal}'")
+        deps, fn = SIGNALS[signal]
+        for dep in deps:
+            visit(dep, path + (signal,))
+        visited.add(signal)
+        steps.append((signal, fn, deps))
+
+    for signal in needed:
+        visit(signal)
+
+    return FraudRulePlan(steps, rules, thresholds, decision)
+
+
+class FraudRuleEngine:
+    """Evaluates a compiled rule plan and hot-reloads it when the config file changes"""
+
+    def __init__(self, path: Optional[str] = None, reload_interval: Optional[float] = None):
+        self.path = path or os.getenv('FRAUD_RULES_PATH', DEFAULT_RULES_PATH)
+        self.reload_interval = reload_interval if reload_interval is not None else \
+            float(os.getenv('FRAUD_RULES_RELOAD_SECONDS', '5'))
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_check = 0.0
+        self.version = 0
+        self.last_error = None
+        self.plan = None
+        self.rule_metrics: Dict[str, RuleMetrics] = {}
+        self.signal_metrics: Dict[str, RuleMetrics] = {}
+        self.reload()
+
+    def reload(self) -> bool:
+        """Recompile the rule file; keep the current plan if the new one is invalid"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path) as f:
+                    plan = compile_rules(json.load(f))
+            except Exception as e:
+                # Any failure (bad JSON, wrong types, unreadable file) keeps the old plan
+                self.last_error = f"{type(e).__name__}: {e}"
+                if self.plan is None:
+                    raise
+                logger.warning("⚠️ Fraud rules not reloaded, keeping version %s: %s", self.version, e)
+                return False
+
+            self.plan = plan
+            self._mtime = mtime
+            self.version += 1
+            self.last_error = None
+            # Keep history for rules that survived the reload
+            self.rule_metrics = {rule.name: self.rule_metrics.get(rule.name, RuleMetrics()) for rule in plan.rules}
+            self.signal_metrics = {name: self.signal_metrics.get(name, RuleMetrics()) for name, _, _ in plan.steps}
+            return True
+
+    def maybe_reload(self):
+        """Reload if the rule file changed; the mtime is checked at most every reload_interval"""
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            # Remember the mtime even if compiling fails so a bad file is reported once
+            self._mtime = mtime
+            self.reload()
+
+    def evaluate(self, ctx: FraudContext) -> Tuple[float, List[str], Dict[str, Any]]:
+        """Run the plan against a transaction context; returns (risk_score, risk_factors, signal values)"""
+        self.maybe_reload()
+        plan = self.plan
+        rule_metrics = self.rule_metrics
+        signal_metrics = self.signal_metrics
+        perf_counter_ns = time.perf_counter_ns
+
+        values = {}
+        for name, fn, deps in plan.steps:
+            started = perf_counter_ns()
+            values[name] = fn(ctx, *[values[dep] for dep in deps])
+            signal_metrics[name].record(perf_counter_ns() - started)
+
+        risk_score = 0.0
+        risk_factors = []
+        for rule in plan.rules:
+            started = perf_counter_ns()
+            fired = True
+            for signal, op, threshold in rule.conditions:
+                value = values[signal]
+                if value is None or not op(value, threshold):
+                    fired = False
+                    break
+            if fired:
+                try:
+                    risk_factors.append(rule.message.format(**values))
+                except (TypeError, ValueError):
+                    # A placeholder signal outside the conditions may be None (e.g. "{x:.2f}")
+                    risk_factors.append(rule.name)
+                risk_score += rule.weight
+            rule_metrics[rule.name].record(perf_counter_ns() - started, fired)
+
+        return risk_score, risk_factors, values
+
+    def recommendation(self, risk_score: float) -> Dict[str, Any]:
+        """Map a raw risk score to the verdict fields of a fraud result"""
+        decision = self.plan.decision
+        return {
+            'is_fraudulent': risk_score > decision['fraudulent_above'],
+            'risk_score': min(risk_score, 1.0),
+            'recommendation': 'BLOCK' if risk_score > decision['block_above']
+            else 'REVIEW' if risk_score > decision['review_above'] else 'ALLOW'
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Per-rule and per-signal evaluation metrics"""
+        return {
+            'version': self.version,
+            'path': self.path,
+            'last_error': self.last_error,
+            'rules': {
+                rule.name: {**self.rule_metrics[rule.name].to_dict(), 'weight': rule.weight, 'signals': rule.signals}
+                for rule in self.plan.rules
+            },
+            'signals': {name: metrics.to_dict() for name, metrics in self.signal_metrics.items()},
+        }
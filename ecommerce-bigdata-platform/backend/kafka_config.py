@@ -1,9 +1,19 @@
 import os
-from confluent_kafka import Producer, Consumer
-from dotenv import load_dotenv
+import json
+import logging
+import threading
 import time
+from typing import TYPE_CHECKING, Optional
 
-load_dotenv()
+from metrics import metrics
+from settings import load_env
+
+if TYPE_CHECKING:
+    from confluent_kafka import Producer
+
+logger = logging.getLogger(__name__)
+
+load_env()
 
 # Confluent Cloud Kafka Configuration
 KAFKA_CONFIG = {
@@ -29,19 +39,42 @@ TOPICS = {
     'NOTIFICATIONS': os.getenv('KAFKA_TOPIC_NOTIFICATIONS', 'ecommerce-notifications')
 }
 
+_shared_producer = None
+_shared_producer_lock = threading.Lock()
+
 def get_kafka_producer():
     """Get a Kafka producer instance"""
+    from confluent_kafka import Producer
     return Producer(KAFKA_CONFIG)
 
-def get_kafka_consumer(group_id: str, topics: list):
+def get_shared_producer() -> Optional['Producer']:
+    """The process-wide producer, created on first send; None when Kafka is not configured"""
+    global _shared_producer
+    if _shared_producer is None and KAFKA_CONFIG['bootstrap.servers']:
+        with _shared_producer_lock:
+            if _shared_producer is None:
+                _shared_producer = get_kafka_producer()
+    return _shared_producer
+
+def close_shared_producer(timeout: float = 5.0):
+    """Deliver what is still queued (call from the app shutdown event)"""
+    global _shared_producer
+    producer, _shared_producer = _shared_producer, None
+    if producer is not None:
+        remaining = producer.flush(timeout)
+        if remaining:
+            logger.warning("⚠️ %d Kafka messages not delivered at shutdown", remaining)
+
+def get_kafka_consumer(group_id: str, topics: list, offset_reset: str = 'earliest'):
     """Get a Kafka consumer instance"""
     consumer_config = KAFKA_CONFIG.copy()
     consumer_config.update({
         'group.id': group_id,
-        'auto.offset.reset': 'earliest',
+        'auto.offset.reset': offset_reset,
         'enable.auto.commit': True,
         'auto.commit.interval.ms': 1000
     })
+    from confluent_kafka import Consumer
     consumer = Consumer(consumer_config)
     consumer.subscribe(topics)
     return consumer
@@ -49,47 +82,54 @@ def get_kafka_consumer(group_id: str, topics: list):
 def delivery_report(err, msg):
     """Delivery report callback for Kafka producer"""
     if err is not None:
-        print(f'Message delivery failed: {err}')
+        metrics.observe_kafka_delivery(None, failed=True)
+        logger.warning("Message delivery failed: %s", err, extra={'event': 'kafka.delivery_failed', 'topic': msg.topic()})
     else:
-        print(f'Message delivered to {msg.topic()} [{msg.partition()}] at offset {msg.offset()}')
+        metrics.observe_kafka_delivery(msg.latency())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Message delivered", extra={
+                'event': 'kafka.delivered', 'topic': msg.topic(), 'partition': msg.partition(), 'offset': msg.offset()
+            })
 
-def send_kafka_event(producer: Producer, topic: str, key: str, value: dict):
+def send_kafka_event(producer: 'Producer', topic: str, key: str, value: dict):
     """Send an event to Kafka"""
     # Check if Kafka is properly configured
     if not producer or not os.getenv('KAFKA_BOOTSTRAP_SERVERS'):
-        print(f"Kafka not configured, skipping event: {value}")
+        logger.debug("Kafka not configured, skipping event", extra={'event': 'kafka.skipped', 'topic': topic})
         return
         
     try:
         producer.produce(
             topic=topic,
             key=key.encode('utf-8'),
-            value=str(value).encode('utf-8'),
+            value=json.dumps(value, default=str).encode('utf-8'),
             callback=delivery_report
         )
         producer.poll(0)  # Trigger delivery reports
-        print(f"Event sent to topic {topic}: {value}")
+        # Payloads are only logged (and serialized for the log) at DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Event sent", extra={'event': 'kafka.sent', 'topic': topic, 'key': key, 'payload': value})
     except Exception as e:
-        print(f"Warning: Error sending event to Kafka: {e}")
+        logger.warning("Error sending event to Kafka: %s", e, extra={'event': 'kafka.send_failed', 'topic': topic})
         # Don't raise the exception - just log it as a warning
         # This prevents Kafka issues from crashing the API endpoints
 
-def send_fraud_event(producer: Producer, transaction_data: dict):
+def send_fraud_event(producer: 'Producer', transaction_data: dict):
     """Send fraud detection event to Kafka"""
     key = f"fraud_{transaction_data.get('customer_id', 'unknown')}_{int(time.time())}"
     send_kafka_event(producer, TOPICS['FRAUD_DETECTION'], key, transaction_data)
 
-def send_stock_alert(producer: Producer, alert_data: dict):
+def send_stock_alert(producer: 'Producer', alert_data: dict):
     """Send stock alert event to Kafka"""
     key = f"stock_{alert_data.get('product_id', 'unknown')}"
     send_kafka_event(producer, TOPICS['STOCK_ALERTS'], key, alert_data)
 
-def send_order_tracking_event(producer: Producer, tracking_data: dict):
+def send_order_tracking_event(producer: 'Producer', tracking_data: dict):
     """Send order tracking event to Kafka"""
     key = f"order_{tracking_data.get('order_id', 'unknown')}"
     send_kafka_event(producer, TOPICS['ORDER_TRACKING'], key, tracking_data)
 
-def send_notification_event(producer: Producer, notification_data: dict):
+def send_notification_event(producer: 'Producer', notification_data: dict):
     """Send notification event to Kafka"""
     key = f"notification_{notification_data.get('type', 'unknown')}_{int(time.time())}"
     send_kafka_event(producer, TOPICS['NOTIFICATIONS'], key, notification_data) 
\ No newline at end of file
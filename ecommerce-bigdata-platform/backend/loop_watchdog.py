@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+STACK_DEPTH = 12
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+THIS_FILE = os.path.abspath(__file__)
+# Installed packages, even when the virtualenv lives inside the backend directory
+# (scripts/bootstrap.sh creates backend/venv)
+LIBRARY_ROOTS = tuple({os.path.join(os.path.abspath(prefix), '') for prefix in (sys.prefix, sys.base_prefix)})
+
+logger = logging.getLogger(__name__)
+
+
+def is_app_file(filename: str) -> bool:
+    """True for the backend's own source files, not libraries or the interpreter"""
+    if not filename.startswith(APP_ROOT) or filename.startswith(LIBRARY_ROOTS):
+        return False
+    parts = filename.split(os.sep)
+    return 'site-packages' not in parts and 'dist-packages' not in parts
+
+
+class LoopWatchdog:
+    """Opt-in detector for blocking calls on the event loop.
+
+    A heartbeat callback re-arms itself on the loop every `interval`; when it
+    runs more than `threshold` late, something blocked the loop for that long.
+    A watchdog thread notices the missed heartbeat while the stall is still
+    happening and snapshots the loop thread's stack, so the report names the
+    code that was running (e.g. bcrypt in auth, smtplib, a Kafka flush)
+    rather than whatever ran afterwards. C code that holds the GIL for the
+    whole stall can't be sampled; those stalls are reported without a stack.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, max_locations: int = 50):
+        self.threshold = threshold or float(os.getenv('LOOP_WATCHDOG_THRESHOLD_MS', '100')) / 1000.0
+        self.interval = max(self.threshold / 4, 0.005)
+        self.max_locations = max_locations
+        self.app_root = APP_ROOT
+        self.stats = {'blocked': 0, 'blocked_seconds': 0.0, 'max_blocked_seconds': 0.0, 'unsampled': 0}
+        self.by_location: Dict[str, List[float]] = {}  # location -> [count, total seconds]
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._beat = 0.0
+        self._expected = 0.0
+        self._captured: Optional[Tuple[float, str, List[str]]] = None  # (beat, location, stack)
+
+    def start(self):
+        """Start watching the running loop (call from the app startup event)"""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._beat = time.monotonic()
+        self._expected = self._beat + self.interval
+        self._handle = self._loop.call_later(self.interval, self._heartbeat)
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info("🐕 Event loop watchdog on (threshold %.0fms)", self.threshold * 1000)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _heartbeat(self):
+        now = time.monotonic()
+        late = now - self._expected
+        previous_beat = self._beat
+        self._beat = now
+        self._expected = now + self.interval
+        self._handle = self._loop.call_later(self.interval, self._heartbeat)
+        if late > self.threshold:
+            captured = self._captured
+            if captured is not None and captured[0] == previous_beat:
+                self._report(late, captured[1], captured[2])
+            else:
+                self.stats['unsampled'] += 1
+                self._report(late, 'unknown (not sampled)', [])
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            captured = self._captured
+            if time.monotonic() - beat - self.interval <= self.threshold:
+                continue
+            if captured is not None and captured[0] == beat:
+                continue  # Already sampled this stall
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._captured = (beat, self._locate(frame), self._format_stack(frame))
+
+    @staticmethod
+    def _format_stack(frame) -> List[str]:
+        entries = traceback.extract_stack(frame)
+        # Drop the event loop machinery above the callback/task step that is blocking
+        for i in range(len(entries) - 1, -1, -1):
+            if entries[i].filename.endswith(os.path.join('asyncio', 'events.py')):
+                entries = entries[i + 1:]
+                break
+        return traceback.format_list(entries[-STACK_DEPTH:])
+
+    def _locate(self, frame) -> str:
+        """Innermost frame in our own code: the call site of the blocking library call"""
+        innermost = frame
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if is_app_file(filename) and filename != THIS_FILE:
+                return f"{os.path.relpath(filename, self.app_root)}:{frame.f_lineno} {frame.f_code.co_name}"
+            frame = frame.f_back
+        code = innermost.f_code
+        return f"{os.path.basename(code.co_filename)}:{innermost.f_lineno} {code.co_name}"
+
+    def _report(self, seconds: float, location: str, stack: List[str]):
+        self.stats['blocked'] += 1
+        self.stats['blocked_seconds'] += seconds
+        self.stats['max_blocked_seconds'] = max(self.stats['max_blocked_seconds'], seconds)
+        if location not in self.by_location and len(self.by_location) >= self.max_locations:
+            location = 'other'
+        entry = self.by_location.setdefault(location, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        logger.warning("🐢 Event loop blocked for %.0fms at %s%s", seconds * 1000, location,
+                       ":\n" + "".join(stack).rstrip() if stack else "",
+                       extra={'event': 'loop.blocked', 'blocked_ms': round(seconds * 1000, 1), 'location': location})
+
+    def collect(self):
+        """Metrics collector (see metrics.MetricsRegistry.add_collector)"""
+        locations = list(self.by_location.items())
+        yield ('event_loop_blocked_total', 'counter', 'Event loop stalls longer than the watchdog threshold',
+               [({'location': location}, count) for location, (count, _) in locations])
+        yield ('event_loop_blocked_seconds_total', 'counter', 'Time the event loop spent blocked',
+               [({'location': location}, total) for location, (_, total) in locations])
+        yield ('event_loop_blocked_max_seconds', 'gauge', 'Longest event loop stall seen',
+               [({}, self.stats['max_blocked_seconds'])])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'threshold_ms': self.threshold * 1000,
+            'running': self._thread is not None,
+            'locations': {location: {'count': count, 'seconds': round(total, 3)}
+                          for location, (count, total) in self.by_location.items()},
+        }
+
+
+# Global event loop watchdog instance
+loop_watchdog = LoopWatchdog()
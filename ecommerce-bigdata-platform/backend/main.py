@@ -1,20 +1,25 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Query
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, status, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer
-import uvicorn
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
-from dotenv import load_dotenv
 import uuid
+import json
+import socket
+import hmac
+import logging
+import asyncio
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 # Import our modules
 from auth import (
-    User, UserCreate, UserLogin, Token, 
-    create_access_token, verify_password, get_password_hash,
+    User, UserCreate, UserLogin, Token, StreamToken,
+    create_access_token, create_stream_token, verify_password, get_password_hash,
     get_current_active_user, get_current_admin_user, get_current_super_admin_user,
-    ACCESS_TOKEN_EXPIRE_MINUTES
+    get_current_stream_user, get_current_admin_stream_user, ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from models import (
     Product, ProductUpdate, ProductResponse, Order, OrderUpdate, OrderResponse,
@@ -24,54 +29,235 @@ from models import (
 from database import (
     users_collection, products_collection, orders_collection, events_collection,
     carts_collection, categories_collection, reviews_collection, wishlist_collection,
-    feedback_collection, init_database
+    feedback_collection, init_database, STOCK_MARGIN_PIPELINE, DEFAULT_LOW_STOCK_THRESHOLD,
+    connect_database, close_database, pool_metrics, route_db_metrics
 )
+from mongo_monitoring import DBInstrumentationMiddleware
+from metrics import MetricsMiddleware, metrics
+from loop_watchdog import loop_watchdog
+from profiler import ProfilerBusy, profiler
+from logging_config import configure_logging, get_logging_stats
 from kafka_config import (
-    get_kafka_producer, send_kafka_event, TOPICS,
+    get_shared_producer, close_shared_producer, get_kafka_consumer, send_kafka_event, TOPICS,
     send_fraud_event, send_stock_alert, send_order_tracking_event, send_notification_event
 )
 from notifications import notification_service
+from notification_dispatcher import notification_dispatcher
 from realtime_analytics import realtime_analytics
+from customer_profiles import customer_profiles
+from order_tracking import order_tracker
+from event_broker import event_broker, format_sse, sse_stream
+from admin_feed import admin_feed
+from stock_index import severity_escalated, SEVERITY_RANK
+from settings import load_env
+
+
+load_env()
+logger = logging.getLogger(__name__)
+
+# Routes are registered here and mounted by create_app(); importing this module
+# builds no app, clients or Kafka producer
+router = APIRouter()
+
+# Background tasks started with the app
+background_tasks: Dict[str, asyncio.Task] = {}
+
+def collect_subsystem_metrics():
+    """Gauges read from other subsystems at scrape time"""
+    pool = pool_metrics.get_stats()
+    yield ("mongodb_pool_connections", "gauge", "Open pooled MongoDB connections",
+           [({"state": "open"}, pool["open_connections"]), ({"state": "in_use"}, pool["in_use"])])
+    yield ("mongodb_pool_max_size", "gauge", "Configured maxPoolSize", [({}, pool["max_pool_size"])])
+    yield ("mongodb_pool_checkouts_total", "counter", "Connection checkouts", [({}, pool["checkouts"])])
+    yield ("mongodb_pool_wait_queue_timeouts_total", "counter", "Checkouts that timed out waiting for a connection",
+           [({}, pool["wait_queue_timeouts"])])
+    producer = get_shared_producer()
+    yield ("kafka_producer_queue_depth", "gauge", "Messages waiting in the producer queue for delivery",
+           [({}, len(producer) if producer else 0)])
+    yield ("notification_queue_depth", "gauge", "Notifications waiting for a delivery worker",
+           [({}, notification_dispatcher.get_stats()["pending"])])
+    yield ("analytics_window_keys", "gauge", "Keys with a live fraud transaction window",
+           [({"kind": kind}, realtime_analytics.state.count_keys(kind)) for kind in ("customer", "ip", "device")])
+    sketches = realtime_analytics.sketches.get_stats()
+    yield ("analytics_sketch_keys", "gauge", "Keys tracked by distinct-count sketches",
+           [({"kind": "customer"}, sketches["customers_tracked"]), ({"kind": "device"}, sketches["devices_tracked"])])
+    yield ("analytics_sketch_memory_bytes", "gauge", "Upper bound of fraud sketch memory",
+           [({}, sketches["max_memory_bytes"])])
+    yield ("analytics_stock_index_products", "gauge", "Products with a live stock alert",
+           [({}, len(realtime_analytics.stock_index))])
+    logs = get_logging_stats()
+    if logs["configured"]:
+        yield ("log_records_queued", "gauge", "Log records waiting for the writer thread", [({}, logs["queued"])])
+        yield ("log_records_dropped_total", "counter", "Log records dropped because the queue was full",
+               [({}, logs["dropped_queue_full"])])
+    yield ("stream_subscribers", "gauge", "Open streaming (SSE) subscriptions",
+           [({}, event_broker.get_stats()["subscribers"])])
 
 
 
-load_dotenv()
 
-app = FastAPI(
-    title="E-commerce BigData Platform API",
-    description="Complete e-commerce platform with JWT authentication, admin panel, and big data analytics",
-    version="1.0.0"
-)
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://localhost:3001"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-# Initialize Kafka producer
-kafka_producer = get_kafka_producer()
+# ==================== STOCK MONITORING ====================
 
+async def claim_stock_alert(product_id: str, severity: str) -> bool:
+    """Atomically mark a product as alerted at this severity; False if another worker already did"""
+    if not ObjectId.is_valid(product_id):
+        return True
+    already_alerted = [s for s, rank in SEVERITY_RANK.items() if rank >= SEVERITY_RANK[severity]]
+    result = await products_collection.update_one(
+        {"_id": ObjectId(product_id), "low_stock_alerted_severity": {"$nin": already_alerted}},
+        {"$set": {"low_stock_alerted_severity": severity}}
+    )
+    return result.modified_count == 1
+
+async def handle_stock_change(
+    product_id: str,
+    product_name: Optional[str],
+    current_stock: int,
+    threshold: Optional[int] = None,
+    notify: bool = True
+):
+    """Feed a stock mutation into the stock index and alert when a product gets worse"""
+    alert_info = realtime_analytics.monitor_stock_levels(
+        product_id, product_name, current_stock, threshold
+    )
+    
+    # Only the worker that made the change alerts, and only on escalation, so
+    # repeated decrements of an already-low product don't resend alerts
+    if notify and alert_info["alert_needed"] and severity_escalated(
+        alert_info["previous_severity"], alert_info["severity"]
+    ) and await claim_stock_alert(product_id, alert_info["severity"]):
+        send_stock_alert(get_shared_producer(), alert_info)
+        notification_service.notify_stock_alert(
+            product_id, alert_info["product_name"], current_stock, alert_info["threshold"]
+        )
+    
+    return alert_info
 
+async def apply_inventory_event(event: dict):
+    """Update the stock index from an INVENTORY Kafka event"""
+    event_type = event.get("event_type")
+    if event_type == "product_created":
+        product = event.get("product", {})
+        if product.get("_id") and product.get("stock_quantity") is not None:
+            await handle_stock_change(
+                product["_id"], product.get("name"), product["stock_quantity"],
+                product.get("low_stock_threshold"), notify=False
+            )
+    elif event_type in ("product_updated", "stock_updated"):
+        updates = event.get("updates", event)
+        if event.get("product_id") and updates.get("stock_quantity") is not None:
+            await handle_stock_change(
+                event["product_id"], updates.get("name") or event.get("product_name"),
+                updates["stock_quantity"], updates.get("low_stock_threshold"), notify=False
+            )
+    elif event_type == "product_deleted" and event.get("product_id"):
+        realtime_analytics.stock_index.remove(event["product_id"])
 
+async def low_stock_scanner(interval_seconds: float):
+    """Safety net for missed events: one indexed query for every active product at or below threshold"""
+    while True:
+        try:
+            cursor = products_collection.find(
+                {"is_active": True, "stock_margin": {"$lte": 0}},
+                {"name": 1, "stock_quantity": 1, "low_stock_threshold": 1}
+            )
+            async for product in cursor:
+                await handle_stock_change(
+                    str(product["_id"]), product.get("name"), product.get("stock_quantity", 0),
+                    product.get("low_stock_threshold", DEFAULT_LOW_STOCK_THRESHOLD)
+                )
+        except Exception as e:
+            logger.warning("⚠️ Low-stock scan failed: %s", e)
+        await asyncio.sleep(interval_seconds)
 
+async def update_stock_margin(product_id: str):
+    """Recompute stock_margin after stock or threshold changed; returns the updated product"""
+    return await products_collection.find_one_and_update(
+        {"_id": ObjectId(product_id)},
+        STOCK_MARGIN_PIPELINE,
+        projection={"name": 1, "stock_quantity": 1, "low_stock_threshold": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def inventory_event_listener():
+    """Keep this worker's stock index in sync with inventory changes made elsewhere"""
+    # A group per worker so every worker receives every inventory event
+    group_id = f"stock-monitor-{socket.gethostname()}-{os.getpid()}"
+    consumer = get_kafka_consumer(group_id, [TOPICS['INVENTORY']], offset_reset='latest')
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            msg = await loop.run_in_executor(None, consumer.poll, 1.0)
+            if msg is None:
+                continue
+            if msg.error():
+                logger.warning("⚠️ Inventory consumer error: %s", msg.error())
+                continue
+            try:
+                await apply_inventory_event(json.loads(msg.value().decode('utf-8')))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning("⚠️ Skipping malformed inventory event: %s", e)
+    finally:
+        consumer.close()
 
 # Startup event
-@app.on_event("startup")
 async def startup_event():
-    await init_database()
+    connect_database()
+    get_shared_producer()  # Connect before the first request instead of during it
+    metrics.start()
+    if not os.getenv("METRICS_TOKEN"):
+        logger.warning("⚠️ METRICS_TOKEN is not set: /metrics is readable without authentication")
+    # Opt-in: log and count event loop stalls with the stack of the blocking code
+    if os.getenv("LOOP_WATCHDOG_ENABLED", "false").lower() == "true":
+        loop_watchdog.start()
+    # Set to false when scripts/setup-database.py runs once per deploy instead
+    if os.getenv("DATABASE_SETUP_ON_STARTUP", "true").lower() == "true":
+        await init_database()
+    order_tracker.start()
+    admin_feed.start()
+    notification_dispatcher.start()
+    
+    if os.getenv("STOCK_MONITOR_CONSUME_INVENTORY", "false").lower() == "true" and os.getenv("KAFKA_BOOTSTRAP_SERVERS"):
+        background_tasks['inventory_listener'] = asyncio.create_task(inventory_event_listener())
+    
+    scan_interval = float(os.getenv("LOW_STOCK_SCAN_INTERVAL_SECONDS", "300"))
+    if scan_interval > 0:
+        background_tasks['low_stock_scanner'] = asyncio.create_task(low_stock_scanner(scan_interval))
+
+async def shutdown_event():
+    while background_tasks:
+        background_tasks.popitem()[1].cancel()
+    admin_feed.stop()
+    await order_tracker.stop()
+    # Held digests go to the dispatcher while it still drains; webhooks the
+    # drained jobs left in batches are posted by notification_service.close()
+    notification_service.flush()
+    await notification_dispatcher.stop()
+    await notification_service.close()
+    await asyncio.to_thread(close_shared_producer)
+    await asyncio.to_thread(realtime_analytics.close)
+    close_database()
+    metrics.stop()
+    loop_watchdog.stop()
 
 # Health check
-@app.get("/health")
+@router.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    """Prometheus text exposition; requires `Authorization: Bearer $METRICS_TOKEN` when that is set"""
+    token = os.getenv("METRICS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # ==================== AUTHENTICATION ROUTES ====================
 
-@app.post("/auth/register", response_model=Token)
+@router.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate):
     # Check if user already exists
     existing_user = await users_collection.find_one({"email": user_data.email})
@@ -100,7 +286,7 @@ async def register(user_data: UserCreate):
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['USER_EVENTS'],
         f"user_{result.inserted_id}",
         {
@@ -119,7 +305,7 @@ async def register(user_data: UserCreate):
         "role": user_data.role
     }
 
-@app.post("/auth/login", response_model=Token)
+@router.post("/auth/login", response_model=Token)
 async def login(user_data: UserLogin):
     # Find user
     user = await users_collection.find_one({"email": user_data.email})
@@ -152,7 +338,7 @@ async def login(user_data: UserLogin):
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['USER_EVENTS'],
         f"user_{user['_id']}",
         {
@@ -170,13 +356,18 @@ async def login(user_data: UserLogin):
         "role": user["role"]
     }
 
-@app.get("/auth/me", response_model=User)
+@router.get("/auth/me", response_model=User)
 async def get_current_user_info(current_user: User = Depends(get_current_active_user)):
     return current_user
 
+@router.post("/auth/stream-token", response_model=StreamToken)
+async def issue_stream_token(current_user: User = Depends(get_current_active_user)):
+    """Short-lived token to open an EventSource stream with ?token= (which can't send headers)"""
+    return create_stream_token(current_user)
+
 # ==================== USER MANAGEMENT ROUTES ====================
 
-@app.post("/users", response_model=dict)
+@router.post("/users", response_model=dict)
 async def create_user(
     user_data: UserCreate,
     current_user: User = Depends(get_current_super_admin_user)
@@ -209,7 +400,7 @@ async def create_user(
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['USER_EVENTS'],
         f"user_{result.inserted_id}",
         {
@@ -223,7 +414,7 @@ async def create_user(
     
     return {"id": str(result.inserted_id), "message": "User created successfully"}
 
-@app.get("/users", response_model=List[UserResponse])
+@router.get("/users", response_model=List[UserResponse])
 async def get_users(
     skip: int = 0,
     limit: int = 100,
@@ -255,7 +446,7 @@ async def get_users(
         users.append(UserResponse(**user_data))
     return users
 
-@app.get("/users/{user_id}", response_model=UserResponse)
+@router.get("/users/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: str,
     current_user: User = Depends(get_current_admin_user)
@@ -284,7 +475,7 @@ async def get_user(
     }
     return UserResponse(**user_data)
 
-@app.put("/users/{user_id}")
+@router.put("/users/{user_id}")
 async def update_user(
     user_id: str,
     user_update: dict,
@@ -329,7 +520,7 @@ async def update_user(
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['USER_EVENTS'],
         f"user_{user_id}",
         {
@@ -342,7 +533,7 @@ async def update_user(
     
     return {"message": "User updated successfully"}
 
-@app.delete("/users/{user_id}")
+@router.delete("/users/{user_id}")
 async def delete_user(
     user_id: str,
     current_user: User = Depends(get_current_super_admin_user)
@@ -371,7 +562,7 @@ async def delete_user(
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['USER_EVENTS'],
         f"user_{user_id}",
         {
@@ -385,7 +576,7 @@ async def delete_user(
 
 # ==================== PRODUCT ROUTES ====================
 
-@app.post("/products", response_model=dict)
+@router.post("/products", response_model=dict)
 async def create_product(
     product: Product,
     current_user: User = Depends(get_current_admin_user)
@@ -395,23 +586,10 @@ async def create_product(
     # Generate unique SKU if not provided
     if not product_dict.get("sku"):
         product_dict["sku"] = f"SKU-{uuid.uuid4().hex[:8].upper()}"
+    product_dict["stock_margin"] = product_dict["stock_quantity"] - product_dict["low_stock_threshold"]
     
     try:
         result = await products_collection.insert_one(product_dict)
-        
-        # Send Kafka event
-        product_dict["_id"] = str(result.inserted_id)
-        send_kafka_event(
-            kafka_producer,
-            TOPICS['INVENTORY'],
-            f"product_{result.inserted_id}",
-            {
-                "event_type": "product_created",
-                "product": product_dict
-            }
-        )
-        
-        return {"id": str(result.inserted_id)}
     except Exception as e:
         if "duplicate key error" in str(e) and "sku" in str(e):
             raise HTTPException(
@@ -423,8 +601,30 @@ async def create_product(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create product"
             )
+    
+    # The product exists from here on: follow-up failures must not report the create as failed
+    product_dict["_id"] = str(result.inserted_id)
+    send_kafka_event(
+        get_shared_producer(),
+        TOPICS['INVENTORY'],
+        f"product_{result.inserted_id}",
+        {
+            "event_type": "product_created",
+            "product": product_dict
+        }
+    )
+    
+    try:
+        await handle_stock_change(
+            product_dict["_id"], product_dict["name"], product_dict["stock_quantity"],
+            product_dict["low_stock_threshold"]
+        )
+    except Exception as e:
+        logger.warning("⚠️ Stock check for new product %s failed: %s", product_dict["_id"], e)
+    
+    return {"id": str(result.inserted_id)}
 
-@app.get("/products", response_model=List[ProductResponse])
+@router.get("/products", response_model=List[ProductResponse])
 async def get_products(
     skip: int = 0,
     limit: int = 100,
@@ -444,7 +644,7 @@ async def get_products(
         products.append(ProductResponse(**product))
     return products
 
-@app.get("/products/{product_id}", response_model=ProductResponse)
+@router.get("/products/{product_id}", response_model=ProductResponse)
 async def get_product(product_id: str):
     product = await products_collection.find_one({"_id": ObjectId(product_id)})
     if not product:
@@ -452,7 +652,7 @@ async def get_product(product_id: str):
     product["id"] = str(product["_id"])
     return ProductResponse(**product)
 
-@app.put("/products/{product_id}")
+@router.put("/products/{product_id}")
 async def update_product(
     product_id: str,
     product_update: ProductUpdate,
@@ -470,7 +670,7 @@ async def update_product(
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['INVENTORY'],
         f"product_{product_id}",
         {
@@ -480,9 +680,17 @@ async def update_product(
         }
     )
     
+    if "stock_quantity" in update_data or "low_stock_threshold" in update_data:
+        product = await update_stock_margin(product_id)
+        if product:
+            await handle_stock_change(
+                product_id, product.get("name"), product.get("stock_quantity", 0),
+                product.get("low_stock_threshold", DEFAULT_LOW_STOCK_THRESHOLD)
+            )
+    
     return {"message": "Product updated successfully"}
 
-@app.delete("/products/{product_id}")
+@router.delete("/products/{product_id}")
 async def delete_product(
     product_id: str,
     current_user: User = Depends(get_current_admin_user)
@@ -496,7 +704,7 @@ async def delete_product(
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['INVENTORY'],
         f"product_{product_id}",
         {
@@ -505,11 +713,13 @@ async def delete_product(
         }
     )
     
+    realtime_analytics.stock_index.remove(product_id)
+    
     return {"message": "Product deleted successfully"}
 
 # ==================== ORDER ROUTES ====================
 
-@app.post("/orders", response_model=dict)
+@router.post("/orders", response_model=dict)
 async def create_order(
     order: Order,
     current_user: User = Depends(get_current_active_user)
@@ -520,11 +730,12 @@ async def create_order(
     
     order_dict = order.dict()
     result = await orders_collection.insert_one(order_dict)
+    customer_profiles.invalidate(order.customer_id)
     
     # Send Kafka event
     order_dict["_id"] = str(result.inserted_id)
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['ORDERS'],
         f"order_{result.inserted_id}",
         {
@@ -535,7 +746,7 @@ async def create_order(
     
     return {"order_id": str(result.inserted_id)}
 
-@app.get("/orders", response_model=List[OrderResponse])
+@router.get("/orders", response_model=List[OrderResponse])
 async def get_orders(
     skip: int = 0,
     limit: int = 100,
@@ -577,7 +788,7 @@ async def get_orders(
         orders.append(OrderResponse(**order))
     return orders
 
-@app.get("/orders/{order_id}", response_model=OrderResponse)
+@router.get("/orders/{order_id}", response_model=OrderResponse)
 async def get_order(
     order_id: str,
     current_user: User = Depends(get_current_active_user)
@@ -617,7 +828,7 @@ async def get_order(
     
     return OrderResponse(**order)
 
-@app.put("/orders/{order_id}")
+@router.put("/orders/{order_id}")
 async def update_order(
     order_id: str,
     order_update: OrderUpdate,
@@ -646,12 +857,15 @@ async def update_order(
     new_status = update_data.get("status", old_status)
     if new_status != old_status:
         # Track order status change
-        tracking_data = realtime_analytics.track_order_status(
-            order_id, new_status, customer_id, total_amount
+        tracking_data = order_tracker.track_order_status(
+            order_id, new_status, customer_id, total_amount, old_status
         )
         
         # Send order tracking event to Kafka
-        send_order_tracking_event(kafka_producer, tracking_data)
+        send_order_tracking_event(get_shared_producer(), tracking_data)
+        
+        # Push to clients streaming this order
+        event_broker.publish(f"order:{order_id}", "order_status", tracking_data)
         
         # Send notification to customer
         if customer_id:
@@ -663,7 +877,7 @@ async def update_order(
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['ORDERS'],
         f"order_{order_id}",
         {
@@ -672,10 +886,38 @@ async def update_order(
             "updates": update_data
         }
     )
+    event_broker.publish(f"order:{order_id}", "order_updated", {"order_id": order_id, "updates": update_data})
     
     return {"message": "Order updated successfully"}
 
-@app.delete("/orders/{order_id}")
+@router.get("/orders/{order_id}/stream")
+async def stream_order_updates(
+    order_id: str,
+    current_user: User = Depends(get_current_stream_user)
+):
+    """Stream order status changes as Server-Sent Events instead of polling"""
+    order = await orders_collection.find_one(
+        {"_id": ObjectId(order_id)}, {"customer_id": 1, "status": 1, "payment_status": 1}
+    )
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    
+    # Check authorization once, at connect time
+    if current_user.role == "customer" and order["customer_id"] != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    snapshot = format_sse("order_snapshot", {
+        "order_id": order_id,
+        "status": order.get("status", "pending"),
+        "payment_status": order.get("payment_status", "pending")
+    })
+    return StreamingResponse(
+        sse_stream(event_broker, [f"order:{order_id}"], initial=snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/orders/{order_id}")
 async def delete_order(
     order_id: str,
     current_user: User = Depends(get_current_admin_user)
@@ -694,7 +936,7 @@ async def delete_order(
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['ORDERS'],
         f"order_{order_id}",
         {
@@ -707,7 +949,7 @@ async def delete_order(
     
     return {"message": "Order deleted successfully"}
 
-@app.delete("/orders")
+@router.delete("/orders")
 async def delete_all_orders(
     current_user: User = Depends(get_current_admin_user)
 ):
@@ -723,7 +965,7 @@ async def delete_all_orders(
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['ORDERS'],
         "bulk_delete",
         {
@@ -740,7 +982,7 @@ async def delete_all_orders(
 
 # ==================== CART ROUTES ====================
 
-@app.get("/cart", response_model=Cart)
+@router.get("/cart", response_model=Cart)
 async def get_cart(current_user: User = Depends(get_current_active_user)):
     cart = await carts_collection.find_one({"customer_id": current_user.id})
     if not cart:
@@ -757,7 +999,7 @@ async def get_cart(current_user: User = Depends(get_current_active_user)):
     cart["id"] = str(cart["_id"])
     return Cart(**cart)
 
-@app.post("/cart/items")
+@router.post("/cart/items")
 async def add_to_cart(
     item: CartItem,
     current_user: User = Depends(get_current_active_user)
@@ -811,7 +1053,7 @@ async def add_to_cart(
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['CLICKSTREAM'],
         f"cart_{current_user.id}",
         {
@@ -824,7 +1066,7 @@ async def add_to_cart(
     
     return {"message": "Item added to cart"}
 
-@app.delete("/cart/items/{product_id}")
+@router.delete("/cart/items/{product_id}")
 async def remove_from_cart(
     product_id: str,
     current_user: User = Depends(get_current_active_user)
@@ -839,7 +1081,7 @@ async def remove_from_cart(
     
     return {"message": "Item removed from cart"}
 
-@app.put("/cart/items/{product_id}")
+@router.put("/cart/items/{product_id}")
 async def update_cart_item_quantity(
     product_id: str,
     quantity: int = Query(..., description="New quantity for the item"),
@@ -874,7 +1116,7 @@ async def update_cart_item_quantity(
     
     return {"message": "Cart item quantity updated"}
 
-@app.delete("/cart")
+@router.delete("/cart")
 async def clear_cart(current_user: User = Depends(get_current_active_user)):
     """Clear entire cart"""
     result = await carts_collection.update_one(
@@ -889,7 +1131,7 @@ async def clear_cart(current_user: User = Depends(get_current_active_user)):
     
     return {"message": "Cart cleared"}
 
-@app.get("/cart/summary")
+@router.get("/cart/summary")
 async def get_cart_summary(current_user: User = Depends(get_current_active_user)):
     """Get cart summary (total quantity and estimated total)"""
     cart = await carts_collection.find_one({"customer_id": current_user.id})
@@ -914,7 +1156,7 @@ async def get_cart_summary(current_user: User = Depends(get_current_active_user)
         "total": round(estimated_total, 2)
     }
 
-@app.put("/cart/items")
+@router.put("/cart/items")
 async def bulk_update_cart_items(
     items: List[CartItem],
     current_user: User = Depends(get_current_active_user)
@@ -940,7 +1182,7 @@ async def bulk_update_cart_items(
     
     return {"message": "Cart items updated"}
 
-@app.post("/cart/checkout")
+@router.post("/cart/checkout")
 async def checkout_cart(
     checkout_data: dict,
     current_user: User = Depends(get_current_active_user)
@@ -980,7 +1222,63 @@ async def checkout_cart(
         "channel": "website"
     }
     
-    result = await orders_collection.insert_one(order_data)
+    # Reserve stock first: each decrement only matches while enough stock is
+    # left, so concurrent checkouts cannot oversell or go negative
+    reserved = []
+    
+    async def release_reserved():
+        for item in reserved:
+            await products_collection.update_one(
+                {"_id": ObjectId(item["product_id"])},
+                {"$inc": {"stock_quantity": item["quantity"], "stock_margin": item["quantity"]}}
+            )
+    
+    updated_products = []
+    for item in order_items:
+        if item["quantity"] <= 0:
+            await release_reserved()
+            raise HTTPException(status_code=400, detail=f"Invalid quantity for {item['product_name']}")
+        product = await products_collection.find_one_and_update(
+            {"_id": ObjectId(item["product_id"]), "stock_quantity": {"$gte": item["quantity"]}},
+            {
+                "$inc": {"stock_quantity": -item["quantity"], "stock_margin": -item["quantity"]},
+                "$set": {"updated_at": datetime.utcnow()}
+            },
+            projection={"name": 1, "stock_quantity": 1, "low_stock_threshold": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if product is None:
+            await release_reserved()
+            raise HTTPException(status_code=409, detail=f"Insufficient stock for {item['product_name']}")
+        reserved.append(item)
+        updated_products.append((item, product))
+    
+    try:
+        result = await orders_collection.insert_one(order_data)
+    except Exception:
+        await release_reserved()
+        raise
+    customer_profiles.invalidate(current_user.id)
+    
+    # Feed each new stock level to stock monitoring
+    for item, product in updated_products:
+        send_kafka_event(
+            get_shared_producer(),
+            TOPICS['INVENTORY'],
+            f"product_{item['product_id']}",
+            {
+                "event_type": "stock_updated",
+                "product_id": item["product_id"],
+                "product_name": product.get("name"),
+                "stock_quantity": product.get("stock_quantity", 0),
+                "reason": "checkout",
+                "order_id": str(result.inserted_id)
+            }
+        )
+        await handle_stock_change(
+            item["product_id"], product.get("name"), product.get("stock_quantity", 0),
+            product.get("low_stock_threshold", DEFAULT_LOW_STOCK_THRESHOLD)
+        )
     
     # Clear cart after successful order
     await carts_collection.update_one(
@@ -995,7 +1293,7 @@ async def checkout_cart(
     
     # Send Kafka event
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         TOPICS['ORDERS'],
         f"order_{result.inserted_id}",
         {
@@ -1010,7 +1308,7 @@ async def checkout_cart(
 
 # ==================== EVENT TRACKING ====================
 
-@app.post("/events")
+@router.post("/events")
 async def track_event(event: Event):
     await events_collection.insert_one(event.dict())
     
@@ -1022,7 +1320,7 @@ async def track_event(event: Event):
         topic = TOPICS['PAYMENTS']
     
     send_kafka_event(
-        kafka_producer,
+        get_shared_producer(),
         topic,
         f"event_{event.customer_id or 'anonymous'}",
         {
@@ -1039,7 +1337,7 @@ async def track_event(event: Event):
 
 # ==================== ADMIN DASHBOARD ROUTES ====================
 
-@app.get("/admin/stats")
+@router.get("/admin/stats")
 async def get_admin_stats(current_user: User = Depends(get_current_admin_user)):
     # Get basic statistics
     total_users = await users_collection.count_documents({})
@@ -1058,7 +1356,16 @@ async def get_admin_stats(current_user: User = Depends(get_current_admin_user)):
         "total_revenue": total_revenue
     }
 
-@app.get("/admin/recent-orders")
+@router.get("/admin/stream")
+async def stream_admin_events(current_user: User = Depends(get_current_admin_stream_user)):
+    """Stream fraud verdicts, stock alerts and summary deltas as Server-Sent Events"""
+    return StreamingResponse(
+        sse_stream(event_broker, [admin_feed.TOPIC], initial=admin_feed.snapshot()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/admin/recent-orders")
 async def get_recent_orders(
     limit: int = 10,
     current_user: User = Depends(get_current_admin_user)
@@ -1098,23 +1405,39 @@ async def get_recent_orders(
 
 # ==================== REAL-TIME ANALYTICS ROUTES ====================
 
-@app.get("/analytics/fraud-summary")
+@router.get("/analytics/fraud-summary")
 async def get_fraud_summary(current_user: User = Depends(get_current_admin_user)):
     """Get fraud detection summary"""
-    return realtime_analytics.get_fraud_summary()
+    return {
+        **realtime_analytics.get_fraud_summary(),
+        "customer_profiles": customer_profiles.get_stats()
+    }
+
+@router.get("/analytics/fraud-rules")
+async def get_fraud_rules(current_user: User = Depends(get_current_admin_user)):
+    """Get loaded fraud rule version and per-rule evaluation metrics"""
+    return realtime_analytics.rule_engine.get_metrics()
+
+@router.post("/analytics/fraud-rules/reload")
+async def reload_fraud_rules(current_user: User = Depends(get_current_admin_user)):
+    """Recompile fraud rules from disk without a restart"""
+    engine = realtime_analytics.rule_engine
+    if not engine.reload():
+        raise HTTPException(status_code=400, detail=f"Invalid fraud rules: {engine.last_error}")
+    return {"message": "Fraud rules reloaded", "version": engine.version}
 
-@app.get("/analytics/stock-alerts")
+@router.get("/analytics/stock-alerts")
 async def get_stock_alerts_summary(current_user: User = Depends(get_current_admin_user)):
     """Get stock alerts summary"""
     return realtime_analytics.get_stock_alerts_summary()
 
-@app.get("/analytics/order-tracking/{order_id}")
+@router.get("/analytics/order-tracking/{order_id}")
 async def get_order_tracking(
     order_id: str,
     current_user: User = Depends(get_current_active_user)
 ):
     """Get real-time order tracking information"""
-    tracking_info = realtime_analytics.get_order_tracking_info(order_id)
+    tracking_info = await order_tracker.get_order_tracking_info(order_id)
     if not tracking_info:
         raise HTTPException(status_code=404, detail="Order tracking not found")
     
@@ -1124,16 +1447,17 @@ async def get_order_tracking(
     
     return tracking_info
 
-@app.post("/analytics/fraud-check")
+@router.post("/analytics/fraud-check")
 async def check_transaction_fraud(
     transaction_data: dict,
     current_user: User = Depends(get_current_admin_user)
 ):
     """Check transaction for potential fraud"""
-    fraud_result = realtime_analytics.analyze_transaction_fraud(transaction_data)
+    customer_profile = await customer_profiles.get(transaction_data.get("customer_id"))
+    fraud_result = await realtime_analytics.analyze_transaction_fraud_async(transaction_data, customer_profile)
     
     # Send fraud detection event to Kafka
-    send_fraud_event(kafka_producer, {
+    send_fraud_event(get_shared_producer(), {
         **transaction_data,
         "fraud_analysis": fraud_result,
         "analyzed_by": current_user.email
@@ -1151,7 +1475,7 @@ async def check_transaction_fraud(
     
     return fraud_result
 
-@app.post("/analytics/stock-monitor")
+@router.post("/analytics/stock-monitor")
 async def monitor_stock_level(
     product_id: str,
     product_name: str,
@@ -1160,12 +1484,19 @@ async def monitor_stock_level(
     current_user: User = Depends(get_current_admin_user)
 ):
     """Monitor stock levels and generate alerts"""
+    # Persist an explicit threshold so the low-stock scanner uses it too
+    if threshold is not None and ObjectId.is_valid(product_id):
+        await products_collection.update_one(
+            {"_id": ObjectId(product_id)}, {"$set": {"low_stock_threshold": threshold}}
+        )
+        await update_stock_margin(product_id)
+    
     alert_info = realtime_analytics.monitor_stock_levels(
         product_id, product_name, current_stock, threshold
     )
     
     # Send stock alert to Kafka
-    send_stock_alert(kafka_producer, alert_info)
+    send_stock_alert(get_shared_producer(), alert_info)
     
     # Send notification if alert needed
     if alert_info["alert_needed"]:
@@ -1175,7 +1506,7 @@ async def monitor_stock_level(
     
     return alert_info
 
-@app.post("/feedback")
+@router.post("/feedback")
 async def submit_feedback(
     feedback_data: dict,
     current_user: User = Depends(get_current_active_user)
@@ -1210,7 +1541,7 @@ async def submit_feedback(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Feedback submission failed: {str(e)}")
 
-@app.post("/feedback/test")
+@router.post("/feedback/test")
 async def submit_feedback_test(feedback_data: dict):
     """Submit customer feedback for sentiment analysis (no auth required)"""
     try:
@@ -1242,7 +1573,7 @@ async def submit_feedback_test(feedback_data: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Feedback submission failed: {str(e)}")
 
-@app.get("/feedback/summary")
+@router.get("/feedback/summary")
 async def get_feedback_summary(
     current_user: User = Depends(get_current_active_user)
 ):
@@ -1265,7 +1596,7 @@ async def get_feedback_summary(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get feedback summary: {str(e)}")
 
-@app.get("/feedback/product/{product_id}")
+@router.get("/feedback/product/{product_id}")
 async def get_product_feedback(product_id: str):
     """Get feedback for a specific product"""
     try:
@@ -1305,7 +1636,7 @@ async def get_product_feedback(product_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get product feedback: {str(e)}")
 
-@app.get("/feedback/all")
+@router.get("/feedback/all")
 async def get_all_feedback(
     current_user: User = Depends(get_current_admin_user)
 ):
@@ -1351,7 +1682,7 @@ async def get_all_feedback(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get all feedback: {str(e)}")
 
-@app.post("/notifications/test")
+@router.post("/notifications/test")
 async def test_notification(
     notification_type: str,
     test_data: dict,
@@ -1384,7 +1715,102 @@ async def test_notification(
     else:
         raise HTTPException(status_code=400, detail="Invalid notification type")
     
-    return {"message": f"Test {notification_type} notification sent"}
+    return {"message": f"Test {notification_type} notification queued"}
+
+@router.get("/notifications/stats")
+async def get_notification_stats(current_user: User = Depends(get_current_admin_user)):
+    """Get background notification delivery statistics"""
+    return {
+        **notification_dispatcher.get_stats(),
+        "smtp_pool": notification_service.smtp_pool.get_stats(),
+        "webhooks": notification_service.webhook_client.get_stats(),
+        "alert_coalescing": notification_service.coalescer.get_stats()
+    }
+
+@router.get("/admin/db-pool")
+async def get_db_pool_stats(current_user: User = Depends(get_current_admin_user)):
+    """Get MongoDB connection pool utilization"""
+    return pool_metrics.get_stats()
+
+@router.get("/admin/profile")
+async def profile_worker(
+    seconds: float = Query(10, gt=0),
+    mode: str = Query("cpu", pattern="^(cpu|alloc)$"),
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+    interval_ms: float = Query(10, ge=1),
+    all_threads: bool = False,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Profile the worker serving this request: sampled CPU stacks or tracemalloc allocation sites"""
+    try:
+        if mode == "cpu":
+            result = await profiler.profile_cpu(seconds, interval_ms / 1000, all_threads=all_threads)
+        else:
+            result = await profiler.profile_alloc(seconds)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    headers = {"X-Worker-Pid": str(os.getpid())}
+    if format == "collapsed":
+        # Feed to flamegraph.pl or drop into speedscope.app
+        return PlainTextResponse(result["collapsed"] + "\n", headers=headers)
+    return JSONResponse({**result, "pid": os.getpid()}, headers=headers)
+
+@router.get("/admin/db-metrics")
+async def get_db_route_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Get per-route MongoDB command counts, DB time and documents returned"""
+    return route_db_metrics.get_stats()
+
+def create_app() -> FastAPI:
+    """Build the API: logging, middleware, routes and lifecycle hooks.
+
+    Clients (MongoDB, Kafka, SMTP, webhooks) are created on first use or in
+    the startup event, never here. Run with `uvicorn main:create_app --factory`
+    or `uvicorn main:app`.
+    """
+    configure_logging()
+    app = FastAPI(
+        title="E-commerce BigData Platform API",
+        description="Complete e-commerce platform with JWT authentication, admin panel, and big data analytics",
+        version="1.0.0"
+    )
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000", "http://localhost:3001"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing", "X-DB-Commands", "X-DB-Time-Ms", "X-DB-Documents"],
+    )
+
+    # Per-request MongoDB command counts, time and documents (headers + /admin/db-metrics)
+    app.add_middleware(
+        DBInstrumentationMiddleware,
+        metrics=route_db_metrics,
+        headers=os.getenv("DB_TIMING_HEADERS", "true").lower() == "true",
+    )
+
+    # Per-route latency histograms, status codes and in-flight requests (GET /metrics); outermost
+    app.add_middleware(MetricsMiddleware, registry=metrics)
+
+    for collector in (collect_subsystem_metrics, loop_watchdog.collect):
+        if collector not in metrics.collectors:
+            metrics.add_collector(collector)
+
+    app.include_router(router)
+    app.add_event_handler("startup", startup_event)
+    app.add_event_handler("shutdown", shutdown_event)
+    return app
+
+def __getattr__(name):
+    # `uvicorn main:app` and `from main import app` build the app on first access
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    import uvicorn
+    uvicorn.run("main:create_app", factory=True, host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; request latency and Kafka delivery latency
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# A collector returns (name, type, help, samples) where samples are
+# (labels dict, value) pairs; called at scrape time only
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is one bisect and three increments"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: Dict[str, str]) -> List[str]:
+        out = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            out.append(f'{name}_bucket{_labels({**labels, "le": _number(float(bound))})} {cumulative}')
+        out.append(f'{name}_sum{_labels(labels)} {_number(self.sum)}')
+        out.append(f'{name}_count{_labels(labels)} {self.count}')
+        return out
+
+
+class MetricsRegistry:
+    """Process metrics in Prometheus text exposition format.
+
+    Request metrics are recorded inline by MetricsMiddleware; everything owned
+    by another subsystem (Mongo pool, Kafka queue, analytics state) is read by
+    collectors at scrape time, so it costs nothing per request. All updates
+    happen on the event loop thread except Kafka delivery reports, which
+    confluent_kafka delivers from poll() on the calling thread.
+    """
+
+    def __init__(self):
+        self.request_latency: Dict[Tuple[str, str], Histogram] = {}
+        self.requests_total: Dict[Tuple[str, str, int], int] = {}
+        self.in_flight = 0
+        self.streams_open = 0
+        self.loop_lag = Histogram(LOOP_LAG_BUCKETS)
+        self.loop_lag_last = 0.0
+        self.kafka_delivery = Histogram()
+        self.kafka_delivery_failures = 0
+        self.collectors: List[Collector] = []
+        self._lag_task: Optional[asyncio.Task] = None
+        self.started_at = time.time()
+
+    def observe_request(self, method: str, route: str, status: int, seconds: Optional[float]):
+        """Count a finished request; `seconds` is None for streams, which stay out of the latency histogram"""
+        if seconds is not None:
+            key = (method, route)
+            histogram = self.request_latency.get(key)
+            if histogram is None:
+                histogram = self.request_latency[key] = Histogram()
+            histogram.observe(seconds)
+        key = (method, route, status)
+        self.requests_total[key] = self.requests_total.get(key, 0) + 1
+
+    def observe_kafka_delivery(self, seconds: Optional[float], failed: bool = False):
+        if failed:
+            self.kafka_delivery_failures += 1
+        elif seconds is not None:
+            self.kafka_delivery.observe(seconds)
+
+    def add_collector(self, collector: Collector):
+        self.collectors.append(collector)
+
+    async def _measure_loop_lag(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - expected)
+            self.loop_lag_last = lag
+            self.loop_lag.observe(lag)
+
+    def start(self, loop_lag_interval: Optional[float] = None):
+        """Start the event-loop lag probe (call from the app startup event)"""
+        interval = loop_lag_interval or float(os.getenv('METRICS_LOOP_LAG_INTERVAL_SECONDS', '0.5'))
+        if self._lag_task is None and interval > 0:
+            self._lag_task = asyncio.create_task(self._measure_loop_lag(interval))
+
+    def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+    def render(self) -> str:
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route template',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (method, route), histogram in self.request_latency.items():
+            lines.extend(histogram.lines('http_request_duration_seconds', {'method': method, 'route': route}))
+        lines += ['# HELP http_requests_total Requests by route template and status code',
+                  '# TYPE http_requests_total counter']
+        for (method, route, status), count in self.requests_total.items():
+            lines.append(f'http_requests_total{_labels({"method": method, "route": route, "status": str(status)})} {count}')
+        lines += ['# HELP http_requests_in_flight Requests currently being served',
+                  '# TYPE http_requests_in_flight gauge',
+                  f'http_requests_in_flight {self.in_flight}',
+                  '# HELP http_streams_open Server-sent event streams currently connected',
+                  '# TYPE http_streams_open gauge',
+                  f'http_streams_open {self.streams_open}',
+                  '# HELP event_loop_lag_seconds Delay of the lag probe beyond its scheduled wake-up',
+                  '# TYPE event_loop_lag_seconds histogram']
+        lines.extend(self.loop_lag.lines('event_loop_lag_seconds', {}))
+        lines += ['# HELP event_loop_lag_last_seconds Most recent event loop lag sample',
+                  '# TYPE event_loop_lag_last_seconds gauge',
+                  f'event_loop_lag_last_seconds {_number(self.loop_lag_last)}',
+                  '# HELP kafka_delivery_latency_seconds Time from produce() to broker acknowledgement',
+                  '# TYPE kafka_delivery_latency_seconds histogram']
+        lines.extend(self.kafka_delivery.lines('kafka_delivery_latency_seconds', {}))
+        lines += ['# HELP kafka_delivery_failures_total Messages the producer failed to deliver',
+                  '# TYPE kafka_delivery_failures_total counter',
+                  f'kafka_delivery_failures_total {self.kafka_delivery_failures}',
+                  '# HELP process_start_time_seconds Start time of the process since the Unix epoch',
+                  '# TYPE process_start_time_seconds gauge',
+                  f'process_start_time_seconds {_number(self.started_at)}']
+
+        for collector in self.collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning("⚠️ Metrics collector failed: %s", e)
+                continue
+            for name, metric_type, help_text, samples in families:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and in-flight count per route template.
+
+    Server-sent event responses stay connected for minutes: once one starts
+    it moves from the in-flight gauge to the open-streams gauge, and it is
+    counted by status but kept out of the latency histogram.
+    """
+
+    def __init__(self, app, registry: 'MetricsRegistry'):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        status = 500
+        streaming = False
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status, streaming
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                for name, value in message.get('headers', ()):
+                    if name.lower() == b'content-type' and value.startswith(b'text/event-stream'):
+                        streaming = True
+                        registry.in_flight -= 1
+                        registry.streams_open += 1
+                        break
+            await send(message)
+
+        registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if streaming:
+                registry.streams_open -= 1
+            else:
+                registry.in_flight -= 1
+            # The router records the matched route (with its path template) in the scope
+            route = scope.get('route')
+            registry.observe_request(scope['method'], route.path if route is not None else 'unmatched',
+                                     status, None if streaming else time.perf_counter() - started)
+
+
+# Global metrics instance
+metrics = MetricsRegistry()
@@ -29,6 +29,7 @@ class Product(BaseModel):
     price: float
     category: str
     stock_quantity: int
+    low_stock_threshold: int = 10
     image_url: Optional[str] = None
     sku: Optional[str] = None
     brand: Optional[str] = None
@@ -43,6 +44,7 @@ class ProductUpdate(BaseModel):
     price: Optional[float] = None
     category: Optional[str] = None
     stock_quantity: Optional[int] = None
+    low_stock_threshold: Optional[int] = None
     image_url: Optional[str] = None
     sku: Optional[str] = None
     brand: Optional[str] = None
@@ -139,6 +141,7 @@ class ProductResponse(BaseModel):
     price: float
     category: str
     stock_quantity: int
+    low_stock_threshold: int = 10
     image_url: Optional[str] = None
     sku: Optional[str] = None
     brand: Optional[str] = None
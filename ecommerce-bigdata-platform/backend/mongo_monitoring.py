@@ -0,0 +1,229 @@
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from pymongo import monitoring
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool utilization, fed by PyMongo's pool events.
+
+    PyMongo calls listeners from whichever thread touched the pool, so the
+    counters are updated under a lock. With a replica set there is one pool
+    per server and the counts are summed across them.
+    """
+
+    def __init__(self, max_pool_size: int = 100):
+        self._lock = threading.Lock()
+        self.max_pool_size = max_pool_size
+        self.open = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.stats = {
+            'connections_created': 0, 'connections_closed': 0, 'checkouts': 0,
+            'checkout_failures': 0, 'wait_queue_timeouts': 0, 'pool_clears': 0,
+        }
+        self._checkout_wait_total = 0.0
+        self.max_checkout_wait = 0.0
+
+    def pool_created(self, event):
+        with self._lock:
+            self.max_pool_size = event.options.get('maxPoolSize', self.max_pool_size)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.stats['pool_clears'] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+            self.stats['connections_created'] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+            self.stats['connections_closed'] += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.stats['checkout_failures'] += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.stats['wait_queue_timeouts'] += 1
+
+    def connection_checked_out(self, event):
+        # duration (seconds spent waiting for a connection) is reported by PyMongo >= 4.7
+        wait = getattr(event, 'duration', 0.0) or 0.0
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.stats['checkouts'] += 1
+            self._checkout_wait_total += wait
+            self.max_checkout_wait = max(self.max_checkout_wait, wait)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            checkouts = self.stats['checkouts']
+            return {
+                **self.stats,
+                'max_pool_size': self.max_pool_size,
+                'open_connections': self.open,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'utilization': round(self.in_use / self.max_pool_size, 3) if self.max_pool_size else None,
+                'avg_checkout_wait_ms': round(self._checkout_wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                'max_checkout_wait_ms': round(self.max_checkout_wait * 1000, 3),
+            }
+
+
+class RequestDBStats:
+    """Database work done on behalf of one HTTP request"""
+
+    __slots__ = ('commands', 'failures', 'duration_micros', 'documents', 'by_command', '_lock')
+
+    def __init__(self):
+        self.commands = 0
+        self.failures = 0
+        self.duration_micros = 0
+        self.documents = 0
+        self.by_command: Dict[str, int] = {}
+        # Concurrent queries in one request report from different executor threads
+        self._lock = threading.Lock()
+
+    def add(self, command_name: str, duration_micros: int, documents: int, failed: bool = False):
+        with self._lock:
+            self.commands += 1
+            self.failures += failed
+            self.duration_micros += duration_micros
+            self.documents += documents
+            self.by_command[command_name] = self.by_command.get(command_name, 0) + 1
+
+
+# The stats object of the request being served; Motor copies the context into
+# the executor threads that run PyMongo, so listeners can read it
+current_db_stats: ContextVar[Optional[RequestDBStats]] = ContextVar('current_db_stats', default=None)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Attributes every MongoDB command to the request that issued it (if any)"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        stats = current_db_stats.get()
+        if stats is None:
+            return  # Background work (scanners, consumers, startup)
+        cursor = event.reply.get('cursor')
+        documents = 0
+        if cursor:
+            documents = len(cursor.get('firstBatch') or cursor.get('nextBatch') or ())
+        elif event.reply.get('value') is not None:
+            documents = 1  # findAndModify
+        stats.add(event.command_name, event.duration_micros, documents)
+
+    def failed(self, event):
+        stats = current_db_stats.get()
+        if stats is not None:
+            stats.add(event.command_name, event.duration_micros, 0, failed=True)
+
+
+class RouteDBMetrics:
+    """Per-route totals of requests, commands, DB time and documents returned"""
+
+    def __init__(self):
+        self.routes: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, route: str, stats: RequestDBStats, elapsed: float):
+        entry = self.routes.get(route)
+        if entry is None:
+            entry = self.routes[route] = {
+                'requests': 0, 'commands': 0, 'failures': 0, 'db_time_ms': 0.0, 'documents': 0,
+                'request_time_ms': 0.0, 'max_commands': 0, 'by_command': {},
+            }
+        entry['requests'] += 1
+        entry['commands'] += stats.commands
+        entry['failures'] += stats.failures
+        entry['db_time_ms'] += stats.duration_micros / 1000
+        entry['documents'] += stats.documents
+        entry['request_time_ms'] += elapsed * 1000
+        entry['max_commands'] = max(entry['max_commands'], stats.commands)
+        by_command = entry['by_command']
+        for name, count in stats.by_command.items():
+            by_command[name] = by_command.get(name, 0) + count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Routes ordered by commands per request, so N+1 patterns sort to the top"""
+        routes = []
+        for route, entry in self.routes.items():
+            requests = entry['requests']
+            routes.append({
+                'route': route,
+                **entry,
+                'db_time_ms': round(entry['db_time_ms'], 3),
+                'request_time_ms': round(entry['request_time_ms'], 3),
+                'commands_per_request': round(entry['commands'] / requests, 2),
+                'avg_db_time_ms': round(entry['db_time_ms'] / requests, 3),
+                'db_time_share': round(entry['db_time_ms'] / entry['request_time_ms'], 3) if entry['request_time_ms'] else 0.0,
+            })
+        routes.sort(key=lambda r: r['commands_per_request'], reverse=True)
+        return {'routes': routes}
+
+
+class DBInstrumentationMiddleware:
+    """ASGI middleware: collects each request's MongoDB work, reports it in
+    response headers and adds it to the per-route metrics.
+
+    Headers reflect the work done before the response started; commands run
+    while a streaming body is being sent are only counted in the metrics.
+    """
+
+    def __init__(self, app, metrics: RouteDBMetrics, headers: bool = True):
+        self.app = app
+        self.metrics = metrics
+        self.headers = headers
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestDBStats()
+        token = current_db_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if self.headers and message['type'] == 'http.response.start':
+                db_ms = stats.duration_micros / 1000
+                message['headers'] = list(message.get('headers', [])) + [
+                    (b'server-timing', f'db;dur={db_ms:.2f};desc="{stats.commands} commands"'.encode()),
+                    (b'x-db-commands', str(stats.commands).encode()),
+                    (b'x-db-time-ms', f'{db_ms:.2f}'.encode()),
+                    (b'x-db-documents', str(stats.documents).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_db_stats.reset(token)
+            # The router records the matched route (with its path template) in the scope
+            route = scope.get('route')
+            route_name = f"{scope['method']} {route.path}" if route is not None else 'unmatched'
+            self.metrics.record(route_name, stats, time.perf_counter() - started)
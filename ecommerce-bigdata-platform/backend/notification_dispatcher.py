@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_new')
+
+
+class NotificationJob:
+    """One delivery attempt to make: a send function (or coroutine function) that returns True on success"""
+
+    __slots__ = ('send', 'args', 'description', 'attempts', 'retry')
+
+    def __init__(self, send: Callable[..., bool], args: tuple, description: str, retry: bool = True):
+        self.send = send
+        self.args = args
+        self.description = description
+        self.attempts = 0
+        self.retry = retry
+
+
+class NotificationDispatcher:
+    """Bounded background queue that delivers notifications off the request path.
+
+    Handlers only enqueue; a fixed pool of workers runs blocking sends (SMTP)
+    on a dedicated thread pool and awaits async ones (webhooks). Failed
+    deliveries are retried with jittered exponential backoff without holding
+    a worker, and when the queue is full the overflow policy decides which
+    notification is dropped.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 max_retries: Optional[int] = None, backoff: Optional[float] = None,
+                 overflow: Optional[str] = None):
+        self.workers = workers or int(os.getenv('NOTIFICATION_WORKERS', '4'))
+        self.queue_size = queue_size or int(os.getenv('NOTIFICATION_QUEUE_SIZE', '1000'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('NOTIFICATION_MAX_RETRIES', '3'))
+        self.backoff = backoff or float(os.getenv('NOTIFICATION_RETRY_BACKOFF_SECONDS', '1'))
+        self.overflow = overflow or os.getenv('NOTIFICATION_OVERFLOW_POLICY', 'drop_oldest')
+        if self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"NOTIFICATION_OVERFLOW_POLICY must be one of {OVERFLOW_POLICIES}")
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks = []
+        self._retries: Set[asyncio.TimerHandle] = set()
+        self.stats = {'queued': 0, 'delivered': 0, 'retried': 0, 'failed': 0, 'dropped': 0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Start the worker pool (call from the app startup event)"""
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='notify')
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, send: Callable[..., bool], *args: Any, description: str = 'notification',
+               retry: bool = True) -> bool:
+        """Queue a delivery; returns False if it was dropped.
+
+        Pass retry=False for sends that already retry internally (webhooks),
+        so failures are not retried a second time here.
+        """
+        return self._enqueue(NotificationJob(send, args, description, retry))
+
+    def _enqueue(self, job: NotificationJob) -> bool:
+        if self._queue.full():
+            if self.overflow == 'drop_new':
+                self.stats['dropped'] += 1
+                logger.warning("⚠️ Notification queue full, dropping %s", job.description)
+                return False
+            dropped = self._queue.get_nowait()
+            self._queue.task_done()
+            self.stats['dropped'] += 1
+            logger.warning("⚠️ Notification queue full, dropping oldest (%s)", dropped.description)
+        self._queue.put_nowait(job)
+        self.stats['queued'] += 1
+        return True
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                if asyncio.iscoroutinefunction(job.send):
+                    delivered = await job.send(*job.args)
+                else:
+                    delivered = await loop.run_in_executor(self._executor, job.send, *job.args)
+            except Exception as e:
+                logger.error("❌ Notification %s raised: %s", job.description, e)
+                delivered = False
+            finally:
+                self._queue.task_done()
+            if delivered:
+                self.stats['delivered'] += 1
+            else:
+                self._schedule_retry(job)
+
+    def _schedule_retry(self, job: NotificationJob):
+        job.attempts += 1
+        if not job.retry or job.attempts > self.max_retries:
+            self.stats['failed'] += 1
+            logger.error("❌ Giving up on %s after %d attempts", job.description, job.attempts)
+            return
+        self.stats['retried'] += 1
+        delay = self.backoff * (2 ** (job.attempts - 1)) * random.uniform(0.5, 1.5)
+        handle = None
+
+        def retry():
+            self._retries.discard(handle)
+            self._enqueue(job)
+
+        handle = asyncio.get_running_loop().call_later(delay, retry)
+        self._retries.add(handle)
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Give queued notifications a bounded time to go out, then stop the workers"""
+        if not self.running:
+            return
+        timeout = timeout if timeout is not None else float(os.getenv('NOTIFICATION_DRAIN_SECONDS', '5'))
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Shutting down with %d notifications undelivered", self._queue.qsize())
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'pending': self._queue.qsize() if self._queue else 0,
+            'retry_scheduled': len(self._retries),
+            'workers': self.workers,
+            'overflow_policy': self.overflow,
+        }
+
+
+# Global notification dispatcher instance
+notification_dispatcher = NotificationDispatcher()
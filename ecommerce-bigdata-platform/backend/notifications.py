@@ -1,19 +1,37 @@
 import os
 import json
-import smtplib
-import requests
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import asyncio
+import logging
 from datetime import datetime
-from typing import Dict, Any, List, Optional
-from dotenv import load_dotenv
+from typing import Dict, Any, List, Optional, Tuple
 
-load_dotenv()
+from notification_dispatcher import NotificationDispatcher, notification_dispatcher
+from smtp_pool import SMTPConnectionPool
+from webhook_client import WebhookClient, webhook_client
+from alert_coalescer import AlertCoalescer, SEND
+from email_templates import RawEmail, build_mime, get_digest_template, get_template
+from settings import load_env
+
+logger = logging.getLogger(__name__)
+
+# Compiled once at startup
+ORDER_STATUS_TEMPLATE = get_template('order_status_change')
+STOCK_ALERT_TEMPLATE = get_template('stock_alert')
+FRAUD_ALERT_TEMPLATE = get_template('fraud_alert')
+PAYMENT_SUCCESS_TEMPLATE = get_template('payment_success')
+PAYMENT_FAILURE_TEMPLATE = get_template('payment_failure')
+DIGEST_TEMPLATES = {
+    'stock': get_digest_template('stock_alert_digest'),
+    'fraud': get_digest_template('fraud_alert_digest'),
+}
+
+load_env()
 
 class NotificationService:
     """Real-time notification service for ecommerce platform"""
     
-    def __init__(self):
+    def __init__(self, dispatcher: Optional[NotificationDispatcher] = None,
+                 webhooks: Optional[WebhookClient] = None):
         self.smtp_server = os.getenv('SMTP_SERVER', 'smtp.freesmtpservers.com')
         self.smtp_port = int(os.getenv('SMTP_PORT', '25'))
         self.smtp_username = os.getenv('SMTP_USERNAME', '')
@@ -24,100 +42,109 @@ class NotificationService:
         # Check if using free SMTP server (no auth required)
         self.requires_auth = bool(self.smtp_username and self.smtp_password)
         
+        # Authenticated SMTP sessions are kept open and reused across messages
+        self.smtp_pool = SMTPConnectionPool(
+            self.smtp_server, self.smtp_port, self.smtp_username, self.smtp_password
+        )
+        
+        # Keep-alive webhook connections shared by all notifications
+        self.webhook_client = webhooks or WebhookClient()
+        
+        # Admin alerts: duplicates within the window are dropped and bursts become digests
+        self.coalescer = AlertCoalescer(self._send_alert_digest)
+        
+        # Background delivery; without a running dispatcher (e.g. scripts) sends are synchronous
+        self.dispatcher = dispatcher
+    
+    def _deliver(self, send, *args, description: str = 'notification', retry: bool = True):
+        if self.dispatcher is not None and self.dispatcher.running:
+            return self.dispatcher.submit(send, *args, description=description, retry=retry)
+        if asyncio.iscoroutinefunction(send):
+            try:
+                return asyncio.get_running_loop().create_task(send(*args))
+            except RuntimeError:
+                return asyncio.run(send(*args))
+        return send(*args)
+    
+    def queue_email(self, to_email: str, subject: str, body: str, html_body: Optional[str] = None):
+        """Send an email in the background when the dispatcher is running"""
+        return self._deliver(self.send_email, to_email, subject, body, html_body,
+                             description=f"email '{subject}'")
+    
+    def queue_webhook(self, payload: Dict[str, Any]):
+        """Send a webhook in the background when the dispatcher is running"""
+        if not self.webhook_url:
+            return False
+        # The webhook client retries with backoff and short-circuits failing
+        # endpoints itself; the dispatcher must not retry (or re-queue) on top
+        return self._deliver(self.send_webhook, payload, retry=False,
+                             description=f"webhook {payload.get('type', 'unknown')}")
+        
+    def _build_email(self, to_email: str, subject: str, body: str, html_body: Optional[str] = None) -> RawEmail:
+        from_addr = self.smtp_username if self.smtp_username else 'noreply@ecommerce.com'
+        return build_mime(from_addr, to_email, subject, body, html_body)
+    
     def send_email(self, to_email: str, subject: str, body: str, html_body: Optional[str] = None):
         """Send email notification"""
         try:
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.smtp_username if self.smtp_username else 'noreply@ecommerce.com'
-            msg['To'] = to_email
-            
-            # Add text and HTML parts
-            text_part = MIMEText(body, 'plain')
-            msg.attach(text_part)
-            
-            if html_body:
-                html_part = MIMEText(html_body, 'html')
-                msg.attach(html_part)
-            
-            # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                # Only use authentication if credentials are provided
-                if self.requires_auth:
-                    server.starttls()
-                    server.login(self.smtp_username, self.smtp_password)
-                
-                server.send_message(msg)
-                
-            print(f"✅ Email notification sent to {to_email}: {subject}")
+            self.smtp_pool.send_message(self._build_email(to_email, subject, body, html_body))
+            logger.info("✅ Email notification sent to %s: %s", to_email, subject, extra={"event": "notification.email_sent"})
             return True
             
         except Exception as e:
-            print(f"❌ Failed to send email notification: {e}")
+            logger.error("❌ Failed to send email notification: %s", e)
             return False
     
-    def send_webhook(self, payload: Dict[str, Any]):
-        """Send webhook notification"""
+    def queue_bulk_emails(self, template_name: str, recipients: List[Tuple[str, Dict[str, Any]]]):
+        """Render one template for many (to_email, context) recipients and send them as one batch"""
+        rendered = get_template(template_name).render_many(context for _, context in recipients)
+        emails = [(to_email, *email) for (to_email, _), email in zip(recipients, rendered)]
+        return self._deliver(self.send_bulk_emails, emails,
+                             description=f"{len(emails)} '{template_name}' emails")
+    
+    def send_bulk_emails(self, emails: List[Tuple[str, str, str, Optional[str]]]) -> int:
+        """Send (to_email, subject, body, html_body) emails over one SMTP session; returns how many were sent"""
         try:
-            if not self.webhook_url:
-                print("⚠️ No webhook URL configured")
-                return False
-                
-            response = requests.post(
-                self.webhook_url,
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                print(f"✅ Webhook notification sent: {payload.get('type', 'unknown')}")
-                return True
-            else:
-                print(f"❌ Webhook failed with status {response.status_code}")
-                return False
-                
+            sent = self.smtp_pool.send_messages(self._build_email(*email) for email in emails)
+            logger.info("✅ Sent %d/%d email notifications", sent, len(emails), extra={"event": "notification.bulk_sent"})
+            return sent
         except Exception as e:
-            print(f"❌ Failed to send webhook notification: {e}")
+            logger.error("❌ Failed to send bulk email notifications: %s", e)
+            return 0
+    
+    def flush(self):
+        """Release held alert digests to the dispatcher (call on shutdown, before it stops)"""
+        self.coalescer.flush_all()
+    
+    async def close(self):
+        """Post batched webhooks and close pooled connections (call after the dispatcher stopped)"""
+        self.coalescer.flush_all()  # No-op after flush(); covers use without a dispatcher
+        await self.webhook_client.close()
+        self.smtp_pool.close()
+    
+    async def send_webhook(self, payload: Dict[str, Any]):
+        """Send webhook notification"""
+        if not self.webhook_url:
+            logger.debug("No webhook URL configured")
             return False
+        
+        if await self.webhook_client.send(self.webhook_url, payload):
+            logger.info("✅ Webhook notification sent: %s", payload.get("type", "unknown"), extra={"event": "notification.webhook_sent"})
+            return True
+        return False
     
     def notify_order_status_change(self, order_id: str, customer_email: str, 
                                  old_status: str, new_status: str, order_details: Dict[str, Any]):
         """Notify customer about order status change"""
-        subject = f"Order #{order_id} Status Update: {new_status.title()}"
-        
-        body = f"""
-        Your order status has been updated!
-        
-        Order ID: {order_id}
-        Previous Status: {old_status.title()}
-        New Status: {new_status.title()}
-        Total Amount: ${order_details.get('total_amount', 0):.2f}
-        
-        Track your order at: http://localhost:3000/orders/{order_id}
-        
-        Thank you for shopping with us!
-        """
-        
-        html_body = f"""
-        <html>
-        <body>
-            <h2>Order Status Update</h2>
-            <p>Your order status has been updated!</p>
-            <table>
-                <tr><td><strong>Order ID:</strong></td><td>{order_id}</td></tr>
-                <tr><td><strong>Previous Status:</strong></td><td>{old_status.title()}</td></tr>
-                <tr><td><strong>New Status:</strong></td><td>{new_status.title()}</td></tr>
-                <tr><td><strong>Total Amount:</strong></td><td>${order_details.get('total_amount', 0):.2f}</td></tr>
-            </table>
-            <p><a href="http://localhost:3000/orders/{order_id}">Track your order</a></p>
-            <p>Thank you for shopping with us!</p>
-        </body>
-        </html>
-        """
+        email = ORDER_STATUS_TEMPLATE.render({
+            "order_id": order_id,
+            "old_status_title": old_status.title(),
+            "new_status_title": new_status.title(),
+            "total_amount": order_details.get('total_amount', 0)
+        })
         
         # Send email to customer
-        self.send_email(customer_email, subject, body, html_body)
+        self.queue_email(customer_email, *email)
         
         # Send webhook for real-time updates
         webhook_payload = {
@@ -129,41 +156,27 @@ class NotificationService:
             "timestamp": datetime.utcnow().isoformat(),
             "order_details": order_details
         }
-        self.send_webhook(webhook_payload)
+        self.queue_webhook(webhook_payload)
     
     def notify_stock_alert(self, product_id: str, product_name: str, 
                           current_stock: int, threshold: int = 10):
         """Notify admin about low stock"""
-        subject = f"🚨 Low Stock Alert: {product_name}"
-        
-        body = f"""
-        LOW STOCK ALERT!
-        
-        Product: {product_name}
-        Product ID: {product_id}
-        Current Stock: {current_stock}
-        Threshold: {threshold}
-        
-        Please restock this item immediately!
-        """
+        severity = "high" if current_stock <= 5 else "medium"
+        alert = {
+            "product_id": product_id,
+            "product_name": product_name,
+            "current_stock": current_stock,
+            "threshold": threshold,
+            "severity": severity
+        }
+        # Re-alert a product only when it gets worse, and digest bursts (e.g. flash sales)
+        if self.coalescer.offer("stock", (product_id, severity), alert) != SEND:
+            return
         
-        html_body = f"""
-        <html>
-        <body>
-            <h2 style="color: red;">🚨 Low Stock Alert</h2>
-            <table>
-                <tr><td><strong>Product:</strong></td><td>{product_name}</td></tr>
-                <tr><td><strong>Product ID:</strong></td><td>{product_id}</td></tr>
-                <tr><td><strong>Current Stock:</strong></td><td style="color: red;">{current_stock}</td></tr>
-                <tr><td><strong>Threshold:</strong></td><td>{threshold}</td></tr>
-            </table>
-            <p><strong>Please restock this item immediately!</strong></p>
-        </body>
-        </html>
-        """
+        email = STOCK_ALERT_TEMPLATE.render(alert)
         
         # Send email to admin
-        self.send_email(self.admin_email, subject, body, html_body)
+        self.queue_email(self.admin_email, *email)
         
         # Send webhook
         webhook_payload = {
@@ -173,45 +186,29 @@ class NotificationService:
             "current_stock": current_stock,
             "threshold": threshold,
             "timestamp": datetime.utcnow().isoformat(),
-            "severity": "high" if current_stock <= 5 else "medium"
+            "severity": severity
         }
-        self.send_webhook(webhook_payload)
+        self.queue_webhook(webhook_payload)
     
     def notify_fraud_alert(self, transaction_id: str, customer_id: str, 
                           amount: float, reason: str, risk_score: float):
         """Notify admin about potential fraud"""
-        subject = f"🚨 Fraud Alert: Transaction #{transaction_id}"
-        
-        body = f"""
-        FRAUD ALERT!
-        
-        Transaction ID: {transaction_id}
-        Customer ID: {customer_id}
-        Amount: ${amount:.2f}
-        Risk Score: {risk_score:.2f}
-        Reason: {reason}
-        
-        Please review this transaction immediately!
-        """
+        alert = {
+            "transaction_id": transaction_id,
+            "customer_id": customer_id,
+            "amount": amount,
+            "reason": reason,
+            "risk_score": risk_score
+        }
+        # Only a re-check of the same transaction is a duplicate; other flagged
+        # transactions from the customer go out (or into the digest) on their own
+        if self.coalescer.offer("fraud", (customer_id, transaction_id), alert) != SEND:
+            return
         
-        html_body = f"""
-        <html>
-        <body>
-            <h2 style="color: red;">🚨 Fraud Alert</h2>
-            <table>
-                <tr><td><strong>Transaction ID:</strong></td><td>{transaction_id}</td></tr>
-                <tr><td><strong>Customer ID:</strong></td><td>{customer_id}</td></tr>
-                <tr><td><strong>Amount:</strong></td><td>${amount:.2f}</td></tr>
-                <tr><td><strong>Risk Score:</strong></td><td style="color: red;">{risk_score:.2f}</td></tr>
-                <tr><td><strong>Reason:</strong></td><td>{reason}</td></tr>
-            </table>
-            <p><strong>Please review this transaction immediately!</strong></p>
-        </body>
-        </html>
-        """
+        email = FRAUD_ALERT_TEMPLATE.render(alert)
         
         # Send email to admin
-        self.send_email(self.admin_email, subject, body, html_body)
+        self.queue_email(self.admin_email, *email)
         
         # Send webhook
         webhook_payload = {
@@ -224,68 +221,32 @@ class NotificationService:
             "timestamp": datetime.utcnow().isoformat(),
             "severity": "high" if risk_score > 0.8 else "medium"
         }
-        self.send_webhook(webhook_payload)
+        self.queue_webhook(webhook_payload)
+    
+    def _send_alert_digest(self, kind: str, alerts: List[Dict[str, Any]], overflow: int):
+        """Send one email and one webhook summarizing a burst of stock or fraud alerts"""
+        total = len(alerts) + overflow
+        email = DIGEST_TEMPLATES[kind].render(alerts, overflow)
+        
+        self.queue_email(self.admin_email, *email)
+        self.queue_webhook({
+            "type": f"{kind}_alert_digest",
+            "alerts": alerts,
+            "total": total,
+            "timestamp": datetime.utcnow().isoformat()
+        })
     
     def notify_payment_success(self, order_id: str, customer_email: str, amount: float):
         """Notify customer about successful payment"""
-        subject = f"✅ Payment Confirmed - Order #{order_id}"
-        
-        body = f"""
-        Payment Confirmed!
-        
-        Order ID: {order_id}
-        Amount: ${amount:.2f}
-        
-        Your order is being processed. You'll receive updates as your order progresses.
+        email = PAYMENT_SUCCESS_TEMPLATE.render({"order_id": order_id, "amount": amount})
         
-        Thank you for your purchase!
-        """
-        
-        html_body = f"""
-        <html>
-        <body>
-            <h2 style="color: green;">✅ Payment Confirmed</h2>
-            <table>
-                <tr><td><strong>Order ID:</strong></td><td>{order_id}</td></tr>
-                <tr><td><strong>Amount:</strong></td><td>${amount:.2f}</td></tr>
-            </table>
-            <p>Your order is being processed. You'll receive updates as your order progresses.</p>
-            <p>Thank you for your purchase!</p>
-        </body>
-        </html>
-        """
-        
-        self.send_email(customer_email, subject, body, html_body)
+        self.queue_email(customer_email, *email)
     
     def notify_payment_failure(self, order_id: str, customer_email: str, amount: float, reason: str):
         """Notify customer about failed payment"""
-        subject = f"❌ Payment Failed - Order #{order_id}"
-        
-        body = f"""
-        Payment Failed
-        
-        Order ID: {order_id}
-        Amount: ${amount:.2f}
-        Reason: {reason}
-        
-        Please try again or contact support if the problem persists.
-        """
-        
-        html_body = f"""
-        <html>
-        <body>
-            <h2 style="color: red;">❌ Payment Failed</h2>
-            <table>
-                <tr><td><strong>Order ID:</strong></td><td>{order_id}</td></tr>
-                <tr><td><strong>Amount:</strong></td><td>${amount:.2f}</td></tr>
-                <tr><td><strong>Reason:</strong></td><td>{reason}</td></tr>
-            </table>
-            <p>Please try again or contact support if the problem persists.</p>
-        </body>
-        </html>
-        """
+        email = PAYMENT_FAILURE_TEMPLATE.render({"order_id": order_id, "amount": amount, "reason": reason})
         
-        self.send_email(customer_email, subject, body, html_body)
+        self.queue_email(customer_email, *email)
 
 # Global notification service instance
-notification_service = NotificationService() 
\ No newline at end of file
+notification_service = NotificationService(notification_dispatcher, webhook_client) 
\ No newline at end of file
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from database import order_status_history_collection
+
+logger = logging.getLogger(__name__)
+
+
+class OrderTracker:
+    """Order status history persisted to an append-only collection, with an LRU of active orders.
+
+    Status changes are buffered and written with insert_many, either when the
+    buffer reaches batch_size or every flush_interval seconds. Only recently
+    active orders are kept in memory, so memory stays flat however many
+    orders are tracked; anything else is read back from MongoDB on demand.
+    Other workers write to the same collection, so a cached history is only
+    served for cache_ttl seconds after it was read back.
+    """
+
+    def __init__(self, collection, cache_size: Optional[int] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_buffer: Optional[int] = None,
+                 cache_ttl: Optional[float] = None):
+        self.collection = collection
+        self.cache_size = cache_size or int(os.getenv('ORDER_TRACKING_CACHE_SIZE', '10000'))
+        self.batch_size = batch_size or int(os.getenv('ORDER_TRACKING_BATCH_SIZE', '100'))
+        self.flush_interval = flush_interval or float(os.getenv('ORDER_TRACKING_FLUSH_SECONDS', '0.5'))
+        self.max_buffer = max_buffer or int(os.getenv('ORDER_TRACKING_MAX_BUFFER', '10000'))
+        self.cache_ttl = cache_ttl if cache_ttl is not None else float(os.getenv('ORDER_TRACKING_CACHE_TTL_SECONDS', '5'))
+        # order_id -> {'customer_id', 'current_status', 'history', 'complete', 'loaded_at'}
+        self._orders: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._buffer: List[Dict[str, Any]] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._flusher = None
+        self.stats = {'written': 0, 'batches': 0, 'dropped': 0, 'cache_hits': 0, 'cache_misses': 0}
+
+    def track_order_status(self, order_id: str, new_status: str, customer_id: str,
+                           total_amount: float, old_status: Optional[str] = None) -> Dict[str, Any]:
+        """Record an order status change for real-time updates"""
+        entry = self._orders.get(order_id)
+        if old_status is None:
+            old_status = entry['current_status'] if entry else 'unknown'
+
+        status_change = {
+            'order_id': order_id,
+            'old_status': old_status,
+            'new_status': new_status,
+            'customer_id': customer_id,
+            'total_amount': total_amount,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+        if entry is None:
+            # History before this change is in MongoDB; load it lazily if someone asks
+            entry = {'customer_id': customer_id, 'current_status': new_status, 'history': [], 'complete': False,
+                     'loaded_at': 0.0}
+            self._cache(order_id, entry)
+        else:
+            self._orders.move_to_end(order_id)
+        entry['current_status'] = new_status
+        entry['history'].append(status_change)
+
+        self._buffer.append(dict(status_change))
+        if len(self._buffer) > self.max_buffer:
+            # MongoDB is not keeping up; shed the oldest writes rather than grow without bound
+            overflow = len(self._buffer) - self.max_buffer
+            del self._buffer[:overflow]
+            self.stats['dropped'] += overflow
+        if len(self._buffer) >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                pass  # No running loop (scripts); the caller flushes explicitly
+
+        return status_change
+
+    async def get_order_tracking_info(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """Get comprehensive order tracking information"""
+        entry = self._orders.get(order_id)
+        if entry is not None and entry['complete'] and time.monotonic() - entry['loaded_at'] < self.cache_ttl:
+            self._orders.move_to_end(order_id)
+            self.stats['cache_hits'] += 1
+        else:
+            self.stats['cache_misses'] += 1
+            # Make sure buffered changes are visible before reading them back
+            await self.flush()
+            history = await self.collection.find(
+                {'order_id': order_id}, {'_id': 0}
+            ).sort('timestamp', 1).to_list(length=None)
+            if not history:
+                return None
+            entry = {
+                'customer_id': history[-1].get('customer_id'),
+                'current_status': history[-1]['new_status'],
+                'history': history,
+                'complete': True,
+                'loaded_at': time.monotonic(),
+            }
+            self._cache(order_id, entry)
+
+        history = entry['history']
+        return {
+            'order_id': order_id,
+            'customer_id': entry['customer_id'],
+            'current_status': entry['current_status'],
+            'status_history': list(history),
+            'last_updated': history[-1]['timestamp'] if history else None,
+            'total_status_changes': len(history)
+        }
+
+    def _cache(self, order_id: str, entry: Dict[str, Any]):
+        self._orders[order_id] = entry
+        self._orders.move_to_end(order_id)
+        while len(self._orders) > self.cache_size:
+            self._orders.popitem(last=False)
+
+    async def flush(self):
+        """Write buffered status changes in one batch"""
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+            except Exception as e:
+                logger.error("⚠️ Failed to persist %d order status changes: %s", len(batch), e)
+                # Retry on the next flush, keeping the buffer bounded
+                self._buffer = (batch + self._buffer)[-self.max_buffer:]
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Start the periodic flusher (call from the app startup event)"""
+        if self._flusher is None:
+            self._flusher = asyncio.get_running_loop().create_task(self._run_flusher())
+
+    async def stop(self):
+        """Stop the flusher and write anything still buffered"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'cached_orders': len(self._orders), 'buffered': len(self._buffer)}
+
+
+# Global order tracker instance
+order_tracker = OrderTracker(order_status_history_collection)
@@ -0,0 +1,35 @@
+from typing import Dict, Iterable, List
+
+
+class OutcomeCounters:
+    """Exact per-outcome counts in a ring of time buckets (default: per minute over 24 hours).
+
+    Recording is O(1) and a window total is O(buckets), independent of how
+    many transactions were analyzed. A bucket is reset lazily the first time
+    it is reused for a newer interval.
+    """
+
+    def __init__(self, outcomes: Iterable[str], bucket_seconds: int = 60, buckets: int = 1440):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self._counts: Dict[str, List[int]] = {outcome: [0] * buckets for outcome in outcomes}
+        self._epochs = [-1] * buckets  # Interval number each slot currently holds
+
+    def record(self, outcome: str, ts: float):
+        interval = int(ts // self.bucket_seconds)
+        slot = interval % self.buckets
+        held = self._epochs[slot]
+        if held != interval:
+            if held > interval:
+                return  # Older than the retained window
+            for counts in self._counts.values():
+                counts[slot] = 0
+            self._epochs[slot] = interval
+        self._counts[outcome][slot] += 1
+
+    def totals(self, window_seconds: float, now: float) -> Dict[str, int]:
+        """Counts per outcome over the last `window_seconds` ending at `now`"""
+        newest = int(now // self.bucket_seconds)
+        oldest = newest - min(self.buckets, int(window_seconds // self.bucket_seconds)) + 1
+        live = [slot for slot, interval in enumerate(self._epochs) if oldest <= interval <= newest]
+        return {outcome: sum(counts[slot] for slot in live) for outcome, counts in self._counts.items()}
@@ -0,0 +1,243 @@
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from loop_watchdog import APP_ROOT, is_app_file
+
+THIS_FILE = os.path.abspath(__file__)
+# Innermost frames that mean "the event loop is waiting for I/O"
+IDLE_FRAMES = {('selectors.py', 'select'), ('selectors.py', '_select'), ('threading.py', 'wait')}
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _short_path(filename: str) -> str:
+    if is_app_file(filename):
+        return os.path.relpath(filename, APP_ROOT)
+    # Keep the package name for libraries: ".../site-packages/motor/core.py" -> "motor/core.py"
+    parts = filename.replace('\\', '/').split('/')
+    return '/'.join(parts[-2:])
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """On-demand statistical profiler for the running worker.
+
+    CPU mode: samples the event loop's stack every `interval` of CPU time
+    (SIGPROF, when the loop runs on the main thread as under uvicorn) and
+    counts each stack, producing collapsed ("folded") stacks for
+    flamegraph.pl / speedscope. With all_threads, or off the main thread, a
+    helper thread samples wall-clock stacks with sys._current_frames()
+    instead; samples where the loop sits in select() are dropped unless
+    include_idle is set.
+
+    Alloc mode: tracemalloc traces allocations for the window, and the
+    thread snapshots them every second, keeping each allocation site's
+    largest live size. That catches short-lived objects (e.g. per-request
+    dicts) that happened to be alive at a snapshot, as well as memory that
+    is still held at the end.
+
+    Only one profile runs at a time; overhead is paid only while profiling.
+    """
+
+    def __init__(self, max_seconds: Optional[float] = None):
+        self.max_seconds = max_seconds or float(os.getenv('PROFILER_MAX_SECONDS', '60'))
+        self._lock = threading.Lock()
+        self.stats = {'cpu_profiles': 0, 'alloc_profiles': 0, 'rejected_busy': 0}
+
+    def _acquire(self):
+        if not self._lock.acquire(blocking=False):
+            self.stats['rejected_busy'] += 1
+            raise ProfilerBusy("A profile is already running in this worker")
+
+    def _clamp(self, seconds: float) -> float:
+        return max(0.1, min(float(seconds), self.max_seconds))
+
+    @staticmethod
+    def _fold(frame) -> str:
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        return ';'.join(labels)
+
+    async def profile_cpu(self, seconds: float, interval: float = 0.01, all_threads: bool = False,
+                          include_idle: bool = False) -> Dict[str, Any]:
+        """Sample stacks for `seconds` and return collapsed stacks plus the hottest functions"""
+        self._acquire()
+        try:
+            seconds = self._clamp(seconds)
+            interval = max(0.001, interval)
+            stacks: Counter = Counter()
+            counts = {'samples': 0, 'idle_samples': 0}
+            started = time.perf_counter()
+            if not all_threads and hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread():
+                clock = 'cpu'
+                await self._sample_with_signal(seconds, interval, stacks, counts)
+            else:
+                clock = 'wall'
+                await self._sample_with_thread(seconds, interval, stacks, counts, all_threads, include_idle)
+            self.stats['cpu_profiles'] += 1
+            return {
+                'mode': 'cpu',
+                'clock': clock,
+                'duration_s': round(time.perf_counter() - started, 3),
+                'interval_ms': interval * 1000,
+                **counts,
+                'top_self': self._top(stacks, self_only=True),
+                'top_total': self._top(stacks, self_only=False),
+                'collapsed': '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()),
+            }
+        finally:
+            self._lock.release()
+
+    async def _sample_with_signal(self, seconds, interval, stacks, counts):
+        # SIGPROF fires every `interval` of CPU time consumed by the process and
+        # its handler runs on the loop (main) thread with the interrupted frame,
+        # so samples land where the CPU is actually spent, never in select()
+        fold = self._fold
+
+        def on_sample(signum, frame):
+            # CPU burnt by other threads can still interrupt an idle loop
+            if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                counts['idle_samples'] += 1
+                return
+            stacks[fold(frame)] += 1
+            counts['samples'] += 1
+
+        previous = signal.signal(signal.SIGPROF, on_sample)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, previous)
+
+    async def _sample_with_thread(self, seconds, interval, stacks, counts, all_threads, include_idle):
+        # Wall-clock sampling from a helper thread. It only runs when it holds
+        # the GIL, so samples are biased towards points where the sampled
+        # thread releases it (I/O, select); use it for non-main-thread loops
+        # or to see what other threads are doing.
+        loop_thread = threading.get_ident()
+        stop = threading.Event()
+        fold = self._fold
+
+        def sample():
+            own_thread = threading.get_ident()
+            while not stop.wait(interval):
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread or (not all_threads and thread_id != loop_thread):
+                        continue
+                    code = frame.f_code
+                    if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                        counts['idle_samples'] += 1
+                        if not include_idle:
+                            continue
+                    stack = fold(frame)
+                    if all_threads:
+                        stack = ('loop' if thread_id == loop_thread else f"thread-{thread_id}") + ';' + stack
+                    stacks[stack] += 1
+                    counts['samples'] += 1
+
+        thread = threading.Thread(target=sample, name='sampling-profiler', daemon=True)
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(thread.join)
+
+    @staticmethod
+    def _top(stacks: Counter, self_only: bool, limit: int = 25) -> List[Dict[str, Any]]:
+        totals: Counter = Counter()
+        samples = sum(stacks.values()) or 1
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            if self_only:
+                totals[frames[-1]] += count
+            else:
+                for label in set(frames):  # Recursion counts once per sample
+                    totals[label] += count
+        return [{'function': label, 'samples': count, 'percent': round(100.0 * count / samples, 1)}
+                for label, count in totals.most_common(limit)]
+
+    async def profile_alloc(self, seconds: float, frames: int = 16, limit: int = 25) -> Dict[str, Any]:
+        """Trace allocations for `seconds`; return the biggest allocation sites and collapsed stacks by bytes"""
+        self._acquire()
+        try:
+            seconds = self._clamp(seconds)
+            already_tracing = tracemalloc.is_tracing()
+            if not already_tracing:
+                tracemalloc.start(frames)
+            tracemalloc.reset_peak()
+            # Drop the profiler's own snapshot work wherever it appears in the stack
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__, all_frames=True),
+                      tracemalloc.Filter(False, THIS_FILE, all_frames=True),
+                      tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')]
+            sites: Dict[Any, List[int]] = {}  # traceback -> [max size, count at that size]
+            stop = threading.Event()
+
+            def snapshot():
+                stats = tracemalloc.take_snapshot().filter_traces(ignore).statistics('traceback')
+                for stat in stats:
+                    best = sites.get(stat.traceback)
+                    if best is None or stat.size > best[0]:
+                        sites[stat.traceback] = [stat.size, stat.count]
+
+            def sample():
+                while not stop.wait(1.0):
+                    snapshot()
+                snapshot()
+
+            thread = threading.Thread(target=sample, name='alloc-profiler', daemon=True)
+            started = time.perf_counter()
+            thread.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(thread.join)
+                current, peak = tracemalloc.get_traced_memory()
+                if not already_tracing:
+                    tracemalloc.stop()
+
+            ranked = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)
+            self.stats['alloc_profiles'] += 1
+            return {
+                'mode': 'alloc',
+                'duration_s': round(time.perf_counter() - started, 3),
+                'traced_current_bytes': current,
+                'traced_peak_bytes': peak,
+                # Traceback frames run from the oldest to the allocating (most recent) one
+                'top_sites': [{
+                    'site': f"{_short_path(tb[-1].filename)}:{tb[-1].lineno}",
+                    'max_live_bytes': size,
+                    'blocks': count,
+                    'stack': [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in reversed(tb)],
+                } for tb, (size, count) in ranked[:limit]],
+                'collapsed': '\n'.join(
+                    ';'.join(f"{_short_path(frame.filename)}:{frame.lineno}" for frame in tb) + f" {size}"
+                    for tb, (size, _) in ranked
+                ),
+            }
+        finally:
+            self._lock.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'running': self._lock.locked(), 'max_seconds': self.max_seconds}
+
+
+# Global sampling profiler instance
+profiler = SamplingProfiler()
@@ -1,124 +1,174 @@
+import asyncio
 import json
+import logging
+import os
 import time
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
-from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Callable
+from collections import defaultdict
 import hashlib
 
+from analytics_state import get_state_backend
+from fraud_rules import FraudRuleEngine, FraudContext
+from sketches import FraudSketches
+from stock_index import StockIndex, stock_severity
+from outcome_counters import OutcomeCounters
+
+logger = logging.getLogger(__name__)
+
+FRAUD_OUTCOMES = ('ALLOW', 'REVIEW', 'BLOCK')
+
+def utc_timestamp(value: datetime) -> float:
+    """Epoch seconds for a datetime; naive values are UTC (as stored everywhere in the app)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
 class RealTimeAnalytics:
-    """Real-time analytics for fraud detection, stock monitoring, and order tracking"""
+    """Real-time analytics for fraud detection and stock monitoring"""
     
-    def __init__(self):
-        # Fraud detection data structures
-        self.customer_transactions = defaultdict(list)  # customer_id -> list of transactions
-        self.ip_transactions = defaultdict(list)  # ip_address -> list of transactions
-        self.device_transactions = defaultdict(list)  # device_id -> list of transactions
-        self.suspicious_patterns = deque(maxlen=1000)  # Recent suspicious activities
+    def __init__(self, state_backend=None, rule_engine=None, clock: Optional[Callable[[], float]] = None):
+        # "Now" in epoch seconds for retention and summaries; replays pass an event-time clock
+        self.clock = clock or time.time
+        # Fraud detection data structures: customer/ip/device transaction windows
+        # live in a pluggable backend so several workers can share them
+        self.state = state_backend or get_state_backend()
+        # Fixed-memory approximate counters for high-cardinality signals (per process)
+        self.sketches = FraudSketches()
+        # Per-minute ALLOW/REVIEW/BLOCK counts over the last 24 hours
+        self.outcomes = OutcomeCounters(FRAUD_OUTCOMES)
         
         # Stock monitoring
-        self.stock_alerts = {}  # product_id -> alert_info
+        self.stock_index = StockIndex()  # product_id -> latest alert_info, plus low-stock heap
         self.stock_thresholds = defaultdict(lambda: 10)  # Default threshold
         
-        # Order tracking
-        self.order_status_history = defaultdict(list)  # order_id -> status_changes
-        self.real_time_orders = {}  # order_id -> current_status
+        # Configuration: fraud rules and thresholds are compiled from fraud_rules.json
+        self.rule_engine = rule_engine or FraudRuleEngine()
         
-        # Configuration
-        self.fraud_thresholds = {
-            'max_amount_per_hour': 1000.0,
-            'max_orders_per_hour': 5,
-            'max_failed_payments': 3,
-            'suspicious_amount': 500.0,
-            'new_customer_limit': 200.0
-        }
+        # Callbacks fed every fraud verdict and stock severity change (e.g. live admin feed)
+        self.listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        
+        # Expired windows are dropped at most once per interval, not on every check;
+        # fetches filter by time anyway, so records past retention are never scored
+        self.prune_interval = float(os.getenv('ANALYTICS_PRUNE_INTERVAL_SECONDS', '60'))
+        self._last_prune = float('-inf')
+        # One thread for checks against a blocking state backend (created on first use)
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], None]):
+        """Register a callback called as listener(event_type, data)"""
+        self.listeners.append(listener)
+    
+    def _emit(self, event_type: str, data: Dict[str, Any]):
+        for listener in self.listeners:
+            try:
+                listener(event_type, data)
+            except Exception as e:
+                logger.warning("⚠️ Analytics listener failed on %s: %s", event_type, e)
+    
+    @property
+    def fraud_thresholds(self) -> Dict[str, Any]:
+        return self.rule_engine.plan.thresholds
+    
+    def analyze_transaction_fraud(self, transaction_data: Dict[str, Any],
+                                  customer_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Analyze transaction for potential fraud, optionally using the customer's lifetime profile"""
+        result, verdict_event = self._analyze(transaction_data, customer_profile)
+        if verdict_event is not None:
+            self._emit('fraud_verdict', verdict_event)
+        return result
     
-    def analyze_transaction_fraud(self, transaction_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze transaction for potential fraud"""
+    async def analyze_transaction_fraud_async(self, transaction_data: Dict[str, Any],
+                                              customer_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """analyze_transaction_fraud for request handlers: a blocking state backend
+        (SQLite waiting on other workers' locks) runs on its own thread, not the event loop"""
+        if not self.state.blocking:
+            return self.analyze_transaction_fraud(transaction_data, customer_profile)
+        if self._executor is None:
+            # A single thread keeps checks serialized, as they were on the loop
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fraud-analysis')
+        loop = asyncio.get_running_loop()
+        result, verdict_event = await loop.run_in_executor(
+            self._executor, self._analyze, transaction_data, customer_profile
+        )
+        # Listeners publish to the event broker, which belongs to the loop
+        if verdict_event is not None:
+            self._emit('fraud_verdict', verdict_event)
+        return result
+    
+    def close(self):
+        """Stop the analysis thread, if one was started"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+    
+    def _analyze(self, transaction_data: Dict[str, Any], customer_profile: Optional[Dict[str, Any]]):
+        """Score and record a transaction; returns the result and the fraud_verdict event (None without listeners)"""
         customer_id = transaction_data.get('customer_id')
         amount = transaction_data.get('amount', 0)
         ip_address = transaction_data.get('ip_address', '')
         device_id = transaction_data.get('device_id', '')
         timestamp = datetime.fromisoformat(transaction_data.get('timestamp', datetime.utcnow().isoformat()))
         
-        risk_factors = []
-        risk_score = 0.0
-        
-        # Check customer transaction history
-        if customer_id:
-            customer_txns = self.customer_transactions[customer_id]
-            recent_txns = [txn for txn in customer_txns 
-                          if timestamp - datetime.fromisoformat(txn['timestamp']) < timedelta(hours=1)]
-            
-            # High frequency transactions
-            if len(recent_txns) >= self.fraud_thresholds['max_orders_per_hour']:
-                risk_factors.append(f"High transaction frequency: {len(recent_txns)} in 1 hour")
-                risk_score += 0.3
-            
-            # High amount transactions
-            total_amount = sum(txn.get('amount', 0) for txn in recent_txns) + amount
-            if total_amount > self.fraud_thresholds['max_amount_per_hour']:
-                risk_factors.append(f"High amount in 1 hour: ${total_amount:.2f}")
-                risk_score += 0.4
-            
-            # New customer with high amount
-            if len(customer_txns) == 0 and amount > self.fraud_thresholds['new_customer_limit']:
-                risk_factors.append(f"New customer with high amount: ${amount:.2f}")
-                risk_score += 0.5
-        
-        # Check IP-based patterns
-        if ip_address:
-            ip_txns = self.ip_transactions[ip_address]
-            recent_ip_txns = [txn for txn in ip_txns 
-                             if timestamp - datetime.fromisoformat(txn['timestamp']) < timedelta(hours=1)]
+        # Epoch seconds throughout, comparable with self.clock() in get_fraud_summary;
+        # a naive datetime's .timestamp() would be read as host local time
+        ts = utc_timestamp(timestamp)
+        window_start = ts - 3600
+        retention_start = self.clock() - 24 * 3600
+        
+        # Read the windows and record the transaction atomically so concurrent
+        # workers sharing the state backend see each other's transactions
+        with self.state.transaction():
+            ctx = FraudContext(self.state, customer_id, amount, ip_address, device_id,
+                               ts, window_start, retention_start, self.sketches, customer_profile)
+            risk_score, risk_factors, _ = self.rule_engine.evaluate(ctx)
             
-            if len(recent_ip_txns) >= 3:  # Multiple transactions from same IP
-                risk_factors.append(f"Multiple transactions from same IP: {len(recent_ip_txns)}")
-                risk_score += 0.2
-        
-        # Check device-based patterns
-        if device_id:
-            device_txns = self.device_transactions[device_id]
-            recent_device_txns = [txn for txn in device_txns 
-                                 if timestamp - datetime.fromisoformat(txn['timestamp']) < timedelta(hours=1)]
+            # Store transaction for future analysis
+            transaction_record = {
+                'customer_id': customer_id,
+                'amount': amount,
+                'ip_address': ip_address,
+                'device_id': device_id,
+                'timestamp': timestamp.isoformat(),
+                'risk_score': risk_score,
+                'risk_factors': risk_factors
+            }
             
-            if len(recent_device_txns) >= 3:  # Multiple transactions from same device
-                risk_factors.append(f"Multiple transactions from same device: {len(recent_device_txns)}")
-                risk_score += 0.2
-        
-        # Suspicious amount patterns
-        if amount > self.fraud_thresholds['suspicious_amount']:
-            risk_factors.append(f"Suspicious amount: ${amount:.2f}")
-            risk_score += 0.3
-        
-        # Store transaction for future analysis
-        transaction_record = {
-            'customer_id': customer_id,
-            'amount': amount,
-            'ip_address': ip_address,
-            'device_id': device_id,
-            'timestamp': timestamp.isoformat(),
-            'risk_score': risk_score,
-            'risk_factors': risk_factors
-        }
-        
-        if customer_id:
-            self.customer_transactions[customer_id].append(transaction_record)
-        if ip_address:
-            self.ip_transactions[ip_address].append(transaction_record)
-        if device_id:
-            self.device_transactions[device_id].append(transaction_record)
+            if customer_id:
+                self.state.append('customer', customer_id, ts, transaction_record)
+            if ip_address:
+                self.state.append('ip', ip_address, ts, transaction_record)
+            if device_id:
+                self.state.append('device', device_id, ts, transaction_record)
+            self.sketches.record(customer_id, ip_address, device_id, ts)
         
         # Clean old transactions (older than 24 hours)
-        self._cleanup_old_transactions()
-        
-        return {
-            'is_fraudulent': risk_score > 0.7,
-            'risk_score': min(risk_score, 1.0),
+        now = self.clock()
+        if now - self._last_prune >= self.prune_interval:
+            self._last_prune = now
+            self._cleanup_old_transactions()
+        
+        verdict = self.rule_engine.recommendation(risk_score)
+        self.outcomes.record(verdict['recommendation'], ts)
+        result = {
+            'is_fraudulent': verdict['is_fraudulent'],
+            'risk_score': verdict['risk_score'],
             'risk_factors': risk_factors,
-            'recommendation': 'BLOCK' if risk_score > 0.8 else 'REVIEW' if risk_score > 0.5 else 'ALLOW'
+            'recommendation': verdict['recommendation']
         }
+        verdict_event = None
+        if self.listeners:
+            verdict_event = {
+                **result,
+                'transaction_id': transaction_data.get('transaction_id'),
+                'customer_id': customer_id,
+                'amount': amount,
+                'timestamp': timestamp.isoformat()
+            }
+        return result, verdict_event
     
-    def monitor_stock_levels(self, product_id: str, product_name: str, 
+    def monitor_stock_levels(self, product_id: str, product_name: Optional[str], 
                            current_stock: int, threshold: Optional[int] = None) -> Dict[str, Any]:
         """Monitor stock levels and generate alerts"""
         if threshold is None:
@@ -126,8 +176,12 @@ class RealTimeAnalytics:
         else:
             self.stock_thresholds[product_id] = threshold
         
+        previous = self.stock_index.levels.get(product_id)
+        if product_name is None:
+            product_name = previous['product_name'] if previous else product_id
+        
         alert_needed = current_stock <= threshold
-        severity = 'critical' if current_stock <= 5 else 'warning' if current_stock <= threshold else 'normal'
+        severity = stock_severity(current_stock, threshold)
         
         alert_info = {
             'product_id': product_id,
@@ -139,103 +193,44 @@ class RealTimeAnalytics:
             'timestamp': datetime.utcnow().isoformat()
         }
         
-        self.stock_alerts[product_id] = alert_info
+        previous_severity = self.stock_index.update(alert_info)
+        if self.listeners and severity != (previous_severity or 'normal'):
+            self._emit('stock_alert', {**alert_info, 'previous_severity': previous_severity})
         
-        return alert_info
-    
-    def track_order_status(self, order_id: str, new_status: str, 
-                          customer_id: str, total_amount: float) -> Dict[str, Any]:
-        """Track order status changes for real-time updates"""
-        timestamp = datetime.utcnow()
-        
-        status_change = {
-            'order_id': order_id,
-            'old_status': self.real_time_orders.get(order_id, 'unknown'),
-            'new_status': new_status,
-            'customer_id': customer_id,
-            'total_amount': total_amount,
-            'timestamp': timestamp.isoformat()
-        }
-        
-        # Store status history
-        self.order_status_history[order_id].append(status_change)
-        
-        # Update current status
-        self.real_time_orders[order_id] = new_status
-        
-        return status_change
-    
-    def get_order_tracking_info(self, order_id: str) -> Optional[Dict[str, Any]]:
-        """Get comprehensive order tracking information"""
-        if order_id not in self.real_time_orders:
-            return None
-        
-        history = self.order_status_history.get(order_id, [])
-        current_status = self.real_time_orders[order_id]
-        
-        return {
-            'order_id': order_id,
-            'current_status': current_status,
-            'status_history': history,
-            'last_updated': history[-1]['timestamp'] if history else None,
-            'total_status_changes': len(history)
-        }
+        return {**alert_info, 'previous_severity': previous_severity}
     
     def get_fraud_summary(self) -> Dict[str, Any]:
         """Get summary of fraud detection activities"""
-        total_suspicious = len(self.suspicious_patterns)
-        recent_suspicious = len([p for p in self.suspicious_patterns 
-                               if datetime.fromisoformat(p['timestamp']) > datetime.utcnow() - timedelta(hours=1)])
+        now = self.clock()
+        last_day = self.outcomes.totals(24 * 3600, now)
+        last_hour = self.outcomes.totals(3600, now)
         
         return {
-            'total_suspicious_transactions': total_suspicious,
-            'recent_suspicious_transactions': recent_suspicious,
-            'active_customers_monitored': len(self.customer_transactions),
-            'active_ips_monitored': len(self.ip_transactions),
+            'total_suspicious_transactions': last_day['REVIEW'] + last_day['BLOCK'],
+            'recent_suspicious_transactions': last_hour['REVIEW'] + last_hour['BLOCK'],
+            'verdicts_last_24h': last_day,
+            'verdicts_last_hour': last_hour,
+            'active_customers_monitored': self.state.count_keys('customer'),
+            'active_ips_monitored': self.state.count_keys('ip'),
+            'sketches': self.sketches.get_stats(),
             'fraud_thresholds': self.fraud_thresholds
         }
     
-    def get_stock_alerts_summary(self) -> Dict[str, Any]:
+    def get_stock_alerts_summary(self, limit: int = 20) -> Dict[str, Any]:
         """Get summary of stock alerts"""
-        critical_alerts = [alert for alert in self.stock_alerts.values() 
-                          if alert['severity'] == 'critical']
-        warning_alerts = [alert for alert in self.stock_alerts.values() 
-                         if alert['severity'] == 'warning']
+        counts = self.stock_index.severity_counts
         
         return {
-            'total_alerts': len(self.stock_alerts),
-            'critical_alerts': len(critical_alerts),
-            'warning_alerts': len(warning_alerts),
-            'products_monitored': len(self.stock_alerts)
+            'total_alerts': len(self.stock_index),
+            'critical_alerts': counts['critical'],
+            'warning_alerts': counts['warning'],
+            'products_monitored': len(self.stock_index),
+            'low_stock_products': self.stock_index.low_stock(limit)
         }
     
     def _cleanup_old_transactions(self):
         """Clean up old transaction data (older than 24 hours)"""
-        cutoff_time = datetime.utcnow() - timedelta(hours=24)
-        
-        for customer_id in list(self.customer_transactions.keys()):
-            self.customer_transactions[customer_id] = [
-                txn for txn in self.customer_transactions[customer_id]
-                if datetime.fromisoformat(txn['timestamp']) > cutoff_time
-            ]
-            if not self.customer_transactions[customer_id]:
-                del self.customer_transactions[customer_id]
-        
-        for ip_address in list(self.ip_transactions.keys()):
-            self.ip_transactions[ip_address] = [
-                txn for txn in self.ip_transactions[ip_address]
-                if datetime.fromisoformat(txn['timestamp']) > cutoff_time
-            ]
-            if not self.ip_transactions[ip_address]:
-                del self.ip_transactions[ip_address]
-        
-        for device_id in list(self.device_transactions.keys()):
-            self.device_transactions[device_id] = [
-                txn for txn in self.device_transactions[device_id]
-                if datetime.fromisoformat(txn['timestamp']) > cutoff_time
-            ]
-            if not self.device_transactions[device_id]:
-                del self.device_transactions[device_id]
+        self.state.prune(self.clock() - 24 * 3600)
 
 # Global real-time analytics instance
 realtime_analytics = RealTimeAnalytics() 
\ No newline at end of file
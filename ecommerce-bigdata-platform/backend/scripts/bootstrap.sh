@@ -87,14 +87,7 @@ fi
 
 # Step 7: Initialize database
 print_status "Initializing database..."
-python3 -c "
-import asyncio
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.abspath('.')))
-from database import init_database
-asyncio.run(init_database())
-"
+python3 scripts/setup-database.py
 print_success "Database initialized"
 
 # Step 8: Setup Kafka topics
@@ -7,15 +7,12 @@ import asyncio
 import os
 import sys
 from datetime import datetime
-from dotenv import load_dotenv
 
 # Add the parent directory to the path so we can import our modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import users_collection, init_database
 
-load_dotenv()
-
 async def fix_users():
     """Fix existing users by adding missing fields."""
     print("Connecting to database...")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Offline replay and latency benchmark for fraud detection.
+
+Streams transactions from a JSONL file (one transaction dict per line) or from
+a synthetic generator with Zipf-skewed customers, IPs and devices through
+RealTimeAnalytics.analyze_transaction_fraud in-process, then reports latency
+percentiles, throughput and memory growth. Windows are pruned by event time
+(the newest replayed timestamp), so historical files score as they did live.
+
+Examples:
+    python scripts/fraud-replay.py --synthetic 50000
+    python scripts/fraud-replay.py --input transactions.jsonl --output result.json
+    python scripts/fraud-replay.py --synthetic 50000 --baseline result.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics_state import InMemoryStateBackend, SQLiteStateBackend
+from realtime_analytics import RealTimeAnalytics, utc_timestamp
+
+
+def zipf_weights(n, skew):
+    """Cumulative Zipf weights for n keys"""
+    total = 0.0
+    cumulative = []
+    for rank in range(1, n + 1):
+        total += 1.0 / (rank ** skew)
+        cumulative.append(total)
+    return cumulative
+
+
+def synthetic_transactions(count, customers, ips, devices, skew, rate, seed):
+    """Generate transactions with realistic skew: a few hot customers, shared IPs and devices"""
+    rng = random.Random(seed)
+    customer_ids = [f"cust_{i}" for i in range(customers)]
+    ip_addresses = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(ips)]
+    device_ids = [f"device_{i}" for i in range(devices)]
+    customer_weights = zipf_weights(customers, skew)
+    ip_weights = zipf_weights(ips, skew)
+    device_weights = zipf_weights(devices, skew)
+
+    # Spread the stream over the last hours so windows fill up like production
+    start = datetime.utcnow() - timedelta(seconds=count / rate)
+    for i in range(count):
+        yield {
+            'transaction_id': f"txn_{i}",
+            'customer_id': rng.choices(customer_ids, cum_weights=customer_weights)[0],
+            'amount': round(rng.lognormvariate(3.5, 1.0), 2),
+            'ip_address': rng.choices(ip_addresses, cum_weights=ip_weights)[0],
+            'device_id': rng.choices(device_ids, cum_weights=device_weights)[0],
+            'timestamp': (start + timedelta(seconds=i / rate)).isoformat()
+        }
+
+
+def file_transactions(path):
+    """Stream transactions from a JSONL file"""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class EventClock:
+    """Replay "now": the newest transaction timestamp seen so far.
+
+    Retention pruning and the fraud summary then follow event time, as they
+    did when the transactions happened, instead of the wall clock of the replay.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, txn):
+        if txn.get('timestamp'):
+            self.now = max(self.now, utc_timestamp(datetime.fromisoformat(txn['timestamp'])))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux), or 0 if unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_replay(transactions, analytics, clock, warmup, trace_memory):
+    """Replay transactions and collect per-call latencies"""
+    latencies = []
+    verdicts = {'ALLOW': 0, 'REVIEW': 0, 'BLOCK': 0}
+    perf_counter_ns = time.perf_counter_ns
+
+    gc.collect()
+    rss_start = rss_bytes()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+
+    for i, txn in enumerate(transactions):
+        clock.advance(txn)
+        t0 = perf_counter_ns()
+        result = analytics.analyze_transaction_fraud(txn)
+        elapsed = perf_counter_ns() - t0
+        if i >= warmup:
+            latencies.append(elapsed)
+        verdicts[result['recommendation']] += 1
+
+    duration = time.perf_counter() - started
+    traced_peak = None
+    if trace_memory:
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    rss_end = rss_bytes()
+
+    latencies.sort()
+    total = sum(verdicts.values())
+    return {
+        'transactions': total,
+        'measured': len(latencies),
+        'duration_s': round(duration, 4),
+        'throughput_tps': round(total / duration, 1) if duration else 0.0,
+        'latency_us': {
+            'p50': round(percentile(latencies, 50) / 1000, 2),
+            'p99': round(percentile(latencies, 99) / 1000, 2),
+            'p999': round(percentile(latencies, 99.9) / 1000, 2),
+            'max': round(latencies[-1] / 1000, 2) if latencies else 0.0,
+            'mean': round(sum(latencies) / len(latencies) / 1000, 2) if latencies else 0.0,
+        },
+        'memory': {
+            'rss_start_bytes': rss_start,
+            'rss_end_bytes': rss_end,
+            'rss_growth_bytes': rss_end - rss_start,
+            'traced_peak_bytes': traced_peak,
+        },
+        'verdicts': verdicts,
+    }
+
+
+def compare_to_baseline(result, baseline, tolerance):
+    """List metrics that regressed by more than `tolerance` (fraction) against a baseline"""
+    regressions = []
+    for key in ('p50', 'p99', 'p999'):
+        old, new = baseline['latency_us'][key], result['latency_us'][key]
+        if old and new > old * (1 + tolerance):
+            regressions.append(f"latency {key}: {old}us -> {new}us")
+    old, new = baseline['throughput_tps'], result['throughput_tps']
+    if old and new < old * (1 - tolerance):
+        regressions.append(f"throughput: {old} -> {new} tps")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay transactions through fraud detection and measure latency")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help="JSONL file with one transaction per line")
+    source.add_argument('--synthetic', type=int, metavar='N', help="Generate N synthetic transactions")
+    parser.add_argument('--customers', type=int, default=10000)
+    parser.add_argument('--ips', type=int, default=5000)
+    parser.add_argument('--devices', type=int, default=8000)
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent for key popularity")
+    parser.add_argument('--rate', type=float, default=20.0, help="Simulated transactions per second")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--warmup', type=int, default=1000, help="Transactions excluded from latency stats")
+    parser.add_argument('--state-backend', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--state-path', default='/tmp/fraud-replay-state.db')
+    parser.add_argument('--trace-memory', action='store_true', help="Track Python allocations with tracemalloc")
+    parser.add_argument('--output', help="Write the machine-readable result to this JSON file")
+    parser.add_argument('--baseline', help="Compare against a previous result and exit 1 on regression")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed regression fraction")
+    args = parser.parse_args()
+
+    if args.state_backend == 'sqlite':
+        if os.path.exists(args.state_path):
+            os.remove(args.state_path)
+        state = SQLiteStateBackend(args.state_path)
+    else:
+        state = InMemoryStateBackend()
+    clock = EventClock()
+    analytics = RealTimeAnalytics(state_backend=state, clock=clock)
+
+    if args.input:
+        transactions = file_transactions(args.input)
+    else:
+        transactions = synthetic_transactions(args.synthetic, args.customers, args.ips, args.devices,
+                                              args.skew, args.rate, args.seed)
+
+    print("🔁 Replaying transactions through analyze_transaction_fraud...")
+    stats = run_replay(transactions, analytics, clock, args.warmup, args.trace_memory)
+
+    result = {
+        'benchmark': 'fraud-replay',
+        'timestamp': datetime.utcnow().isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+        **stats,
+        'fraud_summary': {
+            'active_customers_monitored': analytics.state.count_keys('customer'),
+            'active_ips_monitored': analytics.state.count_keys('ip'),
+        },
+    }
+
+    latency = result['latency_us']
+    print(f"✅ {result['transactions']} transactions in {result['duration_s']}s "
+          f"({result['throughput_tps']} tps)")
+    print(f"   Latency p50={latency['p50']}us p99={latency['p99']}us p999={latency['p999']}us max={latency['max']}us")
+    print(f"   RSS growth: {result['memory']['rss_growth_bytes'] / 1e6:.1f} MB")
+    print(f"   Verdicts: {result['verdicts']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"📝 Result written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(result, baseline, args.tolerance)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for the backend modules.
+
+Imports each module in a fresh interpreter with `python -X importtime`,
+takes the median cumulative import time over --runs, and fails when it is
+over --budget-ms. It also fails when a module pulls in a dependency that
+should only load on first use (--forbid: the Kafka client, JWT and
+password hashing, Motor, httpx) or starts a thread at import time, which
+means a client or worker was constructed as a side effect.
+
+Examples:
+    python scripts/import-benchmark.py
+    python scripts/import-benchmark.py --module main --module auth --budget-ms 600
+    python scripts/import-benchmark.py --runs 5 --top 20 --output import-times.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FORBIDDEN = 'confluent_kafka,jose,passlib,motor,httpx'
+
+# Runs in the child: import the module, then report the non-main threads it left running.
+# __import__ goes through the C import path that -X importtime instruments
+# (importlib.import_module does not)
+CHILD = (
+    "import json, sys, threading\n"
+    "__import__(sys.argv[1])\n"
+    "print(json.dumps([t.name for t in threading.enumerate() if t is not threading.main_thread()]))\n"
+)
+
+
+def parse_importtime(stderr):
+    """Parse -X importtime lines into (name, depth, self_us, cumulative_us) rows"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(module):
+    """Import `module` once in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD, module],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'},
+    )
+    rows = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        error = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(f"import {module} failed:\n" + '\n'.join(error[-15:]))
+    # Rows are printed children first, so the module's own imports are the
+    # nested rows right above its top-level row; interpreter startup is excluded
+    index = next((i for i in range(len(rows) - 1, -1, -1) if rows[i][0] == module and rows[i][1] == 0), None)
+    if index is None:
+        raise RuntimeError(f"import {module} was not timed (already imported at interpreter startup?)")
+    start = index
+    while start > 0 and rows[start - 1][1] > 0:
+        start -= 1
+    return {
+        'cumulative_us': rows[index][3],
+        'rows': rows[start:index + 1],
+        'threads': json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+
+def heaviest_packages(rows, limit):
+    """Self time summed per top-level package, heaviest first"""
+    totals = {}
+    for name, _, self_us, _ in rows:
+        package = name.split('.')[0]
+        totals[package] = totals.get(package, 0) + self_us
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return [{'package': package, 'self_ms': round(us / 1000, 1)} for package, us in ranked[:limit]]
+
+
+def benchmark(module, runs, budget_ms, forbidden, top):
+    samples = [measure(module) for _ in range(runs)]
+    median_ms = statistics.median(sample['cumulative_us'] for sample in samples) / 1000
+    last = samples[-1]
+    imported = {name.split('.')[0] for name, _, _, _ in last['rows']}
+    report = {
+        'module': module,
+        'runs': runs,
+        'median_ms': round(median_ms, 1),
+        'min_ms': round(min(sample['cumulative_us'] for sample in samples) / 1000, 1),
+        'budget_ms': budget_ms,
+        'forbidden_imports': sorted(imported & forbidden),
+        'threads_at_import': last['threads'],
+        'heaviest_packages': heaviest_packages(last['rows'], top),
+    }
+    report['ok'] = (median_ms <= budget_ms and not report['forbidden_imports']
+                    and not report['threads_at_import'])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check backend import time against a budget")
+    parser.add_argument('--module', action='append', help="Module to import (repeatable, default: main)")
+    parser.add_argument('--budget-ms', type=float, default=1000.0, help="Maximum median import time per module")
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreters per module")
+    parser.add_argument('--forbid', default=DEFAULT_FORBIDDEN,
+                        help="Comma-separated packages that must not be imported at import time")
+    parser.add_argument('--top', type=int, default=10, help="Heaviest packages to list")
+    parser.add_argument('--output', help="Write the machine-readable result to this JSON file")
+    args = parser.parse_args()
+
+    forbidden = {name.strip() for name in args.forbid.split(',') if name.strip()}
+    reports = []
+    for module in args.module or ['main']:
+        try:
+            report = benchmark(module, max(1, args.runs), args.budget_ms, forbidden, args.top)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(2)
+        reports.append(report)
+
+        marker = '✅' if report['ok'] else '❌'
+        print(f"{marker} import {module}: {report['median_ms']:.1f}ms median "
+              f"(min {report['min_ms']:.1f}ms, budget {args.budget_ms:.0f}ms, {report['runs']} runs)")
+        for entry in report['heaviest_packages']:
+            print(f"     {entry['self_ms']:8.1f}ms  {entry['package']}")
+        if report['forbidden_imports']:
+            print(f"   Imported at import time (should be lazy): {', '.join(report['forbidden_imports'])}")
+        if report['threads_at_import']:
+            print(f"   Threads started at import time: {', '.join(report['threads_at_import'])}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': reports}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+    sys.exit(0 if all(report['ok'] for report in reports) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Query-plan auditor for the API's MongoDB queries.
+
+Loads a synthetic dataset into a scratch database (dropped and rebuilt on
+every run) with the indexes from database.INDEX_SPECS, runs explain() with
+executionStats on every query shape in QUERY_SHAPES and flags:
+
+- COLLSCAN: the query reads the whole collection
+- in-memory SORT: no index provides the requested order
+- poor selectivity: far more documents/keys examined than returned
+
+For each flagged shape it proposes a compound index (equality fields, then
+sort fields, then range fields) in INDEX_SPECS format. The script also scans
+main.py, order_tracking.py and customer_profiles.py for collection reads and
+lists any that no shape covers, so the registry keeps up with the code.
+
+Point it at a local, disposable MongoDB: the target database is dropped.
+
+Examples:
+    python scripts/query-audit.py
+    python scripts/query-audit.py --orders 100000 --output audit.json
+    python scripts/query-audit.py --fail-on-findings   # non-zero exit for CI
+"""
+
+import argparse
+import ast
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import IndexModel, MongoClient
+
+# Add the parent directory to the path so we can import our modules
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from database import INDEX_SPECS, index_name
+
+STATUSES = ['pending', 'confirmed', 'shipped', 'delivered', 'cancelled']
+CATEGORIES = ['Electronics', 'Clothing', 'Books', 'Home & Garden', 'Sports']
+READ_METHODS = {'find', 'find_one', 'count_documents', 'aggregate', 'distinct'}
+RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte', '$ne', '$nin', '$exists'}
+
+# Query shapes issued by the API. `filter`/`pipeline` take the sample values
+# drawn from the synthetic data; `sources` are the functions that issue them.
+QUERY_SHAPES = [
+    {'name': 'low-stock scan', 'sources': ['main.py:low_stock_scanner'],
+     'collection': 'products', 'op': 'find',
+     'filter': lambda s: {'is_active': True, 'stock_margin': {'$lte': 0}}},
+    {'name': 'login / register by email', 'sources': ['main.py:register', 'main.py:login', 'main.py:create_user'],
+     'collection': 'users', 'op': 'find',
+     'filter': lambda s: {'email': s['email']}, 'limit': 1},
+    {'name': 'GET /users (admin)', 'sources': ['main.py:get_users'],
+     'collection': 'users', 'op': 'find',
+     'filter': lambda s: {'role': 'customer'}, 'limit': 100},
+    {'name': 'GET /products?category=', 'sources': ['main.py:get_products'],
+     'collection': 'products', 'op': 'find',
+     'filter': lambda s: {'is_active': True, 'category': s['category']}, 'limit': 100},
+    {'name': 'GET /products?search=', 'sources': ['main.py:get_products'],
+     'collection': 'products', 'op': 'find',
+     'filter': lambda s: {'is_active': True, '$text': {'$search': 'wireless'}}, 'limit': 100},
+    {'name': 'GET /orders (customer)', 'sources': ['main.py:get_orders'],
+     'collection': 'orders', 'op': 'find',
+     'filter': lambda s: {'customer_id': s['customer_id']}, 'sort': [('created_at', -1)], 'limit': 100},
+    {'name': 'GET /orders (admin)', 'sources': ['main.py:get_orders'],
+     'collection': 'orders', 'op': 'find',
+     'filter': lambda s: {}, 'sort': [('created_at', -1)], 'limit': 100},
+    {'name': 'GET /admin/recent-orders', 'sources': ['main.py:get_recent_orders'],
+     'collection': 'orders', 'op': 'find',
+     'filter': lambda s: {}, 'sort': [('created_at', -1)], 'limit': 10},
+    {'name': 'GET /admin/stats revenue', 'sources': ['main.py:get_admin_stats'],
+     'collection': 'orders', 'op': 'find',
+     'filter': lambda s: {'status': {'$in': ['confirmed', 'shipped', 'delivered']}}},
+    {'name': 'GET /admin/stats totals', 'sources': ['main.py:get_admin_stats', 'main.py:delete_all_orders'],
+     'collection': 'orders', 'op': 'count',
+     'filter': lambda s: {},
+     'note': 'unfiltered totals: estimated_document_count() reads collection metadata instead'},
+    {'name': 'GET /admin/stats active products', 'sources': ['main.py:get_admin_stats'],
+     'collection': 'products', 'op': 'count',
+     'filter': lambda s: {'is_active': True}},
+    {'name': 'cart by customer', 'sources': ['main.py:get_cart', 'main.py:add_to_cart', 'main.py:get_cart_summary',
+                 'main.py:checkout_cart'],
+     'collection': 'carts', 'op': 'find',
+     'filter': lambda s: {'customer_id': s['customer_id']}, 'limit': 1},
+    {'name': 'GET /feedback/summary processed', 'sources': ['main.py:get_feedback_summary'],
+     'collection': 'feedback', 'op': 'count',
+     'filter': lambda s: {'user_id': s['customer_id'], 'processed': True}},
+    {'name': 'GET /feedback/product/{id}', 'sources': ['main.py:get_product_feedback'],
+     'collection': 'feedback', 'op': 'find',
+     'filter': lambda s: {'product_id': s['product_id']}, 'sort': [('created_at', -1)]},
+    {'name': 'GET /feedback/all', 'sources': ['main.py:get_all_feedback'],
+     'collection': 'feedback', 'op': 'find',
+     'filter': lambda s: {}, 'sort': [('created_at', -1)]},
+    {'name': 'order tracking history', 'sources': ['order_tracking.py:get_order_tracking_info'],
+     'collection': 'order_status_history', 'op': 'find',
+     'filter': lambda s: {'order_id': s['order_id']}, 'sort': [('timestamp', 1)]},
+    {'name': 'customer profile aggregate', 'sources': ['customer_profiles.py:_load'],
+     'collection': 'orders', 'op': 'aggregate',
+     'pipeline': lambda s: [
+         {'$match': {'customer_id': s['customer_id']}},
+         {'$group': {'_id': '$customer_id', 'order_count': {'$sum': 1},
+                     'total_spend': {'$sum': '$total_amount'},
+                     'first_seen': {'$min': '$created_at'}, 'last_seen': {'$max': '$created_at'}}},
+     ]},
+]
+
+
+def build_dataset(db, args, rng):
+    """Insert synthetic users, products, orders, carts, feedback and status history"""
+    now = datetime.utcnow()
+    customer_ids = [str(ObjectId()) for _ in range(args.customers)]
+    db.users.insert_many([{
+        '_id': ObjectId(cid), 'email': f"customer{i}@example.com", 'name': f"Customer {i}",
+        'role': 'customer' if i % 50 else 'admin', 'is_active': True, 'created_at': now,
+    } for i, cid in enumerate(customer_ids)])
+
+    product_ids = [str(ObjectId()) for _ in range(args.products)]
+    products = []
+    for i, pid in enumerate(product_ids):
+        stock = rng.randint(0, 200)
+        products.append({
+            '_id': ObjectId(pid), 'name': f"{rng.choice(['Wireless', 'Classic', 'Smart'])} item {i}",
+            'description': 'Synthetic product', 'category': rng.choice(CATEGORIES), 'brand': f"brand{i % 40}",
+            'sku': f"SKU-{i}", 'is_active': rng.random() > 0.05, 'stock_quantity': stock,
+            'low_stock_threshold': 10, 'stock_margin': stock - 10, 'created_at': now,
+        })
+    db.products.insert_many(products)
+
+    orders = []
+    for i in range(args.orders):
+        # 20% of orders come from ten heavy customers, the rest spread evenly
+        customer_id = customer_ids[rng.randrange(10) if rng.random() < 0.2 else rng.randrange(args.customers)]
+        orders.append({
+            '_id': ObjectId(), 'customer_id': customer_id, 'status': rng.choice(STATUSES),
+            'payment_status': rng.choice(['pending', 'completed', 'failed']), 'channel': 'web',
+            'total_amount': round(rng.uniform(5, 500), 2),
+            'created_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+        })
+    db.orders.insert_many(orders)
+
+    db.carts.insert_many([{'customer_id': cid, 'items': [], 'updated_at': now} for cid in customer_ids])
+    db.feedback.insert_many([{
+        'user_id': rng.choice(customer_ids), 'product_id': rng.choice(product_ids),
+        'text': 'Synthetic feedback', 'rating': rng.randint(1, 5), 'feedback_type': 'review',
+        'processed': rng.random() > 0.3, 'created_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+    } for _ in range(args.feedback)])
+    db.order_status_history.insert_many([{
+        'order_id': str(order['_id']), 'customer_id': order['customer_id'], 'old_status': 'pending',
+        'new_status': status, 'timestamp': order['created_at'] + timedelta(hours=step),
+    } for order in orders[:args.orders // 2] for step, status in enumerate(STATUSES[:3])])
+
+    # The heaviest customer: the shape that hurts most without an index
+    return {
+        'customer_id': customer_ids[0], 'email': 'customer1@example.com',
+        'product_id': product_ids[0], 'category': CATEGORIES[0], 'order_id': str(orders[0]['_id']),
+    }
+
+
+def create_spec_indexes(db):
+    for name, specs in INDEX_SPECS.items():
+        db[name].create_indexes([IndexModel(keys, name=index_name(keys), **options) for keys, options in specs])
+
+
+def explain(db, shape, sample):
+    collection = shape['collection']
+    if shape['op'] == 'find':
+        command = {'find': collection, 'filter': shape['filter'](sample)}
+        if shape.get('sort'):
+            command['sort'] = dict(shape['sort'])
+        if shape.get('limit'):
+            command['limit'] = shape['limit']
+    elif shape['op'] == 'count':
+        # What count_documents() sends
+        command = {'aggregate': collection, 'cursor': {}, 'pipeline': [
+            {'$match': shape['filter'](sample)}, {'$group': {'_id': 1, 'n': {'$sum': 1}}}]}
+    else:
+        command = {'aggregate': collection, 'pipeline': shape['pipeline'](sample), 'cursor': {}}
+    return db.command('explain', command, verbosity='executionStats')
+
+
+def walk(node, found):
+    """Collect stage names, index names and execution stats from any explain layout (classic or SBE)"""
+    if isinstance(node, dict):
+        if 'stage' in node:
+            found['stages'].add(node['stage'].upper())
+        if 'indexName' in node:
+            found['indexes'].add(node['indexName'])
+        if 'executionStats' in node and 'totalDocsExamined' in node['executionStats']:
+            found['stats'].append(node['executionStats'])
+        for value in node.values():
+            walk(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            walk(value, found)
+    return found
+
+
+def propose_index(shape, sample):
+    """Equality fields, then sort, then range fields (the ESR rule)"""
+    query = shape['pipeline'](sample)[0]['$match'] if shape['op'] == 'aggregate' else shape['filter'](sample)
+    if '$text' in query:
+        return None
+    equality, ranges = [], []
+    for field, value in query.items():
+        if field.startswith('$'):
+            continue
+        if isinstance(value, dict) and RANGE_OPERATORS & set(value):
+            ranges.append((field, 1))
+        else:
+            equality.append((field, 1))
+    keys = equality + list(shape.get('sort') or []) + ranges
+    return keys or None
+
+
+def audit_shape(db, shape, sample, selectivity_threshold):
+    started = time.perf_counter()
+    found = walk(explain(db, shape, sample), {'stages': set(), 'indexes': set(), 'stats': []})
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    stats = found['stats'][0] if found['stats'] else {}
+    returned = stats.get('nReturned', 0)
+    docs_examined = stats.get('totalDocsExamined', 0)
+    keys_examined = stats.get('totalKeysExamined', 0)
+
+    findings = []
+    if 'COLLSCAN' in found['stages']:
+        findings.append('COLLSCAN')
+    if 'SORT' in found['stages']:
+        findings.append('in-memory SORT')
+    if 'COLLSCAN' not in found['stages'] and max(docs_examined, keys_examined) > selectivity_threshold * max(returned, 1):
+        findings.append('poor selectivity')
+
+    result = {
+        'shape': shape['name'],
+        'collection': shape['collection'],
+        'sources': shape['sources'],
+        'stages': sorted(found['stages']),
+        'indexes_used': sorted(found['indexes']),
+        'returned': returned,
+        'docs_examined': docs_examined,
+        'keys_examined': keys_examined,
+        'limit': shape.get('limit'),
+        'explain_ms': round(elapsed_ms, 2),
+        'findings': findings,
+    }
+    if findings:
+        if shape.get('note'):
+            result['note'] = shape['note']
+        keys = propose_index(shape, sample)
+        existing = {index_name(k) for k, _ in INDEX_SPECS.get(shape['collection'], [])}
+        if keys and index_name(keys) not in existing:
+            result['proposed_index'] = f'"{shape["collection"]}": ({keys!r}, {{}})'
+    return result
+
+
+def read_call_sites(paths):
+    """Collection reads in the API modules: (file:function, collection, method, line)"""
+    sites = []
+    for path in paths:
+        with open(os.path.join(BACKEND_DIR, path)) as f:
+            tree = ast.parse(f.read())
+        for func in ast.walk(tree):
+            if not isinstance(func, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            for node in ast.walk(func):
+                if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                        and node.func.attr in READ_METHODS):
+                    continue
+                target = node.func.value
+                collection = (target.id if isinstance(target, ast.Name)
+                              else target.attr if isinstance(target, ast.Attribute) else None)
+                if not collection or not collection.endswith('collection'):
+                    continue
+                # Lookups by _id are always served by the _id index
+                first = node.args[0] if node.args else None
+                if isinstance(first, ast.Dict) and any(
+                        isinstance(k, ast.Constant) and k.value == '_id' for k in first.keys):
+                    continue
+                sites.append({'source': f"{path}:{func.name}", 'collection': collection,
+                              'method': node.func.attr, 'line': node.lineno})
+    return sites
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Explain the API's MongoDB query shapes against a synthetic dataset")
+    parser.add_argument('--mongodb-url', default=os.getenv('QUERY_AUDIT_MONGODB_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default='query_audit', help="Scratch database (dropped on every run)")
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--feedback', type=int, default=5000)
+    parser.add_argument('--selectivity', type=float, default=10.0,
+                        help="Flag shapes examining more than this many docs/keys per document returned")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fail-on-findings', action='store_true', help="Exit with status 1 if anything is flagged")
+    parser.add_argument('--output', help="Write the machine-readable result to this JSON file")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongodb_url, serverSelectionTimeoutMS=5000)
+    client.drop_database(args.database)
+    db = client[args.database]
+    print(f"🧪 Loading synthetic data into {args.database} ({args.orders} orders, {args.customers} customers)")
+    sample = build_dataset(db, args, random.Random(args.seed))
+    create_spec_indexes(db)
+
+    results = [audit_shape(db, shape, sample, args.selectivity) for shape in QUERY_SHAPES]
+    for r in results:
+        mark = '❌' if r['findings'] else '✅'
+        print(f"{mark} {r['shape']:<36} {','.join(r['stages']):<40} "
+              f"returned {r['returned']:>6}  docs {r['docs_examined']:>6}  keys {r['keys_examined']:>6}")
+        for finding in r['findings']:
+            print(f"      ⚠️  {finding}")
+        if r.get('note'):
+            print(f"      💡 {r['note']}")
+        if r.get('proposed_index'):
+            print(f"      💡 add to INDEX_SPECS: {r['proposed_index']}")
+
+    covered = {source for shape in QUERY_SHAPES for source in shape['sources']}
+    uncovered = [site for site in read_call_sites(['main.py', 'order_tracking.py', 'customer_profiles.py'])
+                 if site['source'] not in covered]
+    if uncovered:
+        print(f"🔍 {len(uncovered)} collection reads not covered by QUERY_SHAPES:")
+        for site in uncovered:
+            print(f"      {site['source']}:{site['line']} {site['collection']}.{site['method']}")
+
+    flagged = sum(1 for r in results if r['findings'])
+    print(f"{'⚠️ ' if flagged else '✅'} {flagged}/{len(results)} query shapes flagged")
+    client.drop_database(args.database)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'query-audit', 'config': vars(args), 'shapes': results,
+                       'uncovered_reads': uncovered}, f, indent=2, default=str)
+        print(f"📝 Result written to {args.output}")
+
+    if args.fail_on_findings and flagged:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
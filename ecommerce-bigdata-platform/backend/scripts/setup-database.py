@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+One-shot database setup: indexes, data migrations and default records.
+
+Run once per deploy (or whenever INDEX_SPECS change) and start the API
+workers with DATABASE_SETUP_ON_STARTUP=false, so they no longer check
+indexes or seed data on every cold start.
+
+Without --force the index check is skipped when schema_meta already
+records the current index spec hash; --force re-checks every collection
+against list_indexes and builds whatever is missing.
+
+Examples:
+    python scripts/setup-database.py
+    python scripts/setup-database.py --force --output setup.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DATABASE_NAME, INDEX_SPECS_HASH, close_database, connect_database, init_database
+from logging_config import configure_logging
+
+
+async def run(force):
+    connect_database()
+    try:
+        return await init_database(force=force)
+    finally:
+        close_database()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create indexes and seed default data")
+    parser.add_argument('--force', action='store_true', help="Re-check indexes even if the spec hash is recorded")
+    parser.add_argument('--output', help="Write the machine-readable result to this JSON file")
+    args = parser.parse_args()
+    configure_logging(fmt='text')
+
+    print(f"🗄️  Setting up database {DATABASE_NAME} (index spec {INDEX_SPECS_HASH[:12]})")
+    result = asyncio.run(run(args.force))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'database': DATABASE_NAME, 'spec_hash': INDEX_SPECS_HASH, **result}, f, indent=2)
+        print(f"📝 Result written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
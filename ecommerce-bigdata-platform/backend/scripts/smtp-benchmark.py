@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+SMTP throughput benchmark: one connection per message vs the pooled client.
+
+Starts a local SMTP sink (a minimal stand-in for aiosmtpd that accepts and
+discards mail) and sends the same messages through both paths:
+
+- per-message: a new smtplib.SMTP connection for every email, as
+  NotificationService.send_email used to do
+- pooled: SMTPConnectionPool, reusing sessions across messages
+
+--handshake-ms delays the sink's greeting to model the TCP/TLS/AUTH cost of
+a real mail server, which is what pooling saves.
+
+Examples:
+    python scripts/smtp-benchmark.py --messages 500
+    python scripts/smtp-benchmark.py --messages 2000 --handshake-ms 50 --threads 4 --output smtp.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import smtplib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smtp_pool import SMTPConnectionPool
+
+
+class SMTPSink:
+    """Accepts SMTP sessions on localhost and discards every message"""
+
+    def __init__(self, handshake_delay):
+        self.handshake_delay = handshake_delay
+        self.messages = 0
+        self.connections = 0
+        self.port = None
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+
+    async def _session(self, reader, writer):
+        self.connections += 1
+        if self.handshake_delay:
+            await asyncio.sleep(self.handshake_delay)
+        writer.write(b"220 sink ESMTP\r\n")
+        in_data = False
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if in_data:
+                if line == b".\r\n":
+                    in_data = False
+                    self.messages += 1
+                    writer.write(b"250 OK queued\r\n")
+                continue
+            command = line[:4].upper()
+            if command == b"EHLO":
+                writer.write(b"250-sink\r\n250 8BITMIME\r\n")
+            elif command == b"DATA":
+                in_data = True
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif command == b"QUIT":
+                writer.write(b"221 Bye\r\n")
+                await writer.drain()
+                break
+            elif command == b"HELO":
+                writer.write(b"250 sink\r\n")
+            else:  # MAIL, RCPT, RSET, NOOP
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        writer.close()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._session, '127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+        return self
+
+
+def build_messages(count):
+    messages = []
+    for i in range(count):
+        msg = MIMEText(f"Your order #{i} status has been updated to shipped.", 'plain')
+        msg['Subject'] = f"Order #{i} Status Update: Shipped"
+        msg['From'] = 'noreply@ecommerce.com'
+        msg['To'] = f"customer{i}@example.com"
+        messages.append(msg)
+    return messages
+
+
+def send_per_message(port, msg):
+    with smtplib.SMTP('127.0.0.1', port) as server:
+        server.send_message(msg)
+
+
+def run(label, send, messages, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(send, messages))
+    duration = time.perf_counter() - started
+    result = {
+        'messages': len(messages),
+        'duration_s': round(duration, 4),
+        'messages_per_second': round(len(messages) / duration, 1),
+    }
+    print(f"   {label:<12} {result['messages_per_second']:>10} msg/s  ({result['duration_s']}s)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-message SMTP connections with the pooled client")
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4, help="Concurrent senders (and pool size)")
+    parser.add_argument('--handshake-ms', type=float, default=20.0, help="Simulated connection setup latency")
+    parser.add_argument('--output', help="Write the machine-readable result to this JSON file")
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.handshake_ms / 1000.0).start()
+    messages = build_messages(args.messages)
+    print(f"📧 Sending {args.messages} messages to a local SMTP sink "
+          f"({args.threads} threads, {args.handshake_ms}ms handshake)")
+
+    per_message = run('per-message', lambda msg: send_per_message(sink.port, msg), messages, args.threads)
+    per_message_connections = sink.connections
+
+    pool = SMTPConnectionPool('127.0.0.1', sink.port, size=args.threads, max_messages=10 ** 9)
+    pooled = run('pooled', pool.send_message, messages, args.threads)
+    pool.close()
+
+    result = {
+        'benchmark': 'smtp',
+        'config': vars(args),
+        'per_message': {**per_message, 'connections': per_message_connections},
+        'pooled': {**pooled, 'connections': pool.stats['connections_opened']},
+        'speedup': round(pooled['messages_per_second'] / per_message['messages_per_second'], 2),
+    }
+    print(f"✅ Pooled is {result['speedup']}x faster "
+          f"({result['pooled']['connections']} vs {result['per_message']['connections']} connections)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"📝 Result written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -67,4 +67,4 @@ print_success "API Documentation: http://localhost:8000/docs"
 echo ""
 
 # Start uvicorn with reload for development
-uvicorn main:app --host 0.0.0.0 --port 8000 --reload 
\ No newline at end of file
+uvicorn main:create_app --factory --host 0.0.0.0 --port 8000 --reload 
\ No newline at end of file
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Email render benchmark: per-call f-string bodies vs precompiled templates.
+
+Measures the cost per message of producing an order status email
+three ways:
+
+- inline: the f-string subject/text/HTML bodies the notify_* methods used
+  to rebuild on every call
+- template: EmailTemplate.render, one message at a time
+- bulk: EmailTemplate.render_many over all recipients at once
+
+Each is reported for rendering alone and for render + MIME serialization
+(what actually goes on the wire), where the template path also uses the
+precompiled MIME layout (build_mime) instead of an email.mime Message tree.
+
+Examples:
+    python scripts/template-benchmark.py
+    python scripts/template-benchmark.py --messages 50000 --output templates.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_templates import build_mime, get_template
+
+
+def inline_render(order_id, old_status, new_status, order_details):
+    """The pre-template notify_order_status_change body construction"""
+    subject = f"Order #{order_id} Status Update: {new_status.title()}"
+
+    body = f"""
+        Your order status has been updated!
+
+        Order ID: {order_id}
+        Previous Status: {old_status.title()}
+        New Status: {new_status.title()}
+        Total Amount: ${order_details.get('total_amount', 0):.2f}
+
+        Track your order at: http://localhost:3000/orders/{order_id}
+
+        Thank you for shopping with us!
+        """
+
+    html_body = f"""
+        <html>
+        <body>
+            <h2>Order Status Update</h2>
+            <p>Your order status has been updated!</p>
+            <table>
+                <tr><td><strong>Order ID:</strong></td><td>{order_id}</td></tr>
+                <tr><td><strong>Previous Status:</strong></td><td>{old_status.title()}</td></tr>
+                <tr><td><strong>New Status:</strong></td><td>{new_status.title()}</td></tr>
+                <tr><td><strong>Total Amount:</strong></td><td>${order_details.get('total_amount', 0):.2f}</td></tr>
+            </table>
+            <p><a href="http://localhost:3000/orders/{order_id}">Track your order</a></p>
+            <p>Thank you for shopping with us!</p>
+        </body>
+        </html>
+        """
+    return subject, body, html_body
+
+
+def to_mime(to_email, subject, body, html_body):
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = 'noreply@ecommerce.com'
+    msg['To'] = to_email
+    msg.attach(MIMEText(body, 'plain'))
+    msg.attach(MIMEText(html_body, 'html'))
+    return msg.as_bytes()
+
+
+def build_orders(count):
+    return [{
+        'to_email': f"customer{i}@example.com",
+        'order_id': f"65f0c0ffee{i:014d}",
+        'old_status': 'confirmed',
+        'new_status': 'shipped',
+        'order_details': {'total_amount': 19.99 + i % 500},
+    } for i in range(count)]
+
+
+def template_context(order):
+    return {
+        'order_id': order['order_id'],
+        'old_status_title': order['old_status'].title(),
+        'new_status_title': order['new_status'].title(),
+        'total_amount': order['order_details'].get('total_amount', 0),
+    }
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure email render cost per message")
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--output', help="Write the machine-readable result to this JSON file")
+    args = parser.parse_args()
+
+    orders = build_orders(args.messages)
+    template = get_template('order_status_change')
+
+    def inline_only():
+        for o in orders:
+            inline_render(o['order_id'], o['old_status'], o['new_status'], o['order_details'])
+
+    def template_only():
+        for o in orders:
+            template.render(template_context(o))
+
+    def bulk_only():
+        template.render_many(template_context(o) for o in orders)
+
+    def inline_mime():
+        for o in orders:
+            to_mime(o['to_email'], *inline_render(o['order_id'], o['old_status'], o['new_status'], o['order_details']))
+
+    def template_mime():
+        for o in orders:
+            build_mime('noreply@ecommerce.com', o['to_email'], *template.render(template_context(o)))
+
+    def bulk_mime():
+        rendered = template.render_many(template_context(o) for o in orders)
+        for o, email in zip(orders, rendered):
+            build_mime('noreply@ecommerce.com', o['to_email'], *email)
+
+    results = {}
+    print(f"✉️  Rendering {args.messages} order status emails")
+    for name, fn in (('inline', inline_only), ('template', template_only), ('bulk', bulk_only),
+                     ('inline+mime', inline_mime), ('template+mime', template_mime), ('bulk+mime', bulk_mime)):
+        per_message_us = timed(fn) / args.messages * 1e6
+        results[name] = {'us_per_message': round(per_message_us, 2)}
+        print(f"   {name:<14} {per_message_us:8.2f} us/message")
+    speedup = results['inline+mime']['us_per_message'] / results['template+mime']['us_per_message']
+    results['speedup_with_mime'] = round(speedup, 2)
+    print(f"✅ Rendered and serialized {speedup:.1f}x faster than the inline path")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'email-templates', 'config': vars(args), **results}, f, indent=2)
+        print(f"📝 Result written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Webhook delivery benchmark: bare requests.post vs the pooled async client.
+
+Starts a local HTTP stand-in receiver (keep-alive HTTP/1.1, optional
+per-request latency and connection setup cost) and delivers the same
+notifications three ways:
+
+- requests: a fresh requests.post per notification from a thread pool, as
+  NotificationService.send_webhook used to do
+- pooled: WebhookClient with keep-alive connections and bounded concurrency
+- batched: WebhookClient posting --batch-size notifications per request
+
+Examples:
+    python scripts/webhook-benchmark.py --notifications 1000
+    python scripts/webhook-benchmark.py --latency-ms 20 --connect-ms 30 --batch-size 25 --output webhooks.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook_client import WebhookClient
+
+
+class WebhookReceiver:
+    """Minimal keep-alive HTTP server that answers 200 to every POST"""
+
+    def __init__(self, latency, connect_cost):
+        self.latency = latency
+        self.connect_cost = connect_cost
+        self.requests = 0
+        self.notifications = 0
+        self.connections = 0
+        self.port = None
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+
+    async def _connection(self, reader, writer):
+        self.connections += 1
+        if self.connect_cost:
+            # Stands in for TCP + TLS setup on a real receiver
+            await asyncio.sleep(self.connect_cost)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                keep_alive = True
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    name = name.strip().lower()
+                    if name == b"content-length":
+                        length = int(value)
+                    elif name == b"connection" and value.strip().lower() == b"close":
+                        keep_alive = False
+                body = await reader.readexactly(length) if length else b""
+                self.requests += 1
+                payload = json.loads(body) if body else {}
+                self.notifications += payload.get('count', 1) if payload.get('type') == 'batch' else 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nContent-Type: application/json\r\n"
+                             + (b"Connection: keep-alive\r\n" if keep_alive else b"Connection: close\r\n")
+                             + b"\r\n{}")
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._connection, '127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+        return self
+
+    def reset(self):
+        self.requests = self.notifications = self.connections = 0
+
+
+def build_payloads(count):
+    return [{
+        'type': 'order_status_change',
+        'order_id': f"order_{i}",
+        'old_status': 'confirmed',
+        'new_status': 'shipped',
+        'timestamp': '2024-01-01T00:00:00'
+    } for i in range(count)]
+
+
+def run_requests(url, payloads, concurrency):
+    def post(payload):
+        return requests.post(url, json=payload, headers={'Content-Type': 'application/json'}, timeout=10)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(post, payloads))
+
+
+async def run_client(url, payloads, concurrency, batch_size):
+    client = WebhookClient(max_connections=concurrency, concurrency=concurrency,
+                           batch_size=batch_size, batch_window=0.05)
+    await asyncio.gather(*(client.send(url, payload) for payload in payloads))
+    await client.close()
+    return client.get_stats()
+
+
+def measure(label, receiver, count, fn):
+    receiver.reset()
+    started = time.perf_counter()
+    fn()
+    duration = time.perf_counter() - started
+    result = {
+        'duration_s': round(duration, 4),
+        'notifications_per_second': round(count / duration, 1),
+        'http_requests': receiver.requests,
+        'connections': receiver.connections,
+        'delivered': receiver.notifications,
+    }
+    print(f"   {label:<9} {result['notifications_per_second']:>10} notif/s  "
+          f"{result['http_requests']:>6} requests  {result['connections']:>5} connections")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare webhook delivery strategies against a local receiver")
+    parser.add_argument('--notifications', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Receiver processing time per request")
+    parser.add_argument('--connect-ms', type=float, default=10.0, help="Simulated connection setup cost")
+    parser.add_argument('--output', help="Write the machine-readable result to this JSON file")
+    args = parser.parse_args()
+
+    receiver = WebhookReceiver(args.latency_ms / 1000.0, args.connect_ms / 1000.0).start()
+    url = f"http://127.0.0.1:{receiver.port}/webhook"
+    payloads = build_payloads(args.notifications)
+    print(f"🔗 Delivering {args.notifications} webhooks to a local receiver "
+          f"(concurrency {args.concurrency}, {args.latency_ms}ms latency, {args.connect_ms}ms connect)")
+
+    results = {
+        'requests': measure('requests', receiver, args.notifications,
+                            lambda: run_requests(url, payloads, args.concurrency)),
+        'pooled': measure('pooled', receiver, args.notifications,
+                          lambda: asyncio.run(run_client(url, payloads, args.concurrency, 1))),
+        'batched': measure('batched', receiver, args.notifications,
+                           lambda: asyncio.run(run_client(url, payloads, args.concurrency, args.batch_size))),
+    }
+    baseline = results['requests']['notifications_per_second']
+    for name in ('pooled', 'batched'):
+        results[name]['speedup'] = round(results[name]['notifications_per_second'] / baseline, 2)
+    print(f"✅ Pooled {results['pooled']['speedup']}x, batched {results['batched']['speedup']}x vs requests.post")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'webhooks', 'config': vars(args), **results}, f, indent=2)
+        print(f"📝 Result written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
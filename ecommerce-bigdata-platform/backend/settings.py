@@ -0,0 +1,16 @@
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_env():
+    """Load the nearest .env into os.environ once per process (variables already set win)"""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            from dotenv import load_dotenv
+            load_dotenv()  # Searches upwards from this directory, as each module's own call did
+            _loaded = True
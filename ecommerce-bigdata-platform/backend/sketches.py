@@ -0,0 +1,222 @@
+import hashlib
+import math
+import os
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class CountMinSketch:
+    """Count-min sketch: estimates overcount by at most epsilon * total with probability 1 - delta"""
+
+    def __init__(self, epsilon: float = 0.001, delta: float = 0.01):
+        self.width = int(math.ceil(math.e / epsilon))
+        self.depth = int(math.ceil(math.log(1 / delta)))
+        self.rows = [array('q', bytes(8 * self.width)) for _ in range(self.depth)]
+        self.total = 0
+
+    def _indexes(self, key: str):
+        # Double hashing: one 64-bit hash gives every row's index
+        h = _hash64(key)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        width = self.width
+        return [(h1 + i * h2) % width for i in range(self.depth)]
+
+    def add(self, key: str, count: int = 1):
+        for row, index in zip(self.rows, self._indexes(key)):
+            row[index] += count
+        self.total += count
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def clear(self):
+        self.rows = [array('q', bytes(8 * self.width)) for _ in range(self.depth)]
+        self.total = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.width * self.depth * self.rows[0].itemsize
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with standard error of about 1.04 / sqrt(2 ** precision)"""
+
+    def __init__(self, precision: int = 10):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+        if self.m >= 128:
+            self.alpha = 0.7213 / (1 + 1.079 / self.m)
+        else:
+            self.alpha = {16: 0.673, 32: 0.697, 64: 0.709}[self.m]
+
+    @staticmethod
+    def precision_for_error(error: float) -> int:
+        """Smallest precision whose standard error is at most `error`"""
+        return min(16, max(4, int(math.ceil(math.log2((1.04 / error) ** 2)))))
+
+    def add(self, value: str):
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & _MASK64
+        rank = (64 - self.precision + 1) if rest == 0 else (64 - rest.bit_length() + 1)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog'):
+        registers = self.registers
+        for i, rank in enumerate(other.registers):
+            if rank > registers[i]:
+                registers[i] = rank
+
+    def count(self) -> int:
+        return self._estimate(self.registers)
+
+    def _estimate(self, registers) -> int:
+        m = self.m
+        raw = self.alpha * m * m / sum(2.0 ** -r for r in registers)
+        zeros = registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.m
+
+
+class WindowedCountMin:
+    """Count-min sketch over a sliding window, built from a ring of time buckets"""
+
+    def __init__(self, window_seconds: float = 3600, buckets: int = 6,
+                 epsilon: float = 0.001, delta: float = 0.01):
+        self.bucket_seconds = window_seconds / buckets
+        self.slots = [(None, CountMinSketch(epsilon, delta)) for _ in range(buckets)]
+
+    def _slot(self, ts: float) -> Optional[CountMinSketch]:
+        bucket_id = int(ts // self.bucket_seconds)
+        index = bucket_id % len(self.slots)
+        current_id, sketch = self.slots[index]
+        if current_id != bucket_id:
+            if current_id is not None and current_id > bucket_id:
+                # Event older than the window the slot now covers
+                return None
+            sketch.clear()
+            self.slots[index] = (bucket_id, sketch)
+        return sketch
+
+    def add(self, key: str, ts: float, count: int = 1):
+        sketch = self._slot(ts)
+        if sketch is not None:
+            sketch.add(key, count)
+
+    def estimate(self, key: str, ts: float) -> int:
+        """Approximate count of `key` in the window ending at `ts`"""
+        newest = int(ts // self.bucket_seconds)
+        oldest = newest - len(self.slots) + 1
+        live = [sketch for bucket_id, sketch in self.slots
+                if bucket_id is not None and oldest <= bucket_id <= newest]
+        if not live:
+            return 0
+        indexes = live[0]._indexes(key)
+        return min(sum(sketch.rows[row][index] for sketch in live)
+                   for row, index in enumerate(indexes))
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(sketch.memory_bytes for _, sketch in self.slots)
+
+
+class WindowedDistinctCounter:
+    """Per-key HyperLogLog over a sliding window with a fixed cap on tracked keys"""
+
+    def __init__(self, window_seconds: float = 3600, buckets: int = 6,
+                 error: float = 0.1, max_keys: int = 10000):
+        self.bucket_seconds = window_seconds / buckets
+        self.buckets = buckets
+        self.precision = HyperLogLog.precision_for_error(error)
+        self.max_keys = max_keys
+        self.keys: 'OrderedDict[str, list]' = OrderedDict()  # key -> ring of (bucket_id, HyperLogLog)
+
+    def add(self, key: str, value: str, ts: float):
+        bucket_id = int(ts // self.bucket_seconds)
+        ring = self.keys.get(key)
+        if ring is None:
+            if len(self.keys) >= self.max_keys:
+                # Evict the least recently updated key to keep memory fixed
+                self.keys.popitem(last=False)
+            ring = self.keys[key] = [None] * self.buckets
+        else:
+            self.keys.move_to_end(key)
+        index = bucket_id % self.buckets
+        slot = ring[index]
+        if slot is None or slot[0] != bucket_id:
+            if slot is not None and slot[0] > bucket_id:
+                return
+            slot = ring[index] = (bucket_id, HyperLogLog(self.precision))
+        slot[1].add(value)
+
+    def count(self, key: str, ts: float, include: Optional[str] = None) -> int:
+        """Approximate number of distinct values seen for `key` in the window ending at `ts`,
+        counting `include` as seen as well"""
+        merged = HyperLogLog(self.precision)
+        if include is not None:
+            merged.add(include)
+        ring = self.keys.get(key)
+        if ring is not None:
+            newest = int(ts // self.bucket_seconds)
+            oldest = newest - self.buckets + 1
+            for slot in ring:
+                if slot is not None and oldest <= slot[0] <= newest:
+                    merged.merge(slot[1])
+        return merged.count()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.max_keys * self.buckets * (1 << self.precision)
+
+
+class FraudSketches:
+    """Approximate high-cardinality fraud signals with fixed memory"""
+
+    def __init__(self, window_seconds: float = 3600, epsilon: Optional[float] = None,
+                 delta: Optional[float] = None, error: Optional[float] = None,
+                 max_keys: Optional[int] = None):
+        epsilon = epsilon or float(os.getenv('SKETCH_EPSILON', '0.001'))
+        delta = delta or float(os.getenv('SKETCH_DELTA', '0.01'))
+        error = error or float(os.getenv('SKETCH_HLL_ERROR', '0.1'))
+        max_keys = max_keys or int(os.getenv('SKETCH_MAX_KEYS', '10000'))
+
+        self.ip_counts = WindowedCountMin(window_seconds, epsilon=epsilon, delta=delta)
+        self.device_counts = WindowedCountMin(window_seconds, epsilon=epsilon, delta=delta)
+        self.customer_ips = WindowedDistinctCounter(window_seconds, error=error, max_keys=max_keys)
+        self.device_customers = WindowedDistinctCounter(window_seconds, error=error, max_keys=max_keys)
+
+    def record(self, customer_id: Optional[str], ip_address: str, device_id: str, ts: float):
+        """Add one transaction to every sketch it applies to"""
+        if ip_address:
+            self.ip_counts.add(ip_address, ts)
+        if device_id:
+            self.device_counts.add(device_id, ts)
+        if customer_id and ip_address:
+            self.customer_ips.add(customer_id, ip_address, ts)
+        if device_id and customer_id:
+            self.device_customers.add(device_id, customer_id, ts)
+
+    def get_stats(self) -> dict:
+        return {
+            'customers_tracked': len(self.customer_ips.keys),
+            'devices_tracked': len(self.device_customers.keys),
+            'max_memory_bytes': (self.ip_counts.memory_bytes + self.device_counts.memory_bytes +
+                             self.customer_ips.memory_bytes + self.device_customers.memory_bytes),
+        }
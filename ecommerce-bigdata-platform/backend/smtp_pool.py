@@ -0,0 +1,162 @@
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.message import Message
+from typing import Any, Dict, Iterable, Optional, Union
+
+from email_templates import RawEmail
+
+logger = logging.getLogger(__name__)
+
+Email = Union[Message, RawEmail]
+
+# Errors after which a session is considered dead and is replaced
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class PooledSMTPConnection:
+    """An authenticated SMTP session plus the bookkeeping the pool needs to retire it"""
+
+    __slots__ = ('smtp', 'created', 'last_used', 'messages')
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.created = self.last_used = time.monotonic()
+        self.messages = 0
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+
+
+class SMTPConnectionPool:
+    """Thread-safe pool of SMTP sessions that stay connected and logged in between messages.
+
+    Opening a session costs a TCP connect, EHLO, STARTTLS and AUTH; the pool
+    pays that once per session and then sends many messages over it. Sessions
+    idle longer than the server is likely to keep them, or that have sent
+    max_messages, are replaced; a send that fails on a broken session is
+    retried once on a fresh one.
+    """
+
+    def __init__(self, host: str, port: int, username: str = '', password: str = '',
+                 size: Optional[int] = None, idle_timeout: Optional[float] = None,
+                 max_messages: Optional[int] = None, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size or int(os.getenv('SMTP_POOL_SIZE', '4'))
+        self.idle_timeout = idle_timeout or float(os.getenv('SMTP_POOL_IDLE_SECONDS', '60'))
+        self.max_messages = max_messages or int(os.getenv('SMTP_POOL_MAX_MESSAGES', '100'))
+        self.timeout = timeout
+        self._idle: 'queue.LifoQueue[PooledSMTPConnection]' = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self.stats = {'connections_opened': 0, 'connections_reused': 0, 'messages_sent': 0, 'reconnects': 0}
+
+    @property
+    def requires_auth(self) -> bool:
+        return bool(self.username and self.password)
+
+    def _connect(self) -> PooledSMTPConnection:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.requires_auth:
+                smtp.starttls()
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._count('connections_opened')
+        return PooledSMTPConnection(smtp)
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _acquire(self) -> PooledSMTPConnection:
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if time.monotonic() - conn.last_used < self.idle_timeout and conn.messages < self.max_messages:
+                    self._count('connections_reused')
+                    return conn
+                conn.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn: Optional[PooledSMTPConnection]):
+        if conn is not None:
+            conn.last_used = time.monotonic()
+            self._idle.put(conn)
+        self._slots.release()
+
+    @staticmethod
+    def _transmit(smtp: smtplib.SMTP, msg: Email):
+        if isinstance(msg, RawEmail):
+            smtp.sendmail(msg.from_addr, msg.to_addrs, msg.data)
+        else:
+            smtp.send_message(msg)
+
+    def _send(self, conn: PooledSMTPConnection, msg: Email) -> PooledSMTPConnection:
+        """Send on conn, replacing it once if the session turns out to be dead; returns the live session"""
+        try:
+            self._transmit(conn.smtp, msg)
+        except CONNECTION_ERRORS:
+            conn.close()
+            self._count('reconnects')
+            conn = self._connect()
+            self._transmit(conn.smtp, msg)
+        conn.messages += 1
+        self._count('messages_sent')
+        return conn
+
+    def send_message(self, msg: Email):
+        """Send one message; raises on failure"""
+        self.send_messages([msg], raise_errors=True)
+
+    def send_messages(self, messages: Iterable[Email], raise_errors: bool = False) -> int:
+        """Send messages back to back over one pooled session; returns how many were accepted"""
+        conn = self._acquire()
+        sent = 0
+        try:
+            for msg in messages:
+                try:
+                    conn = self._send(conn, msg)
+                    sent += 1
+                except smtplib.SMTPRecipientsRefused as e:
+                    # The session is still usable; only this message failed
+                    if raise_errors:
+                        raise
+                    subject = msg.subject if isinstance(msg, RawEmail) else msg['Subject']
+                    logger.error("❌ SMTP refused recipients of '%s': %s", subject, e)
+        except Exception:
+            # Unknown session state: don't hand it to the next sender
+            conn.close()
+            conn = None
+            raise
+        finally:
+            self._release(conn)
+        return sent
+
+    def close(self):
+        """Close all idle sessions"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'idle_connections': self._idle.qsize(), 'size': self.size}
@@ -0,0 +1,85 @@
+import heapq
+from typing import Dict, Any, List, Optional, Tuple
+
+CRITICAL_STOCK_LEVEL = 5
+SEVERITY_RANK = {'normal': 0, 'warning': 1, 'critical': 2}
+
+
+def stock_severity(current_stock: int, threshold: int) -> str:
+    """Classify a stock level against its threshold"""
+    if current_stock <= CRITICAL_STOCK_LEVEL:
+        return 'critical'
+    if current_stock <= threshold:
+        return 'warning'
+    return 'normal'
+
+
+def severity_escalated(previous_severity: Optional[str], severity: str) -> bool:
+    """True when a product moved to a worse severity than it had before"""
+    return SEVERITY_RANK[severity] > SEVERITY_RANK.get(previous_severity or 'normal', 0)
+
+
+class StockIndex:
+    """Current stock level per product with a min-heap of products at or below threshold.
+
+    Each update is O(log n): the heap is keyed by stock level and uses lazy
+    deletion (entries carry the product's version), and severity counts are
+    maintained incrementally so summaries never scan the catalog.
+    """
+
+    def __init__(self):
+        self.levels: Dict[str, Dict[str, Any]] = {}  # product_id -> latest alert_info
+        self._versions: Dict[str, int] = {}
+        self._heap: List[Tuple[int, int, str]] = []  # (stock, version, product_id) for low-stock products
+        self._live_low = 0
+        self.severity_counts = {'critical': 0, 'warning': 0, 'normal': 0}
+
+    def update(self, alert_info: Dict[str, Any]) -> Optional[str]:
+        """Record a product's latest stock level; returns its previous severity"""
+        product_id = alert_info['product_id']
+        previous = self.levels.get(product_id)
+        previous_severity = previous['severity'] if previous else None
+        if previous is not None:
+            self.severity_counts[previous_severity] -= 1
+            if previous['alert_needed']:
+                self._live_low -= 1
+
+        version = self._versions.get(product_id, 0) + 1
+        self._versions[product_id] = version
+        self.levels[product_id] = alert_info
+        self.severity_counts[alert_info['severity']] += 1
+
+        if alert_info['alert_needed']:
+            self._live_low += 1
+            heapq.heappush(self._heap, (alert_info['current_stock'], version, product_id))
+        self._maybe_compact()
+        return previous_severity
+
+    def remove(self, product_id: str):
+        """Stop tracking a product (e.g. when it is deactivated)"""
+        previous = self.levels.pop(product_id, None)
+        if previous is None:
+            return
+        self.severity_counts[previous['severity']] -= 1
+        if previous['alert_needed']:
+            self._live_low -= 1
+        self._versions[product_id] = self._versions.get(product_id, 0) + 1
+        self._maybe_compact()
+
+    def _is_live(self, entry: Tuple[int, int, str]) -> bool:
+        return self._versions.get(entry[2]) == entry[1] and entry[2] in self.levels
+
+    def _maybe_compact(self):
+        # Rebuild once stale entries outnumber live ones so the heap stays O(low-stock products)
+        if len(self._heap) > 2 * self._live_low + 64:
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+
+    def low_stock(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Products at or below threshold, lowest stock first"""
+        live = [entry for entry in self._heap if self._is_live(entry)]
+        entries = heapq.nsmallest(limit, live) if limit is not None else sorted(live)
+        return [self.levels[product_id] for _, _, product_id in entries]
+
+    def __len__(self):
+        return len(self.levels)
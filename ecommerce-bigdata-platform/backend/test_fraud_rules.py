@@ -0,0 +1,218 @@
+import json
+import os
+
+import pytest
+
+from analytics_state import InMemoryStateBackend
+from fraud_rules import DEFAULT_RULES_PATH, FraudContext, FraudRuleEngine, compile_rules
+
+NOW = 1_700_000_000.0
+
+
+def load_default_config():
+    with open(DEFAULT_RULES_PATH) as f:
+        return json.load(f)
+
+
+def make_engine(tmp_path, config=None):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps(config or load_default_config()))
+    # A huge interval keeps evaluate() from reloading behind the test's back
+    return FraudRuleEngine(str(path), reload_interval=1e9), path
+
+
+def evaluate(engine, state, customer_id='c1', amount=10.0, ip_address='1.1.1.1', device_id='d1',
+             profile=None, ts=NOW):
+    ctx = FraudContext(state, customer_id, amount, ip_address, device_id,
+                       ts, ts - 3600, ts - 24 * 3600, None, profile)
+    return engine.evaluate(ctx)
+
+
+def record(state, customer_id='c1', amount=10.0, ip_address='1.1.1.1', device_id='d1', ts=NOW - 60):
+    txn = {'customer_id': customer_id, 'amount': amount, 'ip_address': ip_address, 'device_id': device_id}
+    state.append('customer', customer_id, ts, txn)
+    state.append('ip', ip_address, ts, txn)
+    state.append('device', device_id, ts, txn)
+
+
+def fired_rules(engine):
+    return {name for name, metrics in engine.rule_metrics.items() if metrics.fired}
+
+
+def test_default_rules_compile():
+    plan = compile_rules(load_default_config())
+    assert [rule.name for rule in plan.rules][0] == 'high_frequency'
+    # Shared windows are computed once, after their dependencies
+    names = [name for name, _, _ in plan.steps]
+    assert len(names) == len(set(names))
+    assert names.index('customer_window') < names.index('customer_window_1h') < names.index('customer_txn_count_1h')
+
+
+@pytest.mark.parametrize('config, error', [
+    ([], 'must be an object'),
+    ({'thresholds': {'limit': '5'}}, "'limit' must be a number"),
+    ({'decision': {'block_above': None}}, "'block_above' must be a number"),
+    ({'rules': [{'when': [['amount', '>', 1]]}]}, 'without a name'),
+    ({'rules': [{'name': 'r', 'when': ['amount', '>', 1]}]}, 'condition must be'),
+    ({'rules': [{'name': 'r', 'when': 'amount > 1'}]}, "'when' must be a list"),
+    ({'rules': [{'name': 'r', 'when': []}]}, 'no conditions'),
+    ({'rules': [{'name': 'r', 'when': [['nope', '>', 1]]}]}, "unknown signal 'nope'"),
+    ({'rules': [{'name': 'r', 'when': [['amount', '=>', 1]]}]}, "unknown operator '=>'"),
+    ({'rules': [{'name': 'r', 'when': [['amount', '>', 'missing']]}]}, "unknown threshold 'missing'"),
+    ({'rules': [{'name': 'r', 'when': [['amount', '>', None]]}]}, 'number or threshold name'),
+    ({'rules': [{'name': 'r', 'when': [['amount', '>', 1]], 'weight': True}]}, 'weight must be a number'),
+    ({'rules': [{'name': 'r', 'when': [['amount', '>', 1]], 'message': 5}]}, 'message must be a string'),
+    ({'rules': [{'name': 'r', 'when': [['amount', '>', 1]], 'message': '{nope}'}]}, "unknown signal '{nope}'"),
+    ({'rules': [{'name': 'r', 'when': [['amount', '>', 1]], 'message': '{amount'}]}, 'bad message format'),
+])
+def test_compile_rejects_invalid_config(config, error):
+    with pytest.raises(ValueError) as excinfo:
+        compile_rules(config)
+    assert error in str(excinfo.value)
+
+
+def test_message_placeholders_are_computed():
+    plan = compile_rules({'rules': [{'name': 'r', 'when': [['amount', '>', 1]],
+                                     'message': 'seen {customer_txn_count_1h}'}]})
+    assert 'customer_txn_count_1h' in [name for name, _, _ in plan.steps]
+
+
+def test_invalid_reload_keeps_previous_plan(tmp_path):
+    engine, path = make_engine(tmp_path)
+    plan = engine.plan
+    assert engine.version == 1
+
+    path.write_text('{"rules": [')  # Truncated JSON
+    assert engine.reload() is False
+    assert engine.plan is plan and engine.version == 1
+    assert engine.last_error.startswith('JSONDecodeError')
+
+    path.write_text(json.dumps({'thresholds': {'x': 'high'}}))
+    assert engine.reload() is False
+    assert engine.plan is plan
+    assert engine.last_error.startswith('ValueError')
+
+    config = load_default_config()
+    config['rules'] = config['rules'][:1]
+    path.write_text(json.dumps(config))
+    assert engine.reload() is True
+    assert engine.version == 2 and engine.last_error is None
+    assert [rule.name for rule in engine.plan.rules] == ['high_frequency']
+    assert list(engine.rule_metrics) == ['high_frequency']
+
+
+def test_invalid_initial_rules_raise(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text('[]')
+    with pytest.raises(ValueError):
+        FraudRuleEngine(str(path))
+
+
+def test_maybe_reload_picks_up_changed_file(tmp_path):
+    engine, path = make_engine(tmp_path)
+    engine.reload_interval = 0
+    config = load_default_config()
+    config['thresholds']['suspicious_amount'] = 50.0
+    path.write_text(json.dumps(config))
+    os.utime(path, (NOW, NOW))
+    engine.maybe_reload()
+    assert engine.version == 2
+    assert engine.plan.thresholds['suspicious_amount'] == 50.0
+
+
+def test_quiet_transaction_fires_nothing(tmp_path):
+    engine, _ = make_engine(tmp_path)
+    risk_score, risk_factors, _ = evaluate(engine, InMemoryStateBackend(), profile={'order_count': 3})
+    assert risk_score == 0.0 and risk_factors == []
+
+
+def test_suspicious_amount(tmp_path):
+    engine, _ = make_engine(tmp_path)
+    _, risk_factors, _ = evaluate(engine, InMemoryStateBackend(), amount=600.0, profile={'order_count': 3})
+    assert fired_rules(engine) == {'suspicious_amount'}
+    assert risk_factors == ['Suspicious amount: $600.00']
+
+
+def test_new_customer_high_amount_uses_profile(tmp_path):
+    engine, _ = make_engine(tmp_path)
+    evaluate(engine, InMemoryStateBackend(), amount=300.0)
+    assert fired_rules(engine) == {'new_customer_high_amount'}
+
+    engine, _ = make_engine(tmp_path)
+    evaluate(engine, InMemoryStateBackend(), amount=300.0, profile={'order_count': 1})
+    assert fired_rules(engine) == set()
+
+
+def test_high_frequency_and_amount_per_hour(tmp_path):
+    engine, _ = make_engine(tmp_path)
+    state = InMemoryStateBackend()
+    for i in range(5):
+        # Distinct IPs and devices keep the reuse rules out of it
+        record(state, amount=250.0, ip_address=f'10.0.0.{i}', device_id=f'd{i}', ts=NOW - 600 + i)
+    _, risk_factors, values = evaluate(engine, state, amount=100.0, ip_address='10.0.0.0', device_id='d0')
+    assert {'high_frequency', 'high_amount_per_hour'} <= fired_rules(engine)
+    assert values['customer_amount_1h'] == 1350.0
+    assert 'High transaction frequency: 5 in 1 hour' in risk_factors
+
+
+def test_transactions_outside_the_hour_are_ignored(tmp_path):
+    engine, _ = make_engine(tmp_path)
+    state = InMemoryStateBackend()
+    for i in range(5):
+        record(state, ts=NOW - 2 * 3600 + i)
+    _, _, values = evaluate(engine, state)
+    assert values['customer_txn_count_1h'] == 0
+    assert values['customer_known_orders'] == 5  # Still inside the 24h window
+    assert 'high_frequency' not in fired_rules(engine)
+
+
+def test_ip_and_device_reuse(tmp_path):
+    engine, _ = make_engine(tmp_path)
+    state = InMemoryStateBackend()
+    for i in range(3):
+        record(state, customer_id='c1', ip_address='9.9.9.9', device_id='shared', ts=NOW - 100 + i)
+    evaluate(engine, state, customer_id='c1', ip_address='9.9.9.9', device_id='shared',
+             profile={'order_count': 3})
+    assert fired_rules(engine) == {'ip_reuse', 'device_reuse'}
+
+
+def test_distinct_rules_count_from_shared_state(tmp_path):
+    # Regression: distinct IPs/customers used to come from per-process sketches,
+    # so a worker missed transactions another worker recorded in the shared state
+    engine, _ = make_engine(tmp_path)
+    state = InMemoryStateBackend()
+    for i in range(4):
+        record(state, customer_id='rotator', ip_address=f'10.1.0.{i}', device_id=f'dev{i}', ts=NOW - 100 + i)
+    for i in range(2):
+        record(state, customer_id=f'other{i}', ip_address=f'10.2.0.{i}', device_id='kiosk', ts=NOW - 50 + i)
+
+    _, _, values = evaluate(engine, state, customer_id='rotator', ip_address='10.1.0.9', device_id='kiosk',
+                            profile={'order_count': 3})
+    assert values['customer_distinct_ips_1h'] == 5
+    assert values['device_distinct_customers_1h'] == 3
+    assert {'customer_ip_rotation', 'shared_device'} <= fired_rules(engine)
+    # No sketches in the context: the advisory signals just don't apply
+    assert values.get('customer_distinct_ips_1h_approx') is None
+
+
+def test_unformattable_message_falls_back_to_rule_name(tmp_path):
+    # Regression: a None placeholder outside the conditions broke evaluate()
+    engine, _ = make_engine(tmp_path, {'rules': [{'name': 'big', 'when': [['amount', '>', 1]], 'weight': 0.5,
+                                                  'message': 'lifetime ${customer_lifetime_spend:.2f}'}]})
+    risk_score, risk_factors, _ = evaluate(engine, InMemoryStateBackend(), amount=5.0)
+    assert risk_score == 0.5
+    assert risk_factors == ['big']
+
+
+@pytest.mark.parametrize('risk_score, recommendation, fraudulent', [
+    (0.0, 'ALLOW', False),
+    (0.6, 'REVIEW', False),
+    (0.75, 'REVIEW', True),
+    (1.4, 'BLOCK', True),
+])
+def test_recommendation(tmp_path, risk_score, recommendation, fraudulent):
+    engine, _ = make_engine(tmp_path)
+    verdict = engine.recommendation(risk_score)
+    assert verdict['recommendation'] == recommendation
+    assert verdict['is_fraudulent'] is fraudulent
+    assert verdict['risk_score'] == min(risk_score, 1.0)
@@ -0,0 +1,211 @@
+import asyncio
+import time
+
+import pytest
+
+from alert_coalescer import DIGESTED, SEND, SUPPRESSED, AlertCoalescer
+from email_templates import get_digest_template, get_template
+from notification_dispatcher import NotificationDispatcher
+from notifications import NotificationService
+from webhook_client import CircuitBreaker, WebhookClient
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.is_success = 200 <= status_code < 300
+
+
+class FakeHTTPClient:
+    """Stands in for the pooled httpx client; `handler(url, json)` decides each response"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = 0
+
+    async def post(self, url, json):
+        self.calls += 1
+        return await self.handler(url, json)
+
+    async def aclose(self):
+        pass
+
+
+def webhook_client(handler, **options):
+    client = WebhookClient(max_retries=0, **options)
+    client._client = FakeHTTPClient(handler)
+    client._loop = asyncio.get_running_loop()
+    client._semaphore = asyncio.Semaphore(client.concurrency)
+    return client
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record(False)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    assert breaker.state == 'open' and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == 'half_open'
+    assert breaker.allow() is True
+    assert breaker.allow() is False  # Only one trial at a time
+    breaker.record(True)
+    assert breaker.state == 'closed' and breaker.allow()
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record(False)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == 'open'
+
+
+def test_cancelled_trial_releases_breaker():
+    # Regression: a half-open trial cancelled mid-request was never released,
+    # so the endpoint stayed short-circuited forever
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang(url, json):
+            started.set()
+            await asyncio.sleep(10)
+
+        client = webhook_client(hang, failure_threshold=1, reset_timeout=0.01)
+        breaker = client._breaker('http://hooks.test/a')
+        breaker.record(False)
+        await asyncio.sleep(0.02)
+
+        task = asyncio.create_task(client.post('http://hooks.test/a', {}))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert breaker.trial_in_flight is False
+        assert breaker.allow() is True
+
+    asyncio.run(scenario())
+
+
+def test_webhook_retries_only_transient_statuses():
+    async def scenario():
+        statuses = iter([503, 200])
+
+        async def respond(url, json):
+            return Response(next(statuses))
+
+        client = webhook_client(respond, backoff=0.001)
+        client.max_retries = 2
+        assert await client.post('http://hooks.test/a', {}) is True
+        assert client.stats['retried'] == 1
+
+        async def reject(url, json):
+            return Response(400)
+
+        client = webhook_client(reject, backoff=0.001)
+        client.max_retries = 2
+        assert await client.post('http://hooks.test/a', {}) is False
+        assert client._client.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_dispatcher_does_not_retry_jobs_that_retry_themselves():
+    async def scenario():
+        dispatcher = NotificationDispatcher(workers=1, queue_size=10, max_retries=3, backoff=0.001)
+        dispatcher.start()
+        calls = {'email': 0, 'webhook': 0}
+
+        def send_email():
+            calls['email'] += 1
+            return False
+
+        async def send_webhook():
+            calls['webhook'] += 1
+            return False
+
+        dispatcher.submit(send_email, description='email')
+        dispatcher.submit(send_webhook, description='webhook', retry=False)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if dispatcher.stats['failed'] == 2:
+                break
+        await dispatcher.stop(timeout=1)
+        return calls, dispatcher.stats
+
+    calls, stats = asyncio.run(scenario())
+    assert calls == {'email': 4, 'webhook': 1}
+    assert stats['failed'] == 2 and stats['retried'] == 3
+
+
+def test_coalescer_sends_digests_and_suppresses_duplicates():
+    async def scenario():
+        digests = []
+        coalescer = AlertCoalescer(lambda kind, alerts, overflow: digests.append((kind, alerts, overflow)),
+                                   window=0.05, max_digest_items=2)
+        decisions = [
+            coalescer.offer('stock', 'p1', {'id': 1}),
+            coalescer.offer('stock', 'p1', {'id': 1}),
+            coalescer.offer('stock', 'p2', {'id': 2}),
+            coalescer.offer('stock', 'p3', {'id': 3}),
+            coalescer.offer('stock', 'p4', {'id': 4}),
+        ]
+        await asyncio.sleep(0.1)
+        return decisions, digests, coalescer.get_stats()
+
+    decisions, digests, stats = asyncio.run(scenario())
+    assert decisions == [SEND, SUPPRESSED, DIGESTED, DIGESTED, DIGESTED]
+    assert digests == [('stock', [{'id': 2}, {'id': 3}], 1)]
+    assert stats['digests_sent'] == 1 and stats['held'] == 0
+
+
+def test_coalescer_disabled_window_always_sends():
+    coalescer = AlertCoalescer(lambda *args: None, window=0)
+    assert [coalescer.offer('fraud', 'c1', {}) for _ in range(3)] == [SEND, SEND, SEND]
+
+
+def make_service():
+    service = NotificationService()
+    sent = []
+    service.queue_email = lambda *email: sent.append(('email', email))
+    service.queue_webhook = lambda payload: sent.append(('webhook', payload))
+    return service, sent
+
+
+def test_fraud_alerts_are_keyed_per_transaction():
+    # Regression: a second, riskier transaction from the same customer was dropped
+    async def scenario():
+        service, sent = make_service()
+        service.notify_fraud_alert('t1', 'c1', 20.0, 'velocity', 0.75)
+        service.notify_fraud_alert('t2', 'c1', 5000.0, 'amount', 0.99)
+        service.notify_fraud_alert('t2', 'c1', 5000.0, 'amount', 0.99)  # Same transaction re-checked
+        stats = service.coalescer.get_stats()
+        service.flush()
+        return sent, stats
+
+    sent, stats = asyncio.run(scenario())
+    assert stats['sent'] == 1 and stats['digested'] == 1 and stats['suppressed'] == 1
+    digest = sent[-1][1]
+    assert digest['type'] == 'fraud_alert_digest'
+    assert [alert['transaction_id'] for alert in digest['alerts']] == ['t2']
+
+
+def test_digest_html_is_escaped():
+    alert = {'transaction_id': 't<1>', 'customer_id': 'c&1', 'amount': 10.0, 'risk_score': 0.9,
+             'reason': '<script>alert(1)</script>'}
+    email = get_digest_template('fraud_alert_digest').render([alert], overflow=2)
+    assert email.subject == '🚨 Fraud Digest: 3 flagged transactions'
+    assert '<script>' not in email.html
+    assert '&lt;script&gt;alert(1)&lt;/script&gt;' in email.html
+    assert 't&lt;1&gt;' in email.html and 'c&amp;1' in email.html
+    assert '<td colspan="5">...and 2 more</td>' in email.html
+    assert '<script>alert(1)</script>' in email.text  # Plain text is not HTML
+
+
+def test_alert_template_is_escaped():
+    email = get_template('stock_alert').render({'product_id': 'p1', 'product_name': '<b>Mug</b>',
+                                                'current_stock': 2, 'threshold': 10})
+    assert email.subject == '🚨 Low Stock Alert: <b>Mug</b>'
+    assert '&lt;b&gt;Mug&lt;/b&gt;' in email.html
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from analytics_state import InMemoryStateBackend, SQLiteStateBackend
+from fraud_rules import FraudRuleEngine
+from realtime_analytics import RealTimeAnalytics, utc_timestamp
+
+START = datetime(2024, 1, 15, 12, 0, 0)
+
+
+class ManualClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_analytics(state=None, clock=None):
+    return RealTimeAnalytics(state_backend=state or InMemoryStateBackend(),
+                             rule_engine=FraudRuleEngine(reload_interval=1e9), clock=clock)
+
+
+def transaction(customer_id, when, amount=20.0, ip_address='1.1.1.1', device_id='d1', **extra):
+    return {'customer_id': customer_id, 'amount': amount, 'ip_address': ip_address,
+            'device_id': device_id, 'timestamp': when.isoformat(), **extra}
+
+
+@pytest.mark.parametrize('tz', ['UTC', 'Asia/Kolkata', 'America/New_York'])
+def test_naive_timestamps_are_utc(tz):
+    # Regression: naive datetimes were read as host local time
+    previous = os.environ.get('TZ')
+    os.environ['TZ'] = tz
+    time.tzset()
+    try:
+        assert utc_timestamp(START) == START.replace(tzinfo=timezone.utc).timestamp()
+        aware = datetime(2024, 1, 15, 17, 30, tzinfo=timezone(timedelta(hours=5, minutes=30)))
+        assert utc_timestamp(aware) == utc_timestamp(START)
+    finally:
+        if previous is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = previous
+        time.tzset()
+
+
+def test_replay_with_event_clock_keeps_historical_windows():
+    # Regression: with the wall clock, a replay of old transactions pruned each
+    # one as soon as it was stored, so velocity rules never fired
+    clock = ManualClock(utc_timestamp(START))
+    analytics = make_analytics(clock=clock)
+    results = []
+    for i in range(7):
+        when = START + timedelta(minutes=i)
+        clock.now = utc_timestamp(when)
+        results.append(analytics.analyze_transaction_fraud(
+            transaction('c1', when, ip_address=f'10.0.0.{i}', device_id=f'd{i}'), {'order_count': 3}))
+    assert results[0]['recommendation'] == 'ALLOW'
+    assert 'High transaction frequency: 5 in 1 hour' in results[5]['risk_factors']
+    assert analytics.state.count_keys('customer') == 1
+
+    summary = analytics.get_fraud_summary()
+    assert summary['verdicts_last_hour'] == summary['verdicts_last_24h']
+    assert sum(summary['verdicts_last_hour'].values()) == 7
+
+
+def test_wall_clock_drops_historical_transactions():
+    analytics = make_analytics()
+    for i in range(6):
+        analytics.analyze_transaction_fraud(transaction('c1', START + timedelta(minutes=i)), {'order_count': 3})
+    analytics._last_prune = float('-inf')
+    analytics._cleanup_old_transactions()
+    assert analytics.state.count_keys('customer') == 0
+
+
+def test_prune_runs_at_most_once_per_interval():
+    clock = ManualClock(utc_timestamp(START))
+    analytics = make_analytics(clock=clock)
+    analytics.prune_interval = 60
+    pruned = []
+    prune = analytics.state.prune
+    analytics.state.prune = lambda cutoff: (pruned.append(cutoff), prune(cutoff))
+    for i in range(10):
+        clock.now = utc_timestamp(START) + i * 15
+        analytics.analyze_transaction_fraud(transaction('c1', START + timedelta(seconds=i * 15)))
+    assert len(pruned) == 3  # t=0, 60 and 120
+
+
+def test_in_memory_prune_drops_only_expired_records():
+    state = InMemoryStateBackend()
+    # Out of order, as replayed or delayed events arrive
+    for ts in (10, 5, 20, 1):
+        state.append('customer', 'a', ts, {'ts': ts})
+    state.append('ip', 'x', 3, {'ts': 3})
+    state.append('device', 'd', 30, {'ts': 30})
+
+    state.prune(5)
+    assert [ts for ts, _ in state.fetch('customer', 'a', 0)] == [10, 20]
+    assert state.count_keys('ip') == 0
+    assert state.count_keys('device') == 1
+
+    state.prune(25)
+    assert state.count_keys('customer') == 0
+    assert state.fetch('device', 'd', 0) == [(30, {'ts': 30})]
+    state.prune(100)
+    assert all(state.count_keys(kind) == 0 for kind in ('customer', 'ip', 'device'))
+
+
+def test_sqlite_backend_is_shared_and_counts_keys_on_prune(tmp_path):
+    path = str(tmp_path / 'state.db')
+    first, second = SQLiteStateBackend(path), SQLiteStateBackend(path)
+    with first.transaction():
+        first.append('customer', 'a', 10, {'amount': 1})
+        first.append('customer', 'b', 50, {'amount': 2})
+    assert second.fetch('customer', 'a', 0) == [(10, {'amount': 1})]
+
+    assert second.count_keys('customer') == 0  # Counted as of the last prune
+    second.prune(20)
+    assert second.count_keys('customer') == 1
+    assert first.fetch('customer', 'a', 0) == []
+
+
+def test_sqlite_checks_run_off_the_event_loop(tmp_path):
+    analytics = make_analytics(state=SQLiteStateBackend(str(tmp_path / 'state.db')))
+    events = []
+    analytics.add_listener(lambda event_type, data: events.append((event_type, asyncio.get_running_loop())))
+
+    async def check():
+        result = await analytics.analyze_transaction_fraud_async(transaction('c1', START), {'order_count': 3})
+        return result, asyncio.get_running_loop()
+
+    try:
+        result, loop = asyncio.run(check())
+    finally:
+        analytics.close()
+    assert result['recommendation'] == 'ALLOW'
+    # Listeners publish to the loop's event broker, so they run back on the loop
+    assert events == [('fraud_verdict', loop)]
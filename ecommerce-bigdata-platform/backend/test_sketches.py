@@ -0,0 +1,61 @@
+from sketches import CountMinSketch, FraudSketches, HyperLogLog, WindowedCountMin, WindowedDistinctCounter
+
+NOW = 1_700_000_000.0
+
+
+def test_count_min_never_underestimates():
+    sketch = CountMinSketch(epsilon=0.01, delta=0.01)
+    for i in range(2000):
+        sketch.add(f'ip-{i % 200}')
+    sketch.add('hot', 500)
+    assert sketch.estimate('hot') >= 500
+    assert sketch.estimate('hot') <= 500 + 0.01 * 2500
+    assert all(sketch.estimate(f'ip-{i}') >= 10 for i in range(200))
+
+
+def test_hyperloglog_error_bound_and_merge():
+    first, second = HyperLogLog(12), HyperLogLog(12)
+    for i in range(5000):
+        first.add(f'a{i}')
+        second.add(f'b{i}')
+    assert abs(first.count() - 5000) < 5000 * 0.05
+    first.merge(second)
+    assert abs(first.count() - 10000) < 10000 * 0.05
+    small = HyperLogLog(10)
+    for value in ('x', 'y', 'z', 'x'):
+        small.add(value)
+    assert small.count() == 3
+
+
+def test_windowed_count_min_forgets_old_buckets():
+    counts = WindowedCountMin(window_seconds=3600, buckets=6)
+    for i in range(4):
+        counts.add('ip', NOW + i)
+    assert counts.estimate('ip', NOW + 10) == 4
+    assert counts.estimate('ip', NOW + 3600 + 700) == 0
+    counts.add('ip', NOW + 7200)
+    counts.add('ip', NOW)  # Older than the window the slot now covers: ignored
+    assert counts.estimate('ip', NOW + 7200) == 1
+
+
+def test_windowed_distinct_counter_caps_keys():
+    distinct = WindowedDistinctCounter(window_seconds=3600, max_keys=2)
+    for ip in ('1', '2', '3', '2'):
+        distinct.add('c1', ip, NOW)
+    assert distinct.count('c1', NOW) == 3
+    assert distinct.count('c1', NOW, include='4') == 4
+    distinct.add('c2', '1', NOW)
+    distinct.add('c3', '1', NOW)
+    assert list(distinct.keys) == ['c2', 'c3']  # Least recently updated evicted
+    assert distinct.count('c1', NOW) == 0
+
+
+def test_fraud_sketches_record():
+    sketches = FraudSketches(epsilon=0.01, delta=0.01, error=0.05, max_keys=10)
+    sketches.record('c1', '1.1.1.1', 'd1', NOW)
+    sketches.record('c2', '1.1.1.1', 'd1', NOW + 1)
+    sketches.record(None, '2.2.2.2', '', NOW + 2)
+    assert sketches.ip_counts.estimate('1.1.1.1', NOW + 2) == 2
+    assert sketches.device_customers.count('d1', NOW + 2) == 2
+    stats = sketches.get_stats()
+    assert stats['customers_tracked'] == 2 and stats['devices_tracked'] == 1
@@ -0,0 +1,50 @@
+import pytest
+
+from stock_index import StockIndex, severity_escalated, stock_severity
+
+
+def alert(product_id, current_stock, threshold=10):
+    return {'product_id': product_id, 'product_name': product_id, 'current_stock': current_stock,
+            'threshold': threshold, 'severity': stock_severity(current_stock, threshold),
+            'alert_needed': current_stock <= threshold}
+
+
+@pytest.mark.parametrize('stock, threshold, severity', [
+    (0, 10, 'critical'), (5, 10, 'critical'), (6, 10, 'warning'), (10, 10, 'warning'), (11, 10, 'normal'),
+])
+def test_stock_severity(stock, threshold, severity):
+    assert stock_severity(stock, threshold) == severity
+
+
+def test_severity_escalated():
+    assert severity_escalated(None, 'warning')
+    assert severity_escalated('warning', 'critical')
+    assert not severity_escalated('critical', 'warning')
+    assert not severity_escalated(None, 'normal')
+
+
+def test_low_stock_ordering_and_counts():
+    index = StockIndex()
+    assert index.update(alert('a', 8)) is None
+    index.update(alert('b', 2))
+    index.update(alert('c', 50))
+    assert [item['product_id'] for item in index.low_stock()] == ['b', 'a']
+    assert index.severity_counts == {'critical': 1, 'warning': 1, 'normal': 1}
+
+    assert index.update(alert('a', 1)) == 'warning'
+    assert [item['product_id'] for item in index.low_stock(1)] == ['a']
+    index.update(alert('b', 40))  # Restocked
+    assert [item['product_id'] for item in index.low_stock()] == ['a']
+    assert index.severity_counts == {'critical': 1, 'warning': 0, 'normal': 2}
+
+    index.remove('a')
+    index.remove('missing')
+    assert index.low_stock() == [] and len(index) == 2
+
+
+def test_stale_heap_entries_are_compacted():
+    index = StockIndex()
+    for stock in range(500):
+        index.update(alert('a', stock % 10))
+    assert len(index._heap) <= 2 * 1 + 64 + 1
+    assert [item['current_stock'] for item in index.low_stock()] == [9]
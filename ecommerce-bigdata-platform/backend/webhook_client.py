@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying; any other non-2xx response is a permanent failure
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker: opens after consecutive failures, lets one trial through after reset_timeout"""
+
+    __slots__ = ('failure_threshold', 'reset_timeout', 'failures', 'opened_at', 'trial_in_flight')
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def release(self):
+        """End a trial without a verdict (e.g. the request was cancelled)"""
+        self.trial_in_flight = False
+
+    def record(self, success: bool):
+        self.trial_in_flight = False
+        if success:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class WebhookClient:
+    """Async webhook delivery over a shared keep-alive connection pool.
+
+    Requests to an endpoint reuse pooled connections, at most `concurrency`
+    are in flight at once, transient failures are retried with full-jitter
+    backoff, and a circuit breaker per endpoint stops hammering a receiver
+    that keeps failing. With batch_size > 1, notifications for the same URL
+    are buffered for up to batch_window seconds and posted as one body.
+    """
+
+    def __init__(self, max_connections: Optional[int] = None, concurrency: Optional[int] = None,
+                 timeout: Optional[float] = None, max_retries: Optional[int] = None,
+                 backoff: Optional[float] = None, failure_threshold: Optional[int] = None,
+                 reset_timeout: Optional[float] = None, batch_size: Optional[int] = None,
+                 batch_window: Optional[float] = None):
+        self.max_connections = max_connections or int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '20'))
+        self.concurrency = concurrency or int(os.getenv('WEBHOOK_CONCURRENCY', '10'))
+        self.timeout = timeout or float(os.getenv('WEBHOOK_TIMEOUT_SECONDS', '10'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('WEBHOOK_MAX_RETRIES', '2'))
+        self.backoff = backoff or float(os.getenv('WEBHOOK_RETRY_BACKOFF_SECONDS', '0.5'))
+        self.failure_threshold = failure_threshold or int(os.getenv('WEBHOOK_BREAKER_FAILURES', '5'))
+        self.reset_timeout = reset_timeout or float(os.getenv('WEBHOOK_BREAKER_RESET_SECONDS', '30'))
+        self.batch_size = batch_size or int(os.getenv('WEBHOOK_BATCH_SIZE', '1'))
+        self.batch_window = batch_window or float(os.getenv('WEBHOOK_BATCH_WINDOW_SECONDS', '0.2'))
+        self._client: Optional['httpx.AsyncClient'] = None
+        self._loop = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._batches: Dict[str, List[Dict[str, Any]]] = {}
+        self._batch_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._flushes = set()
+        self.stats = {'requests': 0, 'delivered': 0, 'retried': 0, 'failed': 0, 'short_circuited': 0,
+                      'batches': 0, 'dropped': 0}
+
+    def _ensure_client(self):
+        # The client and semaphore belong to the loop they were created on
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                headers={'Content-Type': 'application/json'}
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        endpoint = urlsplit(url).netloc
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    async def post(self, url: str, payload: Dict[str, Any]) -> bool:
+        """POST one JSON body with retries; returns True on a 2xx response"""
+        self._ensure_client()
+        breaker = self._breaker(url)
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                self.stats['short_circuited'] += 1
+                return False
+            retryable = True
+            try:
+                async with self._semaphore:
+                    self.stats['requests'] += 1
+                    response = await self._client.post(url, json=payload)
+                if response.is_success:
+                    breaker.record(True)
+                    self.stats['delivered'] += 1
+                    return True
+                retryable = response.status_code in RETRY_STATUSES
+                logger.warning("❌ Webhook failed with status %d", response.status_code)
+            except Exception as e:
+                logger.warning("❌ Webhook request error: %r", e)
+            finally:
+                # CancelledError skips the handlers above; a half-open trial that
+                # is never released would short-circuit this endpoint forever
+                breaker.release()
+            breaker.record(False)
+            if not retryable or attempt == self.max_retries:
+                break
+            self.stats['retried'] += 1
+            await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+        self.stats['failed'] += 1
+        return False
+
+    async def send(self, url: str, payload: Dict[str, Any]) -> bool:
+        """Deliver a notification, batching it with others for the same URL when enabled"""
+        if self.batch_size <= 1:
+            return await self.post(url, payload)
+        self._ensure_client()
+        batch = self._batches.setdefault(url, [])
+        batch.append(payload)
+        if len(batch) >= self.batch_size:
+            self._flush_batch(url)
+        elif url not in self._batch_timers:
+            self._batch_timers[url] = self._loop.call_later(self.batch_window, self._flush_batch, url)
+        # Accepted; delivery failures of batched notifications are counted, not retried by the caller
+        return True
+
+    def _flush_batch(self, url: str):
+        timer = self._batch_timers.pop(url, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._batches.pop(url, None)
+        if not batch:
+            return
+        if len(self._flushes) >= self.concurrency * 10:
+            # The receiver is not keeping up; don't let pending batches grow without bound
+            self.stats['dropped'] += len(batch)
+            logger.warning("⚠️ Webhook backlog full, dropping batch of %d", len(batch))
+            return
+        self.stats['batches'] += 1
+        task = self._loop.create_task(self.post(url, {'type': 'batch', 'count': len(batch), 'notifications': batch}))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def close(self):
+        """Flush buffered batches and close pooled connections"""
+        for url in list(self._batches):
+            self._flush_batch(url)
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'breakers': {endpoint: breaker.state for endpoint, breaker in self._breakers.items()},
+            'buffered': sum(len(batch) for batch in self._batches.values()),
+            'batch_size': self.batch_size,
+        }
+
+
+# Global webhook client instance
+webhook_client = WebhookClient()